@@ -0,0 +1,125 @@
+"""數據庫連接配置
+
+SQLALCHEMY_DATABASE_URI（或DATABASE_URL）選擇數據庫，留空使用
+backend/src/database/app.db；支持SQLite和PostgreSQL（psycopg2驅動）。
+
+DATABASE_PROFILE選擇連接配置：
+- default：SQLAlchemy和SQLite的默認設置（回滾日誌、synchronous=FULL、默認連接池）
+- production：SQLite使用WAL日誌，讀不再被寫阻塞，寫只在提交時短暫加鎖；
+  synchronous=NORMAL（WAL下斷電只可能丟失最後幾個事務，不會損壞數據庫）、
+  加大頁緩存、開啟mmap、設置busy_timeout讓並發寫排隊等待而不是直接報
+  "database is locked"，並按多線程（請求線程、後台任務、用量計量、webhook隊列）
+  調大連接池。PostgreSQL使用應用內連接池（pool_pre_ping、定期回收連接）並在
+  連接上設置statement_timeout；連接由PgBouncer等服務端連接池管理時設置
+  DB_EXTERNAL_POOL=true，應用不再保留連接，statement_timeout改在數據庫角色上配置
+  （PgBouncer不接受options啟動參數）。
+"""
+import os
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import NullPool
+
+DATABASE_PROFILES = ('default', 'production')
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), 'database', 'app.db')
+
+
+def database_uri() -> str:
+    uri = os.getenv('SQLALCHEMY_DATABASE_URI') or os.getenv('DATABASE_URL')
+    if not uri:
+        return f"sqlite:///{DEFAULT_SQLITE_PATH}"
+    # Heroku等平台給出的postgres://前綴SQLAlchemy不再接受
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def database_profile() -> str:
+    profile = os.getenv('DATABASE_PROFILE', 'production').lower()
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE: {profile} (expected one of {', '.join(DATABASE_PROFILES)})")
+    return profile
+
+
+def sqlite_pragmas(profile: str) -> Dict[str, object]:
+    """每個新連接上執行的PRAGMA"""
+    if profile != 'production':
+        return {}
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        # 負數表示KiB
+        'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_MB', '64')) * 1024,
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE_MB', '256')) * 1024 * 1024,
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'temp_store': 'MEMORY',
+    }
+
+
+def _is_file_database(uri: str) -> bool:
+    url = make_url(uri)
+    return url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:')
+
+
+def _pool_options() -> Dict:
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '30')),
+    }
+
+
+def _postgresql_options() -> Dict:
+    if os.getenv('DB_EXTERNAL_POOL', 'false').lower() == 'true':
+        # 每次借出都向PgBouncer要連接，歸還即關閉，連接復用交給服務端
+        return {'poolclass': NullPool}
+
+    options = _pool_options()
+    options['pool_pre_ping'] = True
+    options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800'))
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+    if statement_timeout > 0:
+        options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def engine_options(profile: str, uri: str) -> Dict:
+    """SQLALCHEMY_ENGINE_OPTIONS；內存SQLite用的是單連接池，不設置池大小"""
+    if profile != 'production':
+        return {}
+    if make_url(uri).get_backend_name() == 'postgresql':
+        return _postgresql_options()
+    if not _is_file_database(uri):
+        return {}
+    return _pool_options()
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: Dict[str, object]):
+    """在引擎的每個新連接上設置PRAGMA；非SQLite引擎不處理"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def configure_database(app, db):
+    """按DATABASE_PROFILE配置Flask應用的數據庫並初始化db"""
+    profile = database_profile()
+    uri = database_uri()
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(profile, uri)
+    app.config['DATABASE_PROFILE'] = profile
+    db.init_app(app)
+
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, sqlite_pragmas(profile))
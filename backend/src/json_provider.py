@@ -0,0 +1,90 @@
+"""API響應的JSON序列化
+
+FastJSONProvider替換Flask默認的JSON提供者：安裝了orjson時用它編碼和解碼，
+沒有安裝時退回標準庫，輸出與Flask默認一致（鍵排序、datetime按HTTP日期格式、
+Decimal轉字符串、調試模式下縮進）。
+
+數據庫裡以JSON文本保存的列（settings、keywords、tags、input_data、output_data）
+可以用raw_json()包裝後直接放進響應：orjson 3.9+用Fragment把文本原樣嵌入，
+不再解碼成Python對象再編碼回去；較舊的orjson和標準庫會先解碼再編碼，結果相同。
+嵌入的文本不再校驗，只用於本應用自己用json.dumps寫入的列。
+"""
+import json
+import os
+from typing import Any, Optional
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """已經編碼好的JSON文本，序列化響應時原樣嵌入"""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def raw_json(text: Optional[str], empty: str = 'null') -> RawJSON:
+    """包裝一個JSON文本列；列為空時使用`empty`（例如'{}'或'[]'）"""
+    return RawJSON(text or empty)
+
+
+def json_column(text: Optional[str], empty: str, raw: bool = False) -> Any:
+    """模型to_dict裡JSON文本列的值：raw時包裝成RawJSON直接進響應，否則解碼成Python對象"""
+    if raw:
+        return raw_json(text, empty)
+    return json.loads(text or empty)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """orjson可用時使用orjson的JSON提供者，支持RawJSON"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.use_orjson = orjson is not None and os.getenv('FAST_JSON_ENABLED', 'true').lower() == 'true'
+        self._fragments = self.use_orjson and hasattr(orjson, 'Fragment')
+
+    def _orjson_default(self, o: Any):
+        if isinstance(o, RawJSON):
+            return orjson.Fragment(o.text) if self._fragments else orjson.loads(o.text)
+        return self.default(o)
+
+    def _stdlib_default(self, o: Any):
+        if isinstance(o, RawJSON):
+            return json.loads(o.text)
+        return self.default(o)
+
+    def _dumps_bytes(self, obj: Any, indent: bool = False) -> bytes:
+        # datetime交給Flask的默認處理（HTTP日期），與標準庫提供者的輸出保持一致
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self._orjson_default, option=option)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if self.use_orjson:
+            return self._dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode()
+        kwargs.setdefault('default', self._stdlib_default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if not self.use_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        # 直接用orjson輸出的bytes作響應體，省去解碼成str再編碼
+        return self._app.response_class(self._dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
@@ -5,17 +5,26 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from src.config import configure_database
+from src.json_provider import FastJSONProvider
 from src.models.user import db
-from src.models.seo import Store, SeoTask, Keyword, Product
+from src.models.migrations import run_migrations
+from src.models.seo import Store, SeoTask, Keyword, Product, AIUsageRecord, AIUsageDaily, WebhookEvent
 from src.services.shopify_blog import BlogArticle
 from src.routes.user import user_bp
 from src.routes.seo import seo_bp
 from src.routes.shopify import shopify_bp
 from src.routes.blog import blog_bp
 from src.routes.shopify_auth import shopify_auth_bp
+from src.services.usage_meter import usage_meter
+from src.services.webhook_queue import webhook_queue
+from src.services.task_queue import task_queue
+from src.services.fair_scheduler import plan_weights
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'ai-seo-master-secret-key-2024'
+# API響應用orjson序列化（未安裝時退回標準庫），JSON文本列可以原樣嵌入
+app.json = FastJSONProvider(app)
 
 # 啟用CORS以支持前端跨域請求
 CORS(app, origins="*")
@@ -27,14 +36,22 @@ app.register_blueprint(shopify_bp, url_prefix='/api/shopify')
 app.register_blueprint(blog_bp, url_prefix='/api/blog')
 app.register_blueprint(shopify_auth_bp)
 
-# 數據庫配置
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+# 數據庫配置（DATABASE_URL選擇SQLite或PostgreSQL，DATABASE_PROFILE選擇PRAGMA和連接池設置，見src/config.py）
+configure_database(app, db)
 
 # 創建數據庫表
 with app.app_context():
     db.create_all()
+    # 已有的數據庫補上後來新增的列和索引
+    run_migrations(db.engine)
+
+# 公平調度器在沒有應用上下文的線程裡按商店套餐查權重
+plan_weights.init_app(app)
+
+# 啟動AI用量計量的後台批量寫入、webhook隊列的後台應用和後台任務工作線程
+usage_meter.start(app)
+webhook_queue.start(app)
+task_queue.start(app)
 
 @app.route('/privacy')
 def privacy_policy():
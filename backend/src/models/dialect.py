@@ -0,0 +1,33 @@
+"""按數據庫方言構造的語句
+
+SQLite（3.24+）和PostgreSQL都支持INSERT ... ON CONFLICT，但SQLAlchemy把它們
+放在各自方言的insert()裡，這裡按引擎的方言名選擇。
+"""
+from typing import Iterable, List
+
+from sqlalchemy import func
+
+
+def dialect_insert(model, dialect_name: str):
+    """支持on_conflict_do_nothing / on_conflict_do_update的INSERT"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"ON CONFLICT is not supported for database dialect: {dialect_name}")
+    return insert(model)
+
+
+def upsert_statement(model, dialect_name: str, index_elements: List[str], update_columns: Iterable[str],
+                     fill_columns: Iterable[str] = ()):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE
+
+    index_elements必須對應一個唯一索引；衝突時update_columns用新值覆蓋，
+    fill_columns只在已有值為空（NULL或空字符串）時寫入新值。
+    """
+    stmt = dialect_insert(model, dialect_name)
+    set_ = {column: getattr(stmt.excluded, column) for column in update_columns}
+    for column in fill_columns:
+        set_[column] = func.coalesce(func.nullif(getattr(model, column), ''), getattr(stmt.excluded, column))
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
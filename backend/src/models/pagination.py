@@ -0,0 +1,73 @@
+"""列表分頁
+
+除了原有的頁碼分頁（OFFSET），列表接口支持按(created_at, id)的鍵集分頁：
+游標記住上一頁最後一行，下一頁從索引上的這個位置繼續往後讀，
+翻到多深都只讀一頁的行。游標對客戶端不透明，只能原樣傳回。
+
+總數是可選的：COUNT(*)要掃描整個商店的行，結果按查詢條件緩存幾十秒。
+"""
+import base64
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+COUNT_CACHE_TTL = float(os.getenv('PAGINATION_COUNT_CACHE_SECONDS', '30'))
+
+_count_cache: Dict[Hashable, Tuple[int, float]] = {}
+_count_cache_lock = threading.Lock()
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游標；格式不對時拋出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(query, model, limit: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """按created_at、id從新到舊取一頁，返回(行, 下一頁游標)；沒有下一頁時游標為None
+
+    created_at為NULL的行不在鍵集分頁的結果裡，新寫入的行都帶有created_at。
+    """
+    query = query.filter(model.created_at.isnot(None))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # 先用created_at <= 游標走索引範圍，再排除同一時刻已經返回過的行
+        query = query.filter(
+            model.created_at <= created_at,
+            or_(model.created_at < created_at, and_(model.created_at == created_at, model.id < row_id))
+        )
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def cached_count(key: Hashable, query) -> int:
+    """query.count()，同一key的結果緩存COUNT_CACHE_TTL秒"""
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        if len(_count_cache) > 10000:
+            _count_cache.clear()
+        _count_cache[key] = (total, now + COUNT_CACHE_TTL)
+    return total
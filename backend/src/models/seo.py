@@ -1,7 +1,15 @@
 from src.models.user import db
+from src.json_provider import json_column
 from datetime import datetime
+import hashlib
 import json
 
+
+def product_fingerprint(title: str, description: str) -> str:
+    """產品源文本（標題和描述）的指紋，用於判斷同步和重新優化是否有必要"""
+    encoded = json.dumps([title or '', description or ''], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
 class Store(db.Model):
     __tablename__ = 'stores'
     
@@ -17,18 +25,23 @@ class Store(db.Model):
     seo_tasks = db.relationship('SeoTask', backref='store', lazy=True)
     keywords = db.relationship('Keyword', backref='store', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, raw_json: bool = False):
         return {
             'id': self.id,
             'shop_domain': self.shop_domain,
             'plan_type': self.plan_type,
-            'settings': json.loads(self.settings) if self.settings else {},
+            'settings': json_column(self.settings, '{}', raw_json),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 class SeoTask(db.Model):
     __tablename__ = 'seo_tasks'
+    __table_args__ = (
+        db.Index('ix_seo_tasks_created', 'created_at'),
+        db.Index('ix_seo_tasks_type_created', 'task_type', 'created_at'),
+        db.Index('ix_seo_tasks_status_store', 'status', 'store_id'),  # 後台任務隊列按狀態認領
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)  # 允許為空用於測試
@@ -40,23 +53,34 @@ class SeoTask(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    # 後台任務的執行信息（見services/task_queue.py）
+    progress_done = db.Column(db.Integer)
+    progress_total = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime)
     
-    def to_dict(self):
+    def to_dict(self, raw_json: bool = False):
         return {
             'id': self.id,
             'store_id': self.store_id,
             'task_type': self.task_type,
             'status': self.status,
             'language': self.language,
-            'input_data': json.loads(self.input_data) if self.input_data else {},
-            'output_data': json.loads(self.output_data) if self.output_data else {},
+            'input_data': json_column(self.input_data, '{}', raw_json),
+            'output_data': json_column(self.output_data, '{}', raw_json),
+            'progress': {'done': self.progress_done, 'total': self.progress_total},
+            'attempts': self.attempts or 0,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
 class Keyword(db.Model):
     __tablename__ = 'keywords'
+    __table_args__ = (
+        db.Index('ix_keywords_store', 'store_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
@@ -81,6 +105,11 @@ class Keyword(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # 同一商店內一個Shopify產品只對應一行；用唯一索引而不是表約束，已有的SQLite庫也能通過遷移加上
+        db.Index('uq_products_store_shopify_product', 'store_id', 'shopify_product_id', unique=True),
+        db.Index('ix_products_store_created', 'store_id', 'created_at'),  # 產品列表的鍵集分頁
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
@@ -92,10 +121,17 @@ class Product(db.Model):
     keywords = db.Column(db.Text)  # JSON格式存儲關鍵詞
     seo_score = db.Column(db.Float, default=0.0)
     last_optimized = db.Column(db.DateTime)
+    content_hash = db.Column(db.String(64))  # 最近一次同步的源文本指紋
+    optimized_hash = db.Column(db.String(64))  # 最近一次優化時的源文本指紋
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    @property
+    def source_changed(self) -> bool:
+        """源文本自上次優化後是否有變化（從未優化過也算有變化）"""
+        return not self.optimized_hash or self.optimized_hash != self.content_hash
+    
+    def to_dict(self, raw_json: bool = False):
         return {
             'id': self.id,
             'store_id': self.store_id,
@@ -104,10 +140,100 @@ class Product(db.Model):
             'description': self.description,
             'seo_title': self.seo_title,
             'seo_description': self.seo_description,
-            'keywords': json.loads(self.keywords) if self.keywords else [],
+            'keywords': json_column(self.keywords, '[]', raw_json),
             'seo_score': self.seo_score,
             'last_optimized': self.last_optimized.isoformat() if self.last_optimized else None,
+            'source_changed': self.source_changed,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+
+class AIUsageRecord(db.Model):
+    """每次AI調用的token用量明細（只追加寫入）"""
+    __tablename__ = 'ai_usage_ledger'
+    __table_args__ = (
+        db.Index('ix_ai_usage_ledger_store_created', 'store_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, nullable=True)
+    task_type = db.Column(db.String(100), nullable=False)
+    model = db.Column(db.String(50))
+    prompt_tokens = db.Column(db.Integer, default=0)
+    completion_tokens = db.Column(db.Integer, default=0)
+    latency_ms = db.Column(db.Integer, default=0)
+    cache_hit = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'store_id': self.store_id,
+            'task_type': self.task_type,
+            'model': self.model,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'latency_ms': self.latency_ms,
+            'cache_hit': self.cache_hit,
+            'created_at': self.created_at.isoformat()
+        }
+
+class AIUsageDaily(db.Model):
+    """按商店、日期和任務類型匯總的用量，供儀表板查詢"""
+    __tablename__ = 'ai_usage_daily'
+    __table_args__ = (
+        db.UniqueConstraint('store_id', 'day', 'task_type', name='uq_ai_usage_daily_store_day_task'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, nullable=False, default=0)  # 0表示未關聯商店
+    day = db.Column(db.Date, nullable=False)
+    task_type = db.Column(db.String(100), nullable=False)
+    request_count = db.Column(db.Integer, default=0)
+    cache_hits = db.Column(db.Integer, default=0)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    completion_tokens = db.Column(db.Integer, default=0)
+    total_latency_ms = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        return {
+            'store_id': self.store_id,
+            'day': self.day.isoformat(),
+            'task_type': self.task_type,
+            'request_count': self.request_count,
+            'cache_hits': self.cache_hits,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': (self.prompt_tokens or 0) + (self.completion_tokens or 0),
+            'avg_latency_ms': round(self.total_latency_ms / self.request_count, 1) if self.request_count else 0
+        }
+
+class WebhookEvent(db.Model):
+    """已確認收到、等待後台批量應用的Shopify webhook"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('ix_webhook_events_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    webhook_id = db.Column(db.String(255), unique=True)  # X-Shopify-Webhook-Id，用於去重
+    topic = db.Column(db.String(100), nullable=False)
+    shop_domain = db.Column(db.String(255))
+    shopify_product_id = db.Column(db.String(255))
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, applied, superseded, skipped, failed
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'webhook_id': self.webhook_id,
+            'topic': self.topic,
+            'shop_domain': self.shop_domain,
+            'shopify_product_id': self.shopify_product_id,
+            'status': self.status,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
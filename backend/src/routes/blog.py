@@ -1,9 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from src.services.shopify_api import ShopifyAPIService
 from src.services.shopify_blog import ShopifyBlogSync, BlogArticle, BlogContentOptimizer
 from src.services.deepseek_ai import DeepSeekAIService
 from src.models.seo import Store
+from src.models.pagination import cached_count, keyset_page
 from src.models.user import db
+from src.services.task_queue import task_queue
 import json
 from datetime import datetime
 
@@ -56,20 +58,34 @@ def get_articles():
         if status:
             query = query.filter_by(status=status)
         
-        total = query.count()
-        articles = query.order_by(BlogArticle.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
-        
-        return jsonify({
-            "success": True,
-            "articles": [article.to_dict() for article in articles],
-            "pagination": {
+        if 'cursor' in request.args:
+            # 鍵集分頁：cursor留空取第一頁，之後傳回上一頁的next_cursor；總數按需返回
+            articles, next_cursor = keyset_page(query, BlogArticle, per_page, request.args.get('cursor'))
+            pagination = {
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+            if request.args.get('include_total') == 'true':
+                pagination["total"] = cached_count(('blog_articles', store_id, status), query)
+        else:
+            total = cached_count(('blog_articles', store_id, status), query)
+            articles = query.order_by(BlogArticle.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+            pagination = {
                 "page": page,
                 "per_page": per_page,
                 "total": total,
                 "pages": (total + per_page - 1) // per_page
             }
+        
+        return jsonify({
+            "success": True,
+            "articles": [article.to_dict(raw_json=True) for article in articles],
+            "pagination": pagination
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -277,6 +293,16 @@ def optimize_article():
             "error": f"Failed to optimize article: {str(e)}"
         }), 500
 
+@task_queue.register('blog_sync')
+def run_blog_sync_task(task):
+    """後台任務：從Shopify同步文章"""
+    store = Store.query.get(task.input['store_id'])
+    if not store:
+        return {"success": False, "error": "Store not found"}
+    shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    blog_sync = ShopifyBlogSync(shopify_api, db.session)
+    return blog_sync.sync_articles_from_shopify(store.id, task.input['blog_id'])
+
 @blog_bp.route('/sync-from-shopify', methods=['POST'])
 def sync_from_shopify():
     """從Shopify同步文章到本地"""
@@ -294,6 +320,18 @@ def sync_from_shopify():
         if not store:
             return jsonify({"error": "Store not found"}), 404
         
+        task_input = {'store_id': store_id, 'blog_id': blog_id}
+        
+        # 默認作為後台任務執行，返回202和任務ID；async=false 時在請求內同步執行
+        if data.get('async', True):
+            task = task_queue.submit('blog_sync', task_input, store_id=store_id)
+            return jsonify({
+                "success": True,
+                "task_id": task.id,
+                "status": task.status,
+                "status_url": f"/api/seo/tasks/{task.id}"
+            }), 202
+        
         # 初始化服務
         shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
         blog_sync = ShopifyBlogSync(shopify_api, db.session)
@@ -309,6 +347,17 @@ def sync_from_shopify():
             "error": f"Sync failed: {str(e)}"
         }), 500
 
+@task_queue.register('blog_batch_publish', retry_key='article_ids')
+def run_batch_publish_task(task):
+    """後台任務：批量發布文章，失敗的文章可以通過重試任務單獨重新發布"""
+    store = Store.query.get(task.store_id)
+    if not store:
+        return {"success": False, "error": "Store not found"}
+    shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    blog_sync = ShopifyBlogSync(shopify_api, db.session)
+    return blog_sync.batch_publish_articles(task.input['article_ids'], progress=task.progress,
+                                            concurrency=task.input.get('concurrency'))
+
 @blog_bp.route('/articles/batch-publish', methods=['POST'])
 def batch_publish_articles():
     """批量發布文章到Shopify"""
@@ -329,12 +378,25 @@ def batch_publish_articles():
         if not store:
             return jsonify({"error": "Store not found"}), 404
         
+        # 默認作為後台任務執行，返回202和任務ID；async=false 時在請求內同步執行
+        if data.get('async', True):
+            task = task_queue.submit('blog_batch_publish', {
+                'article_ids': article_ids,
+                'concurrency': data.get('concurrency')
+            }, store_id=store.id)
+            return jsonify({
+                "success": True,
+                "task_id": task.id,
+                "status": task.status,
+                "status_url": f"/api/seo/tasks/{task.id}"
+            }), 202
+        
         # 初始化服務
         shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
         blog_sync = ShopifyBlogSync(shopify_api, db.session)
         
         # 批量發布
-        result = blog_sync.batch_publish_articles(article_ids)
+        result = blog_sync.batch_publish_articles(article_ids, concurrency=data.get('concurrency'))
         
         return jsonify(result)
         
@@ -344,6 +406,51 @@ def batch_publish_articles():
             "error": f"Batch publish failed: {str(e)}"
         }), 500
 
+@blog_bp.route('/articles/batch-publish/stream', methods=['POST'])
+def batch_publish_articles_stream():
+    """並發批量發布文章，以Server-Sent Events按完成順序逐篇返回結果"""
+    data = request.get_json() or {}
+    
+    article_ids = data.get('article_ids', [])
+    if not article_ids:
+        return jsonify({"error": "Article IDs are required"}), 400
+    
+    # 獲取第一篇文章來確定商店
+    first_article = BlogArticle.query.get(article_ids[0])
+    if not first_article:
+        return jsonify({"error": "First article not found"}), 404
+    
+    store = Store.query.get(first_article.store_id)
+    if not store:
+        return jsonify({"error": "Store not found"}), 404
+    
+    shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    blog_sync = ShopifyBlogSync(shopify_api, db.session)
+    
+    def generate():
+        succeeded = failed = 0
+        try:
+            for result in blog_sync.iter_batch_publish_articles(article_ids, data.get('concurrency')):
+                if result['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield f"event: item\ndata: {json.dumps(result)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': f'Batch publish failed: {str(e)}'})}\n\n"
+            return
+        
+        yield f"event: done\ndata: {json.dumps({'success': failed == 0, 'succeeded': succeeded, 'failed': failed})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @blog_bp.route('/articles/<int:article_id>/analyze', methods=['POST'])
 def analyze_article_seo():
     """分析文章SEO"""
@@ -375,6 +482,108 @@ def analyze_article_seo():
             "error": f"Failed to analyze article: {str(e)}"
         }), 500
 
+def _generate_article(store, task_input, progress=None):
+    """生成文章並保存到本地，供同步請求和後台任務共用；返回響應數據"""
+    store_id = store.id
+    blog_id = task_input.get('blog_id', 'main-blog')
+    topic = task_input['topic']
+    keywords = task_input.get('keywords', [])
+    language = task_input.get('language', 'en')
+    length = task_input.get('length', 'medium')
+    include_images = task_input.get('include_images', True)
+    
+    # 初始化增強的部落格生成器
+    from src.services.blog_image_generator import EnhancedBlogGenerator
+    
+    # 使用默認API key或模擬模式
+    try:
+        ai_service = DeepSeekAIService("demo_api_key")
+    except Exception:
+        # 如果DeepSeek服務不可用，使用模擬響應
+        class MockAIService:
+            def generate_blog_article(self, data):
+                return {
+                    "title": f"Complete Guide: {data['topic']}",
+                    "content": f"This is a comprehensive guide about {data['topic']}. " * 50,
+                    "summary": f"A detailed overview of {data['topic']} covering all essential aspects.",
+                    "seo_score": 92.5,
+                    "word_count": 500,
+                    "reading_time": 3
+                }
+        ai_service = MockAIService()
+    
+    # 如果需要圖片，初始化Shopify API
+    shopify_api = None
+    if include_images:
+        from src.services.shopify_api import ShopifyAPIService
+        shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    
+    enhanced_generator = EnhancedBlogGenerator(ai_service, shopify_api)
+    
+    # 生成完整文章（包含圖片）
+    generation_result = enhanced_generator.generate_complete_blog_article({
+        'topic': topic,
+        'keywords': keywords,
+        'language': language,
+        'length': length,
+        'include_images': include_images
+    })
+    
+    if not generation_result['success']:
+        return generation_result
+    
+    article_result = generation_result['article']
+    
+    if progress:
+        progress(1, 2, force=True)
+    
+    # 初始化部落格同步服務
+    shopify_api_sync = ShopifyAPIService(store.shop_domain, store.access_token)
+    blog_sync = ShopifyBlogSync(shopify_api_sync, db.session)
+    
+    # 準備文章數據
+    article_data = {
+        'blog_id': blog_id,
+        'title': article_result.get('topic', topic),
+        'content': article_result.get('content', ''),
+        'summary': article_result.get('meta_description', ''),
+        'tags': article_result.get('target_keywords', keywords),
+        'language': language,
+        'seo_score': article_result.get('seo_score', 0)
+    }
+    
+    # 創建本地文章
+    create_result = blog_sync.create_article_locally(store_id, article_data)
+    
+    if create_result['success']:
+        response_data = {
+            "success": True,
+            "article": create_result['article'],
+            "generation_result": article_result
+        }
+        
+        # 如果包含圖片，添加圖片信息
+        if include_images and 'images' in article_result:
+            response_data['images'] = article_result['images']
+            response_data['image_count'] = article_result.get('image_count', 0)
+        
+        # 如果有警告信息，添加到響應中
+        if 'warning' in generation_result:
+            response_data['warning'] = generation_result['warning']
+        
+        return response_data
+    else:
+        return create_result
+
+@task_queue.register('blog_ai_generation')
+def run_blog_generation_task(task):
+    """後台任務：AI生成文章"""
+    store = Store.query.get(task.input['store_id'])
+    if not store:
+        return {"success": False, "error": "Store not found"}
+    task.progress(0, 2, force=True)
+    return _generate_article(store, task.input, progress=task.progress)
+
 @blog_bp.route('/generate-from-ai', methods=['POST'])
 def generate_article_from_ai():
     """使用AI生成部落格文章並保存到本地（包含圖片生成）"""
@@ -407,85 +616,30 @@ def generate_article_from_ai():
             if not store:
                 return jsonify({"error": "Store not found"}), 404
         
-        # 初始化增強的部落格生成器
-        from src.services.blog_image_generator import EnhancedBlogGenerator
-        
-        # 使用默認API key或模擬模式
-        try:
-            ai_service = DeepSeekAIService("demo_api_key")
-        except Exception:
-            # 如果DeepSeek服務不可用，使用模擬響應
-            class MockAIService:
-                def generate_blog_article(self, data):
-                    return {
-                        "title": f"Complete Guide: {data['topic']}",
-                        "content": f"This is a comprehensive guide about {data['topic']}. " * 50,
-                        "summary": f"A detailed overview of {data['topic']} covering all essential aspects.",
-                        "seo_score": 92.5,
-                        "word_count": 500,
-                        "reading_time": 3
-                    }
-            ai_service = MockAIService()
-        
-        # 如果需要圖片，初始化Shopify API
-        shopify_api = None
-        if include_images:
-            from src.services.shopify_api import ShopifyAPIService
-            shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
-        
-        enhanced_generator = EnhancedBlogGenerator(ai_service, shopify_api)
-        
-        # 生成完整文章（包含圖片）
-        generation_result = enhanced_generator.generate_complete_blog_article({
+        task_input = {
+            'store_id': store_id,
+            'blog_id': blog_id,
             'topic': topic,
             'keywords': keywords,
             'language': language,
             'length': length,
             'include_images': include_images
-        })
-        
-        if not generation_result['success']:
-            return jsonify(generation_result), 500
-        
-        article_result = generation_result['article']
-        
-        # 初始化部落格同步服務
-        shopify_api_sync = ShopifyAPIService(store.shop_domain, store.access_token)
-        blog_sync = ShopifyBlogSync(shopify_api_sync, db.session)
-        
-        # 準備文章數據
-        article_data = {
-            'blog_id': blog_id,
-            'title': article_result.get('topic', topic),
-            'content': article_result.get('content', ''),
-            'summary': article_result.get('meta_description', ''),
-            'tags': article_result.get('target_keywords', keywords),
-            'language': language,
-            'seo_score': article_result.get('seo_score', 0)
         }
         
-        # 創建本地文章
-        create_result = blog_sync.create_article_locally(store_id, article_data)
-        
-        if create_result['success']:
-            response_data = {
+        # 前端在請求內等待生成結果，所以默認同步執行；async=true 時作為後台任務執行並返回202
+        if data.get('async', False):
+            task = task_queue.submit('blog_ai_generation', task_input, store_id=store_id, language=language)
+            return jsonify({
                 "success": True,
-                "article": create_result['article'],
-                "generation_result": article_result
-            }
-            
-            # 如果包含圖片，添加圖片信息
-            if include_images and 'images' in article_result:
-                response_data['images'] = article_result['images']
-                response_data['image_count'] = article_result.get('image_count', 0)
-            
-            # 如果有警告信息，添加到響應中
-            if 'warning' in generation_result:
-                response_data['warning'] = generation_result['warning']
-            
-            return jsonify(response_data)
-        else:
-            return jsonify(create_result), 500
+                "task_id": task.id,
+                "status": task.status,
+                "status_url": f"/api/seo/tasks/{task.id}"
+            }), 202
+        
+        response_data = _generate_article(store, task_input)
+        if not response_data['success']:
+            return jsonify(response_data), 500
+        return jsonify(response_data)
         
     except Exception as e:
         return jsonify({
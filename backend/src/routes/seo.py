@@ -1,14 +1,54 @@
-from flask import Blueprint, request, jsonify
-from src.services.deepseek_ai import DeepSeekAIService
-from src.models.seo import SeoTask
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.services.deepseek_ai import DeepSeekAIService, DEFAULT_PACK_SIZE
+from src.services.deepseek_async import AsyncDeepSeekAIService, run_sync
+from src.models.seo import SeoTask, Product, AIUsageDaily
+from src.models.pagination import cached_count, keyset_page
+from src.json_provider import raw_json
+from src.services.shopify_blog import BlogArticle
+from src.services.usage_meter import current_store_id, scope_requests, usage_scope
+from src.services.task_queue import task_queue
+from src.services.fair_scheduler import scheduler_stats
 from src.models.user import db
+from sqlalchemy import func, update
+import asyncio
 import json
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
 
 seo_bp = Blueprint('seo', __name__)
+scope_requests(seo_bp)
 
 # Initialize DeepSeek AI service
 ai_service = DeepSeekAIService("sk-f2164aa18c9747679dd18784e31f4f6d")
+async_ai_service = AsyncDeepSeekAIService(ai_service.api_key, base_url=ai_service.base_url)
+
+# Bulk generation limits
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '10000'))
+BULK_DEFAULT_PARALLELISM = int(os.getenv('BULK_DEFAULT_PARALLELISM', '16'))
+BULK_MAX_PARALLELISM = int(os.getenv('BULK_MAX_PARALLELISM', '64'))
+BULK_COMMIT_BATCH_SIZE = int(os.getenv('BULK_COMMIT_BATCH_SIZE', '500'))
+BULK_OPERATIONS = {
+    'title': 'title_generation',
+    'description': 'description_generation'
+}
+
+def _ai_unavailable(task_type, data, language):
+    """Record a failed task instead of storing fallback text, and tell the client to retry later"""
+    task = SeoTask(
+        task_type=task_type,
+        input_data=json.dumps(data),
+        output_data=json.dumps({"error": "AI service unavailable"}),
+        status='failed',
+        language=language
+    )
+    db.session.add(task)
+    db.session.commit()
+    
+    return jsonify({
+        "success": False,
+        "task_id": task.id,
+        "error": "AI service is temporarily unavailable, please try again later"
+    }), 503
 
 @seo_bp.route('/health', methods=['GET'])
 def health_check():
@@ -19,6 +59,74 @@ def health_check():
         "timestamp": datetime.utcnow().isoformat()
     })
 
+@seo_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """AI response cache hit/miss counters and in-flight request coalescing counters"""
+    single_flight = ai_service.single_flight.stats() if ai_service.single_flight is not None else None
+    if ai_service.cache is None:
+        return jsonify({"success": True, "enabled": False, "single_flight": single_flight})
+    
+    return jsonify({
+        "success": True,
+        "enabled": True,
+        "stats": ai_service.cache.stats(),
+        "single_flight": single_flight
+    })
+
+@seo_bp.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats_view():
+    """Per-store queue depth, running calls and wait times of the fair schedulers and job queue"""
+    return jsonify({
+        "success": True,
+        "schedulers": scheduler_stats(),
+        "tasks": task_queue.stats()
+    })
+
+@seo_bp.route('/usage', methods=['GET'])
+def get_usage():
+    """AI token usage per day and task type, read from the daily rollup"""
+    try:
+        store_id = request.args.get('store_id', type=int)
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        
+        query = AIUsageDaily.query.filter(AIUsageDaily.day >= since)
+        if store_id is not None:
+            query = query.filter(AIUsageDaily.store_id == store_id)
+        
+        rows = query.order_by(AIUsageDaily.day.desc(), AIUsageDaily.task_type).all()
+        
+        totals = db.session.query(
+            AIUsageDaily.task_type,
+            func.sum(AIUsageDaily.request_count),
+            func.sum(AIUsageDaily.cache_hits),
+            func.sum(AIUsageDaily.prompt_tokens),
+            func.sum(AIUsageDaily.completion_tokens)
+        ).filter(AIUsageDaily.day >= since)
+        if store_id is not None:
+            totals = totals.filter(AIUsageDaily.store_id == store_id)
+        
+        return jsonify({
+            "success": True,
+            "since": since.isoformat(),
+            "daily": [row.to_dict() for row in rows],
+            "totals": [{
+                "task_type": task_type,
+                "request_count": requests or 0,
+                "cache_hits": cache_hits or 0,
+                "prompt_tokens": prompt_tokens or 0,
+                "completion_tokens": completion_tokens or 0,
+                "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0)
+            } for task_type, requests, cache_hits, prompt_tokens, completion_tokens
+                in totals.group_by(AIUsageDaily.task_type).all()]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to get usage: {str(e)}"
+        }), 500
+
 @seo_bp.route('/generate-title', methods=['POST'])
 def generate_title():
     """Generate SEO-optimized title using DeepSeek AI"""
@@ -42,9 +150,13 @@ def generate_title():
             product_title=original_title,
             product_description=description,
             language=language,
-            keywords=keywords
+            keywords=keywords,
+            use_cache=data.get('use_cache', True)
         )
         
+        if ai_service.is_fallback_response(result["optimized_title"]):
+            return _ai_unavailable('title_generation', data, language)
+        
         # Save task to database
         task = SeoTask(
             task_type='title_generation',
@@ -96,9 +208,13 @@ def generate_description():
             product_title=title,
             product_description=original_description,
             language=language,
-            keywords=keywords
+            keywords=keywords,
+            use_cache=data.get('use_cache', True)
         )
         
+        if ai_service.is_fallback_response(result["optimized_description"]):
+            return _ai_unavailable('description_generation', data, language)
+        
         # Save task to database
         task = SeoTask(
             task_type='description_generation',
@@ -127,6 +243,245 @@ def generate_description():
             "error": f"Failed to generate description: {str(e)}"
         }), 500
 
+def _int_field(data, name, default):
+    """Integer field of a JSON body; missing or null gives `default`, non-integers raise ValueError"""
+    value = data.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+
+def _load_bulk_items(data):
+    """Turn a bulk request into a list of generation items, one per product"""
+    language = data.get('language', 'en')
+    keywords = data.get('keywords', [])
+    items = []
+    
+    for payload in data.get('products') or []:
+        items.append({
+            "product_id": payload.get('product_id'),
+            "store_id": payload.get('store_id'),
+            "product_title": payload.get('product_title', ''),
+            "product_description": payload.get('product_description', ''),
+            "language": payload.get('language', language),
+            "keywords": payload.get('keywords', keywords)
+        })
+    
+    product_ids = data.get('product_ids') or []
+    products_by_id = {}
+    # Load requested products in chunks to stay under SQLite's bound-parameter limit
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        for product in Product.query.filter(Product.id.in_(chunk)).all():
+            products_by_id[product.id] = product
+    
+    for product_id in product_ids:
+        product = products_by_id.get(product_id)
+        if product is None:
+            items.append({"product_id": product_id, "error": "Product not found"})
+            continue
+        # "skip_unchanged": true skips products whose source text is unchanged since their last optimization
+        if data.get('skip_unchanged') and not product.source_changed:
+            items.append({"product_id": product.id, "skipped": True})
+            continue
+        items.append({
+            "product_id": product.id,
+            "store_id": product.store_id,
+            "product_title": product.title or '',
+            "product_description": product.description or '',
+            "language": language,
+            "keywords": keywords or (json.loads(product.keywords) if product.keywords else []),
+            "content_hash": product.content_hash
+        })
+    
+    return items
+
+async def _generate_bulk_items(items, operations, parallelism, use_cache, pack_size=None, store_id=None):
+    """Run every item's generations concurrently, at most `parallelism` items at a time
+
+    With pack_size set, titles are generated in packed requests first (several
+    products per chat call) and only descriptions run per item.
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+    
+    packed_titles = {}
+    if pack_size and 'title' in operations:
+        valid = [index for index, item in enumerate(items)
+                 if not item.get('error') and not item.get('skipped') and item['product_title']]
+        # A pack can span stores, so packed calls are billed to the requesting store
+        with usage_scope(store_id):
+            titles = await async_ai_service.generate_titles_packed(
+                [items[index] for index in valid], pack_size=pack_size, use_cache=use_cache
+            )
+        packed_titles = dict(zip(valid, titles))
+    
+    async def generate_item(index, item):
+        if item.get('skipped'):
+            return {"skipped": True}
+        if item.get('error'):
+            return {"error": item['error']}
+        if not item['product_title']:
+            return {"error": "Product title is required"}
+        
+        # Runs on the background loop, so the request's usage scope is not inherited
+        with usage_scope(item.get('store_id') or store_id):
+            return await generate_outputs(index, item)
+    
+    async def generate_outputs(index, item):
+        async with semaphore:
+            outputs = {}
+            try:
+                if index in packed_titles:
+                    outputs['title'] = packed_titles[index]
+                elif 'title' in operations:
+                    outputs['title'] = await async_ai_service.generate_title(
+                        product_title=item['product_title'],
+                        product_description=item['product_description'],
+                        language=item['language'],
+                        keywords=item['keywords'],
+                        use_cache=use_cache
+                    )
+                if 'description' in operations:
+                    outputs['description'] = await async_ai_service.generate_description(
+                        product_title=item['product_title'],
+                        product_description=item['product_description'],
+                        language=item['language'],
+                        keywords=item['keywords'],
+                        use_cache=use_cache
+                    )
+            except Exception as e:
+                return {"error": str(e), "outputs": outputs}
+            
+            # Fallback text means DeepSeek failed; report it instead of saving it
+            failed = [operation for operation, output in outputs.items()
+                      if async_ai_service.is_fallback_response(output[f"optimized_{operation}"])]
+            if failed:
+                return {
+                    "error": f"AI service unavailable for: {', '.join(failed)}",
+                    "outputs": {op: out for op, out in outputs.items() if op not in failed}
+                }
+            return {"outputs": outputs}
+    
+    return await asyncio.gather(*(generate_item(index, item) for index, item in enumerate(items)))
+
+@seo_bp.route('/generate-bulk', methods=['POST'])
+def generate_bulk():
+    """Generate SEO titles/descriptions for many products concurrently"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        if not data.get('products') and not data.get('product_ids'):
+            return jsonify({"error": "products or product_ids is required"}), 400
+        
+        operations = data.get('operations', list(BULK_OPERATIONS.keys()))
+        unknown = [op for op in operations if op not in BULK_OPERATIONS]
+        if not operations or unknown:
+            return jsonify({"error": f"Unsupported operations: {unknown or operations}"}), 400
+        
+        try:
+            parallelism = max(1, min(_int_field(data, 'parallelism', BULK_DEFAULT_PARALLELISM), BULK_MAX_PARALLELISM))
+            batch_size = max(1, _int_field(data, 'batch_size', BULK_COMMIT_BATCH_SIZE))
+            
+            # "packed": true packs titles into multi-product requests, "pack_size" overrides the default size
+            pack_size = None
+            if data.get('packed'):
+                pack_size = _int_field(data, 'pack_size', None) or DEFAULT_PACK_SIZE
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        items = _load_bulk_items(data)
+        if len(items) > BULK_MAX_ITEMS:
+            return jsonify({"error": f"At most {BULK_MAX_ITEMS} products per request"}), 400
+        
+        generated = run_sync(_generate_bulk_items(items, operations, parallelism, data.get('use_cache', True),
+                                                  pack_size, current_store_id()))
+        
+        # Persist tasks in batched transactions instead of one commit per generation
+        results = []
+        pending = []
+        optimized = []
+        
+        def flush():
+            if not pending:
+                return
+            db.session.add_all([task for _, _, task in pending])
+            if optimized:
+                # Store the generated SEO fields and which source text they were generated from
+                db.session.execute(update(Product), optimized)
+                optimized.clear()
+            db.session.commit()
+            for result, operation, task in pending:
+                result['task_ids'][operation] = task.id
+            pending.clear()
+        
+        for index, (item, outcome) in enumerate(zip(items, generated)):
+            result = {
+                "index": index,
+                "product_id": item.get('product_id'),
+                "success": 'error' not in outcome,
+                "task_ids": {}
+            }
+            if 'error' in outcome:
+                result['error'] = outcome['error']
+            if outcome.get('skipped'):
+                result['skipped'] = True
+            elif 'error' not in outcome and 'content_hash' in item:
+                # Products loaded by id keep what was generated for them
+                outputs = outcome.get('outputs', {})
+                fields = {"id": item['product_id'], "last_optimized": datetime.utcnow()}
+                if 'title' in outputs:
+                    fields['seo_title'] = outputs['title']['optimized_title']
+                if 'description' in outputs:
+                    fields['seo_description'] = outputs['description']['optimized_description']
+                # Only a full regeneration counts as optimized for skip_unchanged
+                if item['content_hash'] and set(outputs) == set(BULK_OPERATIONS):
+                    fields['optimized_hash'] = item['content_hash']
+                optimized.append(fields)
+            
+            for operation, output in outcome.get('outputs', {}).items():
+                result[operation] = output
+                task_input = {key: value for key, value in item.items() if key not in ('error', 'content_hash')}
+                task = SeoTask(
+                    store_id=item.get('store_id'),
+                    task_type=BULK_OPERATIONS[operation],
+                    input_data=json.dumps(task_input),
+                    output_data=json.dumps(output),
+                    status='completed',
+                    language=item.get('language', 'en'),
+                    completed_at=datetime.utcnow()
+                )
+                pending.append((result, operation, task))
+            
+            results.append(result)
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+        
+        succeeded = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            "success": succeeded == len(results),
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "skipped": sum(1 for result in results if result.get('skipped')),
+            "results": results
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "success": False,
+            "error": f"Failed to run bulk generation: {str(e)}"
+        }), 500
+
 @seo_bp.route('/generate-blog', methods=['POST'])
 def generate_blog():
     """Generate SEO-optimized blog article using DeepSeek AI"""
@@ -153,6 +508,9 @@ def generate_blog():
             length=length
         )
         
+        if ai_service.is_fallback_response(result["content"]):
+            return _ai_unavailable('blog_generation', data, language)
+        
         # Save task to database
         task = SeoTask(
             task_type='blog_generation',
@@ -184,6 +542,104 @@ def generate_blog():
             "error": f"Failed to generate blog article: {str(e)}"
         }), 500
 
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@seo_bp.route('/generate-blog/stream', methods=['GET', 'POST'])
+def generate_blog_stream():
+    """Stream a blog article from DeepSeek to the client as Server-Sent Events"""
+    # EventSource can only issue GET requests, so accept query parameters too
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    if data is None:
+        data = {
+            "topic": request.args.get('topic', ''),
+            "keywords": request.args.getlist('keywords'),
+            "language": request.args.get('language', 'en'),
+            "length": request.args.get('length', 'medium'),
+            "store_id": request.args.get('store_id', type=int),
+            "blog_id": request.args.get('blog_id')
+        }
+    
+    topic = data.get('topic', '')
+    target_keywords = data.get('keywords', [])
+    language = data.get('language', 'en')
+    length = data.get('length', 'medium')
+    
+    if not topic:
+        return jsonify({"error": "Blog topic is required"}), 400
+    
+    def generate():
+        parts = []
+        try:
+            for delta in ai_service.stream_blog_article(topic, target_keywords, length):
+                parts.append(delta)
+                yield _sse_event('token', {"content": delta})
+            result = ai_service._blog_result(topic, ''.join(parts).strip(), target_keywords, length, language)
+        except Exception as e:
+            print(f"Blog streaming error: {str(e)}")
+            # Never persist a partial or fallback article
+            message = f"Stream interrupted: {str(e)}" if parts else "AI service is temporarily unavailable, please try again later"
+            yield _sse_event('error', {"error": message})
+            return
+        
+        # Persist only once the stream has closed with a complete article
+        try:
+            task = SeoTask(
+                store_id=data.get('store_id'),
+                task_type='blog_generation',
+                input_data=json.dumps(data),
+                output_data=json.dumps(result),
+                status='completed',
+                language=language,
+                completed_at=datetime.utcnow()
+            )
+            db.session.add(task)
+            
+            article = None
+            if data.get('store_id'):
+                article = BlogArticle(
+                    store_id=data['store_id'],
+                    shopify_blog_id=data.get('blog_id') or 'main-blog',
+                    title=topic,
+                    content=result["content"],
+                    summary=result["meta_description"],
+                    tags=json.dumps(target_keywords),
+                    language=language,
+                    seo_score=result["seo_score"],
+                    word_count=result["word_count"],
+                    status='draft'
+                )
+                db.session.add(article)
+            
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            yield _sse_event('error', {"error": f"Failed to save blog article: {str(e)}"})
+            return
+        
+        yield _sse_event('done', {
+            "success": True,
+            "task_id": task.id,
+            "article_id": article.id if article else None,
+            "topic": result["topic"],
+            "meta_description": result["meta_description"],
+            "language": result["language"],
+            "length": result["length"],
+            "target_keywords": result["target_keywords"],
+            "word_count": result["word_count"],
+            "seo_score": result["seo_score"],
+            "timestamp": result["timestamp"]
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @seo_bp.route('/generate-keywords', methods=['POST'])
 def generate_keywords():
     """Generate relevant keywords using DeepSeek AI"""
@@ -205,9 +661,13 @@ def generate_keywords():
         result = ai_service.generate_keywords(
             topic=topic,
             language=language,
-            count=count
+            count=count,
+            use_cache=data.get('use_cache', True)
         )
         
+        if any(ai_service.is_fallback_response(keyword) for keyword in result["keywords"]):
+            return _ai_unavailable('keyword_generation', data, language)
+        
         # Save task to database
         task = SeoTask(
             task_type='keyword_generation',
@@ -261,6 +721,9 @@ def seo_audit():
             language=language
         )
         
+        if ai_service.is_fallback_response(result["analysis"]):
+            return _ai_unavailable('seo_audit', data, language)
+        
         # Save task to database
         task = SeoTask(
             task_type='seo_audit',
@@ -350,20 +813,38 @@ def get_tasks():
         if task_type:
             query = query.filter_by(task_type=task_type)
         
-        tasks = query.order_by(SeoTask.created_at.desc()).limit(limit).all()
+        pagination = None
+        if 'cursor' in request.args:
+            # Keyset pagination: an empty cursor returns the first page; pass back next_cursor for the next one
+            tasks, next_cursor = keyset_page(query, SeoTask, limit, request.args.get('cursor'))
+            pagination = {
+                "limit": limit,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+            if request.args.get('include_total') == 'true':
+                pagination["total"] = cached_count(('seo_tasks', task_type), query)
+        else:
+            tasks = query.order_by(SeoTask.created_at.desc()).limit(limit).all()
         
-        return jsonify({
+        response = {
             "success": True,
             "tasks": [{
                 "id": task.id,
                 "task_type": task.task_type,
                 "status": task.status,
                 "language": task.language,
+                "progress": {"done": task.progress_done, "total": task.progress_total},
                 "created_at": task.created_at.isoformat(),
                 "updated_at": task.updated_at.isoformat()
             } for task in tasks]
-        })
+        }
+        if pagination is not None:
+            response["pagination"] = pagination
+        return jsonify(response)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -381,12 +862,17 @@ def get_task(task_id):
             "task": {
                 "id": task.id,
                 "task_type": task.task_type,
-                "input_data": json.loads(task.input_data) if task.input_data else {},
-                "output_data": json.loads(task.output_data) if task.output_data else {},
+                # Embed the stored JSON text in the response as-is instead of decoding and re-encoding it
+                "input_data": raw_json(task.input_data, '{}'),
+                "output_data": raw_json(task.output_data, '{}'),
                 "status": task.status,
                 "language": task.language,
+                "progress": {"done": task.progress_done, "total": task.progress_total},
+                "attempts": task.attempts or 0,
                 "created_at": task.created_at.isoformat(),
-                "updated_at": task.updated_at.isoformat()
+                "updated_at": task.updated_at.isoformat(),
+                "started_at": task.started_at.isoformat() if task.started_at else None,
+                "completed_at": task.completed_at.isoformat() if task.completed_at else None
             }
         })
         
@@ -396,3 +882,48 @@ def get_task(task_id):
             "error": f"Failed to get task: {str(e)}"
         }), 500
 
+@seo_bp.route('/tasks/<int:task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    """Cancel a background task; a running task stops at its next progress report"""
+    try:
+        SeoTask.query.get_or_404(task_id)
+        status = task_queue.cancel(task_id)
+        
+        return jsonify({
+            "success": status in ('cancelled', 'cancelling'),
+            "task_id": task_id,
+            "status": status
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to cancel task: {str(e)}"
+        }), 500
+
+@seo_bp.route('/tasks/<int:task_id>/retry', methods=['POST'])
+def retry_task(task_id):
+    """Re-run a finished background task, limited to its failed items when it reports them"""
+    try:
+        task = SeoTask.query.get_or_404(task_id)
+        retry = task_queue.retry(task)
+        if retry is None:
+            return jsonify({
+                "success": False,
+                "error": "Task has nothing to retry"
+            }), 409
+        
+        return jsonify({
+            "success": True,
+            "task_id": retry.id,
+            "retry_of": task_id,
+            "status": retry.status,
+            "status_url": f"/api/seo/tasks/{retry.id}"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to retry task: {str(e)}"
+        }), 500
+
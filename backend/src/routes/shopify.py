@@ -1,12 +1,20 @@
-from flask import Blueprint, request, jsonify
-from src.services.shopify_api import ShopifyAPIService, ShopifyProductSync
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.services.shopify_api import ShopifyAPIService, ShopifyProductSync, PushCheckpoint
 from src.models.seo import Store, Product
+from src.models.pagination import cached_count, keyset_page
 from src.models.user import db
+from src.services.webhook_queue import webhook_queue
+from src.services.task_queue import task_queue
 import json
+import os
+import re
 from datetime import datetime
 
 shopify_bp = Blueprint('shopify', __name__)
 
+# 批量推送的斷點文件目錄
+PUSH_CHECKPOINT_DIR = os.getenv('SHOPIFY_CHECKPOINT_DIR') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'checkpoints')
+
 @shopify_bp.route('/health', methods=['GET'])
 def health_check():
     """Shopify API健康檢查"""
@@ -67,7 +75,7 @@ def connect_shopify():
         
         return jsonify({
             "success": True,
-            "store": store.to_dict(),
+            "store": store.to_dict(raw_json=True),
             "shop_info": shop_info
         })
         
@@ -78,6 +86,21 @@ def connect_shopify():
             "error": f"Connection failed: {str(e)}"
         }), 500
 
+def _sync_products(store, task_input, progress=None):
+    """執行產品同步，供同步請求和後台任務共用"""
+    shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    product_sync = ShopifyProductSync(shopify_api, db.session)
+    return product_sync.sync_products_from_shopify(task_input['store_id'], task_input.get('engine', 'rest'),
+                                                   task_input.get('full', False), progress)
+
+@task_queue.register('product_sync')
+def run_product_sync_task(task):
+    """後台任務：同步Shopify產品"""
+    store = Store.query.get(task.input['store_id'])
+    if not store:
+        return {"success": False, "error": "Store not found"}
+    return _sync_products(store, task.input, progress=task.progress)
+
 @shopify_bp.route('/sync-products', methods=['POST'])
 def sync_products():
     """同步Shopify產品到本地數據庫"""
@@ -93,14 +116,24 @@ def sync_products():
         if not store:
             return jsonify({"error": "Store not found"}), 404
         
-        # 初始化Shopify API
-        shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
-        product_sync = ShopifyProductSync(shopify_api, db.session)
+        # engine=bulk 使用GraphQL批量操作，適合大型商店；full=true 忽略水位做全量同步
+        task_input = {
+            'store_id': store_id,
+            'engine': data.get('engine', 'rest'),
+            'full': bool(data.get('full', False))
+        }
         
-        # 執行同步
-        result = product_sync.sync_products_from_shopify(store_id)
+        # 默認作為後台任務執行，返回202和任務ID；async=false 時在請求內同步執行
+        if data.get('async', True):
+            task = task_queue.submit('product_sync', task_input, store_id=store_id)
+            return jsonify({
+                "success": True,
+                "task_id": task.id,
+                "status": task.status,
+                "status_url": f"/api/seo/tasks/{task.id}"
+            }), 202
         
-        return jsonify(result)
+        return jsonify(_sync_products(store, task_input))
         
     except Exception as e:
         return jsonify({
@@ -121,21 +154,35 @@ def get_synced_products():
         
         # 查詢產品
         products_query = Product.query.filter_by(store_id=store_id)
-        total = products_query.count()
-        
-        products = products_query.offset((page - 1) * per_page).limit(per_page).all()
         
-        return jsonify({
-            "success": True,
-            "products": [product.to_dict() for product in products],
-            "pagination": {
+        if 'cursor' in request.args:
+            # 鍵集分頁：cursor留空取第一頁，之後傳回上一頁的next_cursor；總數按需返回
+            products, next_cursor = keyset_page(products_query, Product, per_page, request.args.get('cursor'))
+            pagination = {
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+            if request.args.get('include_total') == 'true':
+                pagination["total"] = cached_count(('products', store_id), products_query)
+        else:
+            total = cached_count(('products', store_id), products_query)
+            products = products_query.offset((page - 1) * per_page).limit(per_page).all()
+            pagination = {
                 "page": page,
                 "per_page": per_page,
                 "total": total,
                 "pages": (total + per_page - 1) // per_page
             }
+        
+        return jsonify({
+            "success": True,
+            "products": [product.to_dict(raw_json=True) for product in products],
+            "pagination": pagination
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -143,7 +190,7 @@ def get_synced_products():
         }), 500
 
 @shopify_bp.route('/products/<int:product_id>/optimize', methods=['POST'])
-def optimize_product():
+def optimize_product(product_id):
     """優化產品SEO並推送到Shopify"""
     try:
         data = request.get_json()
@@ -166,10 +213,11 @@ def optimize_product():
         if not seo_title or not seo_description:
             return jsonify({"error": "SEO title and description are required"}), 400
         
-        # 更新本地產品數據
+        # 更新本地產品數據，並記下這次優化基於的源文本指紋
         product.seo_title = seo_title
         product.seo_description = seo_description
         product.last_optimized = datetime.utcnow()
+        product.optimized_hash = product.content_hash
         
         # 推送到Shopify
         shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
@@ -199,7 +247,7 @@ def optimize_product():
         }), 500
 
 @shopify_bp.route('/products/<int:product_id>/push', methods=['POST'])
-def push_product_to_shopify():
+def push_product_to_shopify(product_id):
     """將本地優化的產品推送到Shopify"""
     try:
         # 獲取產品
@@ -227,6 +275,62 @@ def push_product_to_shopify():
             "error": f"Push failed: {str(e)}"
         }), 500
 
+@shopify_bp.route('/products/push-bulk', methods=['POST'])
+def push_products_bulk():
+    """並發推送商店產品的SEO到Shopify，以Server-Sent Events逐個返回結果
+    
+    推送會記錄斷點，中斷後用相同的store_id和checkpoint_id再次請求即可從斷點繼續；
+    全部成功後斷點自動清除。
+    """
+    data = request.get_json() or {}
+    store_id = data.get('store_id')
+    
+    if not store_id:
+        return jsonify({"error": "Store ID is required"}), 400
+    
+    store = Store.query.get(store_id)
+    if not store:
+        return jsonify({"error": "Store not found"}), 404
+    
+    checkpoint_id = re.sub(r'[^\w-]', '', str(data.get('checkpoint_id', 'default'))) or 'default'
+    checkpoint = PushCheckpoint(os.path.join(PUSH_CHECKPOINT_DIR, f"push_{store_id}_{checkpoint_id}.txt"))
+    
+    shopify_api = ShopifyAPIService(store.shop_domain, store.access_token)
+    product_sync = ShopifyProductSync(shopify_api, db.session)
+    
+    def generate():
+        succeeded = failed = skipped = 0
+        try:
+            for result in product_sync.push_seo_bulk(store_id, data.get('product_ids'),
+                                                     data.get('concurrency'), checkpoint):
+                if result.get('skipped'):
+                    skipped += 1
+                elif result['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield f"event: item\ndata: {json.dumps(result)}\n\n"
+        except Exception as e:
+            checkpoint.close()
+            yield f"event: error\ndata: {json.dumps({'error': f'Push failed: {str(e)}'})}\n\n"
+            return
+        
+        if failed:
+            checkpoint.close()
+        else:
+            checkpoint.remove()
+        
+        yield f"event: done\ndata: {json.dumps({'success': failed == 0, 'succeeded': succeeded, 'failed': failed, 'skipped': skipped})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @shopify_bp.route('/webhook/products/update', methods=['POST'])
 def handle_product_webhook():
     """處理Shopify產品更新webhook"""
@@ -240,23 +344,18 @@ def handle_product_webhook():
         # if not shopify_api.verify_webhook(webhook_data, webhook_signature):
         #     return jsonify({"error": "Invalid webhook signature"}), 401
         
-        product_data = request.get_json()
-        
-        # 查找對應的本地產品
-        shopify_product_id = str(product_data.get('id'))
-        product = Product.query.filter_by(shopify_product_id=shopify_product_id).first()
+        # 只持久化入隊並立即確認，產品由後台按批合併應用
+        queued = webhook_queue.enqueue(
+            topic=request.headers.get('X-Shopify-Topic', 'products/update'),
+            payload=webhook_data,
+            webhook_id=request.headers.get('X-Shopify-Webhook-Id'),
+            shop_domain=request.headers.get('X-Shopify-Shop-Domain')
+        )
         
-        if product:
-            # 更新本地產品數據
-            product.title = product_data.get('title', product.title)
-            product.description = product_data.get('body_html', product.description)
-            product.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-            
-            return jsonify({"success": True, "message": "Product updated"})
-        else:
-            return jsonify({"success": True, "message": "Product not found locally"})
+        return jsonify({
+            "success": True,
+            "message": "Webhook queued" if queued else "Duplicate webhook ignored"
+        })
         
     except Exception as e:
         db.session.rollback()
@@ -266,7 +365,7 @@ def handle_product_webhook():
         }), 500
 
 @shopify_bp.route('/stores/<int:store_id>/status', methods=['GET'])
-def get_store_status():
+def get_store_status(store_id):
     """獲取商店同步狀態"""
     try:
         store = Store.query.get(store_id)
@@ -291,7 +390,7 @@ def get_store_status():
         
         return jsonify({
             "success": True,
-            "store": store.to_dict(),
+            "store": store.to_dict(raw_json=True),
             "connection_status": connection_status,
             "shop_info": shop_info,
             "statistics": {
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def make_cache_key(payload: Dict) -> str:
+    """Hash the parts of a chat-completion payload that determine its output"""
+    normalized = {
+        "model": payload.get("model"),
+        "messages": [
+            {"role": message.get("role"), "content": (message.get("content") or "").strip()}
+            for message in payload.get("messages", [])
+        ],
+        "max_tokens": int(payload.get("max_tokens") or 0),
+        "temperature": round(float(payload.get("temperature") or 0), 4)
+    }
+    if payload.get("response_format"):
+        normalized["response_format"] = payload["response_format"]
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class LRUCacheTier:
+    """In-process LRU tier, safe to share between threads"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheTier:
+    """Persistent tier backed by a SQLite file, with TTL and size-based eviction
+
+    Reads never write: hits only note their access time in memory, and the
+    notes are written in one batch with the next insert, before an eviction,
+    or once `touch_batch` of them have piled up.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 86400, max_entries: int = 100000,
+                 evict_every: int = 500, touch_batch: int = 256):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.touch_batch = touch_batch
+        self._local = threading.local()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_response_cache_accessed_at "
+            "ON ai_response_cache (accessed_at)"
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, created_at FROM ai_response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+            # Expired rows are deleted by the next eviction
+            return None
+
+        with self._lock:
+            self._touched[key] = now
+            flush = len(self._touched) >= self.touch_batch
+        if flush:
+            self._write_touched(conn)
+            conn.commit()
+        return row[0]
+
+    def _write_touched(self, conn: sqlite3.Connection):
+        """Write the pending access times; the caller commits"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany(
+                "UPDATE ai_response_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touched.items()]
+            )
+
+    def set(self, key: str, value: str):
+        conn = self._connection()
+        now = time.time()
+        self._write_touched(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_response_cache (key, value, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, value, now, now)
+        )
+        conn.commit()
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        conn = self._connection()
+        self._write_touched(conn)
+        if self.ttl_seconds:
+            conn.execute(
+                "DELETE FROM ai_response_cache WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+        conn.execute(
+            "DELETE FROM ai_response_cache WHERE key IN ("
+            "SELECT key FROM ai_response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+        conn = self._connection()
+        conn.execute("DELETE FROM ai_response_cache")
+        conn.commit()
+
+
+class ResponseCache:
+    """Two-tier cache for AI generations: in-process LRU in front of an optional persistent tier"""
+
+    def __init__(self, memory: Optional[LRUCacheTier] = None, persistent=None):
+        self.memory = memory if memory is not None else LRUCacheTier()
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _get_persistent(self, key: str) -> Optional[str]:
+        try:
+            value = self.persistent.get(key)
+        except sqlite3.Error as e:
+            print(f"AI cache read error: {str(e)}")
+            return None
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def _set_persistent(self, key: str, value: str):
+        try:
+            self.persistent.set(key, value)
+        except sqlite3.Error as e:
+            print(f"AI cache write error: {str(e)}")
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self._get_persistent(key)
+        return self._count(value)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() for coroutines; the persistent tier's SQLite I/O runs on the default executor"""
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._get_persistent, key)
+        return self._count(value)
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self._set_persistent(key, value)
+
+    async def set_async(self, key: str, value: str):
+        """set() for coroutines; the persistent write runs on the default executor"""
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._set_persistent, key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "persistent": self.persistent is not None
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache configured from the environment"""
+    global _default_cache
+
+    if os.getenv('DEEPSEEK_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            persistent = None
+            cache_path = os.getenv('DEEPSEEK_CACHE_PATH')
+            if cache_path:
+                persistent = SQLiteCacheTier(
+                    cache_path,
+                    ttl_seconds=int(os.getenv('DEEPSEEK_CACHE_TTL', '86400')),
+                    max_entries=int(os.getenv('DEEPSEEK_CACHE_MAX_ENTRIES', '100000'))
+                )
+            _default_cache = ResponseCache(
+                memory=LRUCacheTier(int(os.getenv('DEEPSEEK_CACHE_SIZE', '1024'))),
+                persistent=persistent
+            )
+    return _default_cache
@@ -1,62 +1,343 @@
 import requests
 import json
+import os
 import re
-from typing import Dict, List
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from src.services.ai_cache import ResponseCache, get_default_cache, make_cache_key
+from src.services.resilience import (
+    CircuitBreaker, CircuitOpenError, RateLimiter, RetryPolicy,
+    default_retry_policy, get_circuit_breaker, get_rate_limiter, parse_retry_after
+)
+from src.services.single_flight import SingleFlight, get_single_flight
+from src.services.fair_scheduler import FairScheduler, get_scheduler
+from src.services.usage_meter import current_store_id, usage_meter
+
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com/v1')
+
+# Connection pool defaults: pool_connections is the number of per-host pools
+# kept alive, pool_maxsize the number of sockets kept per host, and pool_block
+# makes callers wait for a free socket instead of opening extra connections.
+DEFAULT_POOL_CONNECTIONS = int(os.getenv('DEEPSEEK_POOL_CONNECTIONS', '4'))
+DEFAULT_POOL_MAXSIZE = int(os.getenv('DEEPSEEK_POOL_MAXSIZE', '32'))
+DEFAULT_POOL_BLOCK = os.getenv('DEEPSEEK_POOL_BLOCK', 'true').lower() == 'true'
+
+# Number of products packed into one chat request in packed mode
+DEFAULT_PACK_SIZE = int(os.getenv('DEEPSEEK_PACK_SIZE', '20'))
+MAX_PACK_SIZE = 50
+
+_shared_sessions = {}
+_shared_sessions_lock = threading.Lock()
+
+
+def get_shared_session(pool_connections: int = None, pool_maxsize: int = None,
+                       pool_block: bool = None) -> requests.Session:
+    """Return the process-wide keep-alive session for the given pool settings"""
+    pool_connections = pool_connections or DEFAULT_POOL_CONNECTIONS
+    pool_maxsize = pool_maxsize or DEFAULT_POOL_MAXSIZE
+    pool_block = DEFAULT_POOL_BLOCK if pool_block is None else pool_block
+    key = (pool_connections, pool_maxsize, pool_block)
+    
+    with _shared_sessions_lock:
+        session = _shared_sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Connection'] = 'keep-alive'
+            _shared_sessions[key] = session
+    return session
+
+
+class DeepSeekAPIError(Exception):
+    """Raised when DeepSeek answers with a non-200 status"""
+    
+    def __init__(self, status_code: int, message: str, retry_after: float = None):
+        super().__init__(f"{status_code} - {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
 
 class DeepSeekAIService:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/v1"
+    FALLBACK_RESPONSES = {
+        "Error occurred": "AI-optimized content (generated with fallback)",
+        "Request timeout": "Professional SEO-optimized content (timeout fallback)",
+        "Service unavailable": "Enhanced content with SEO optimization (service fallback)"
+    }
+    
+    def __init__(self, api_key: str = None, base_url: str = None,
+                 session: Optional[requests.Session] = None,
+                 pool_connections: int = None, pool_maxsize: int = None,
+                 pool_block: bool = None, cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        self.api_key = api_key or os.getenv('DEEPSEEK_API_KEY', '')
+        self.base_url = (base_url or DEEPSEEK_BASE_URL).rstrip('/')
         self.headers = {
-            "Authorization": f"Bearer {api_key}",
+            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         self.model = "deepseek-chat"
+        # Every instance with the same pool settings reuses one keep-alive
+        # session, so the TCP+TLS handshake is paid once per pooled socket
+        self.session = session or get_shared_session(pool_connections, pool_maxsize, pool_block)
+        self.cache = cache if cache is not None else get_default_cache()
+        # Rate limiter and circuit breaker are shared by every client using the same key
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.api_key)
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(self.api_key)
+        self.retry_policy = retry_policy or default_retry_policy()
+        # Identical requests already in flight are shared instead of sent twice
+        self.single_flight = single_flight if single_flight is not None else get_single_flight()
+        # Upstream calls queue per store, weighted by plan, so one big job can't starve other stores
+        self.scheduler = scheduler if scheduler is not None else get_scheduler('deepseek')
     
-    def _make_request(self, messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.7) -> str:
-        """Make request to DeepSeek API with improved error handling"""
+    def _scheduled(self):
+        """Fair-scheduler slot for the store the current call is attributed to"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(current_store_id())
+    
+    def _build_payload(self, messages: List[Dict], max_tokens: int, temperature: float,
+                       response_format: Dict = None) -> Dict:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": False
+        }
+        if response_format:
+            payload["response_format"] = response_format
+        return payload
+    
+    def _estimate_tokens(self, payload: Dict) -> int:
+        # Roughly four characters per token, plus the completion budget
+        prompt_chars = sum(len(message.get("content") or "") for message in payload["messages"])
+        return prompt_chars // 4 + payload["max_tokens"]
+    
+    def _acquire_slot(self, payload: Dict) -> float:
+        """Check the circuit breaker and reserve rate budget; return seconds to wait before sending"""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("DeepSeek circuit breaker is open")
+        return self.rate_limiter.reserve(self._estimate_tokens(payload))
+    
+    def _is_transport_error(self, error: Exception) -> bool:
+        return isinstance(error, requests.exceptions.RequestException)
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt; return the backoff before the next one, or None to give up"""
+        retry_after = None
+        
+        if isinstance(error, DeepSeekAPIError):
+            retryable = self.retry_policy.is_retryable_status(error.status_code)
+            if error.status_code == 429:
+                # Throttled, not down: slow every caller instead of tripping the breaker
+                retry_after = error.retry_after
+                self.rate_limiter.record_throttled(retry_after)
+                self.circuit_breaker.record_success()
+            elif error.status_code >= 500 or error.status_code == 408:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+        elif self._is_transport_error(error):
+            retryable = True
+            self.circuit_breaker.record_failure()
+        else:
+            retryable = False
+            self.circuit_breaker.record_failure()
+        
+        if not retryable or attempt >= self.retry_policy.max_retries:
+            return None
+        return self.retry_policy.delay(attempt, retry_after)
+    
+    def _record_success(self):
+        self.circuit_breaker.record_success()
+        self.rate_limiter.record_success()
+    
+    def _record_usage(self, payload: Dict, usage: Optional[Dict], task_type: str, latency_ms: int):
+        """Meter a finished generation and settle the token bucket against the real usage"""
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if usage:
+            self.rate_limiter.adjust_tokens(prompt_tokens + completion_tokens - self._estimate_tokens(payload))
+        usage_meter.record(task_type, self.model, prompt_tokens, completion_tokens, latency_ms)
+    
+    def _send_completion(self, payload: Dict) -> Tuple[str, Dict]:
+        """Send one chat completion attempt and return the generated text and its usage block"""
+        # Increase timeout for longer content generation
+        timeout = 60 if payload["max_tokens"] > 1000 else 30
+        
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json=payload,
+            timeout=timeout
+        )
+        
+        if response.status_code != 200:
+            raise DeepSeekAPIError(response.status_code, response.text,
+                                   parse_retry_after(response.headers.get("Retry-After")))
+        
+        result = response.json()
+        return result["choices"][0]["message"]["content"].strip(), result.get("usage") or {}
+    
+    def _post_completion(self, payload: Dict) -> Tuple[str, Dict]:
+        """Send a chat completion under the fair scheduler and rate limiter, retrying transient failures"""
+        attempt = 0
+        with self._scheduled():
+            while True:
+                wait = self._acquire_slot(payload)
+                if wait > 0:
+                    time.sleep(wait)
+                
+                try:
+                    content, usage = self._send_completion(payload)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                
+                self._record_success()
+                return content, usage
+    
+    def _coalesced_completion(self, payload: Dict, key: str) -> Tuple[str, Dict, bool]:
+        """_post_completion through the single-flight group; the flag is True when the result was shared"""
+        if self.single_flight is None:
+            return (*self._post_completion(payload), False)
+        
+        led = []
+        
+        def lead():
+            led.append(True)
+            return self._post_completion(payload)
+        
+        content, usage = self.single_flight.do((self.base_url, key), lead)
+        return content, usage, not led
+    
+    def _stream_completion(self, messages: List[Dict], max_tokens: int = 1000,
+                           temperature: float = 0.7, task_type: str = 'ai_generation') -> Iterator[str]:
+        """Stream a chat completion, yielding content deltas as DeepSeek sends them"""
+        payload = self._build_payload(messages, max_tokens, temperature)
+        payload["stream"] = True
+        # Ask for a final usage chunk so streamed generations are metered too
+        payload["stream_options"] = {"include_usage": True}
+        
+        with self._scheduled():
+            yield from self._stream_chunks(payload, task_type)
+    
+    def _stream_chunks(self, payload: Dict, task_type: str) -> Iterator[str]:
+        """Body of _stream_completion, run while holding a fair-scheduler slot"""
+        wait = self._acquire_slot(payload)
+        if wait > 0:
+            time.sleep(wait)
+        
         try:
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "stream": False
-            }
-            
-            # Increase timeout for longer content generation
-            timeout = 60 if max_tokens > 1000 else 30
-            
-            response = requests.post(
+            # The read timeout applies between chunks, not to the whole stream
+            with self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=self.headers,
                 json=payload,
-                timeout=timeout
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"].strip()
-            else:
-                print(f"DeepSeek API Error: {response.status_code} - {response.text}")
-                return self._fallback_response("Error occurred")
+                timeout=(10, 60),
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    error = DeepSeekAPIError(response.status_code, response.text,
+                                             parse_retry_after(response.headers.get("Retry-After")))
+                    self._retry_delay(error, self.retry_policy.max_retries)
+                    raise error
+                self._record_success()
                 
+                started = time.monotonic()
+                usage = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+                
+                self._record_usage(payload, usage, task_type, int((time.monotonic() - started) * 1000))
+        except requests.exceptions.RequestException as e:
+            # Connect/read timeouts and dropped streams count against the breaker like
+            # _post_completion's failures; a started stream cannot be retried, so never back off here
+            self._retry_delay(e, self.retry_policy.max_retries)
+            raise
+    
+    def _make_request(self, messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.7,
+                      use_cache: bool = True, response_format: Dict = None,
+                      cache_validator: Callable[[str], bool] = None,
+                      task_type: str = 'ai_generation') -> str:
+        """Make request to DeepSeek API with improved error handling"""
+        payload = self._build_payload(messages, max_tokens, temperature, response_format)
+        
+        key = make_cache_key(payload)
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = key
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                usage_meter.record(task_type, self.model, cache_hit=True)
+                return cached
+        
+        started = time.monotonic()
+        try:
+            content, usage, shared = self._coalesced_completion(payload, key)
+        except DeepSeekAPIError as e:
+            print(f"DeepSeek API Error: {str(e)}")
+            return self._fallback_response("Error occurred")
         except requests.exceptions.Timeout:
             print("DeepSeek API Timeout")
             return self._fallback_response("Request timeout")
+        except CircuitOpenError as e:
+            print(f"DeepSeek API unavailable: {str(e)}")
+            return self._fallback_response("Service unavailable")
         except Exception as e:
             print(f"DeepSeek API Exception: {str(e)}")
             return self._fallback_response("Service unavailable")
+        
+        if shared:
+            # The leader already metered the upstream call and filled the cache
+            usage_meter.record(task_type, self.model, cache_hit=True)
+            return content
+        
+        self._record_usage(payload, usage, task_type, int((time.monotonic() - started) * 1000))
+        
+        # Only real generations reach the cache, fallback strings never do
+        if cache_key is not None and (cache_validator is None or cache_validator(content)):
+            self.cache.set(cache_key, content)
+        return content
     
     def _fallback_response(self, error_type: str) -> str:
         """Provide fallback response when API fails"""
-        fallbacks = {
-            "Error occurred": "AI-optimized content (generated with fallback)",
-            "Request timeout": "Professional SEO-optimized content (timeout fallback)",
-            "Service unavailable": "Enhanced content with SEO optimization (service fallback)"
-        }
-        return fallbacks.get(error_type, "Optimized content")
+        return self.FALLBACK_RESPONSES.get(error_type, "Optimized content")
+    
+    def is_fallback_response(self, text: str) -> bool:
+        """True when text is one of the canned strings returned after an API failure"""
+        return text in self.FALLBACK_RESPONSES.values()
     
     def detect_language(self, text: str) -> str:
         """Detect language of the input text"""
@@ -72,15 +353,8 @@ class DeepSeekAIService:
         else:
             return 'en'
     
-    def generate_title(self, product_title: str, product_description: str, 
-                      language: str = "en", keywords: List[str] = None) -> Dict:
-        """Generate SEO-optimized title using DeepSeek AI"""
-        
-        if not language:
-            language = self.detect_language(product_title + " " + product_description)
-        
-        keywords = keywords or []
-        
+    def _title_messages(self, product_title: str, product_description: str,
+                        language: str, keywords: List[str]) -> List[Dict]:
         language_prompts = {
             "en": "You are an SEO expert. Create compelling, search-optimized product titles that rank well on Google.",
             "es": "Eres un experto en SEO. Crea títulos de productos convincentes y optimizados para búsquedas que se posicionen bien en Google.",
@@ -92,7 +366,7 @@ class DeepSeekAIService:
         base_prompt = language_prompts.get(language, language_prompts["en"])
         keywords_text = f"Target keywords: {', '.join(keywords)}" if keywords else ""
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": f"{base_prompt} Guidelines: 1) Keep under 60 characters 2) Include main keywords naturally 3) Make it compelling for clicks 4) Avoid keyword stuffing"
@@ -102,9 +376,9 @@ class DeepSeekAIService:
                 "content": f"Original title: {product_title}\nDescription: {product_description}\n{keywords_text}\nLanguage: {language}\n\nCreate an SEO-optimized title:"
             }
         ]
-        
-        optimized_title = self._make_request(messages, max_tokens=100, temperature=0.7)
-        
+    
+    def _title_result(self, product_title: str, optimized_title: str,
+                      language: str, keywords: List[str]) -> Dict:
         return {
             "original_title": product_title,
             "optimized_title": optimized_title,
@@ -117,15 +391,158 @@ class DeepSeekAIService:
             "timestamp": datetime.utcnow().isoformat()
         }
     
-    def generate_description(self, product_title: str, product_description: str,
-                           language: str = "en", keywords: List[str] = None) -> Dict:
-        """Generate SEO-optimized description using DeepSeek AI"""
+    def generate_title(self, product_title: str, product_description: str, 
+                      language: str = "en", keywords: List[str] = None,
+                      use_cache: bool = True) -> Dict:
+        """Generate SEO-optimized title using DeepSeek AI"""
         
         if not language:
             language = self.detect_language(product_title + " " + product_description)
         
         keywords = keywords or []
+        messages = self._title_messages(product_title, product_description, language, keywords)
+        
+        optimized_title = self._make_request(messages, max_tokens=100, temperature=0.7, use_cache=use_cache,
+                                             task_type='title_generation')
         
+        return self._title_result(product_title, optimized_title, language, keywords)
+    
+    def _pack_groups(self, items: List[Dict], pack_size: int = None) -> List[List[int]]:
+        """Split item indices into packs of at most pack_size, never mixing languages"""
+        pack_size = max(1, min(pack_size or DEFAULT_PACK_SIZE, MAX_PACK_SIZE))
+        by_language = {}
+        for index, item in enumerate(items):
+            by_language.setdefault(item.get("language") or "en", []).append(index)
+        
+        packs = []
+        for indices in by_language.values():
+            for start in range(0, len(indices), pack_size):
+                packs.append(indices[start:start + pack_size])
+        return packs
+    
+    def _packed_messages(self, task: str, entries: List[Dict], item_schema: str,
+                         language: str) -> List[Dict]:
+        return [
+            {
+                "role": "system",
+                "content": f"{task} Write every answer in language '{language}'. "
+                           f"Respond only with a JSON object of the form {{\"items\": [{item_schema}]}} "
+                           f"containing exactly one item for every input id."
+            },
+            {
+                "role": "user",
+                "content": json.dumps(entries, ensure_ascii=False)
+            }
+        ]
+    
+    def _parse_packed_items(self, content: str, expected_ids: List[str], field: str,
+                            validator: Callable) -> Dict[str, object]:
+        """Extract the valid per-id values from a packed JSON response"""
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return {}
+        
+        items = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return {}
+        
+        parsed = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            item_id = str(item.get("id"))
+            value = item.get(field)
+            if item_id in expected_ids and item_id not in parsed and validator(value):
+                parsed[item_id] = value
+        return parsed
+    
+    def _is_valid_packed_title(self, value) -> bool:
+        return isinstance(value, str) and 0 < len(value.strip()) <= 150
+    
+    def _is_valid_packed_keywords(self, value) -> bool:
+        return isinstance(value, list) and bool(value) and all(
+            isinstance(keyword, str) and keyword.strip() for keyword in value
+        )
+    
+    def _packed_titles_request(self, products: List[Dict], indices: List[int]) -> Dict:
+        language = products[indices[0]].get("language") or "en"
+        entries = [{
+            "id": str(position),
+            "title": products[index].get("product_title", ""),
+            "description": (products[index].get("product_description") or "")[:300],
+            "keywords": products[index].get("keywords") or []
+        } for position, index in enumerate(indices)]
+        
+        messages = self._packed_messages(
+            "You are an SEO expert. Create a compelling, search-optimized title for each product. "
+            "Guidelines: 1) Keep under 60 characters 2) Include main keywords naturally "
+            "3) Make it compelling for clicks 4) Avoid keyword stuffing.",
+            entries,
+            '{"id": "<id>", "title": "<optimized title>"}',
+            language
+        )
+        return {
+            "messages": messages,
+            "max_tokens": 40 * len(indices) + 50,
+            "expected_ids": [entry["id"] for entry in entries]
+        }
+    
+    def _packed_keywords_request(self, topics: List[Dict], indices: List[int], count: int) -> Dict:
+        language = topics[indices[0]].get("language") or "en"
+        entries = [{"id": str(position), "topic": topics[index]["topic"]}
+                   for position, index in enumerate(indices)]
+        
+        messages = self._packed_messages(
+            f"You are an SEO keyword research expert. Generate {count} relevant, high-value keywords for each topic.",
+            entries,
+            '{"id": "<id>", "keywords": ["keyword1", "keyword2"]}',
+            language
+        )
+        return {
+            "messages": messages,
+            "max_tokens": 8 * count * len(indices) + 50,
+            "expected_ids": [entry["id"] for entry in entries]
+        }
+    
+    def generate_titles_packed(self, products: List[Dict], pack_size: int = None,
+                               use_cache: bool = True) -> List[Dict]:
+        """Generate titles for many products, several products per chat request
+        
+        Each product is a dict with product_title, product_description, language
+        and keywords. Items whose packed answer is missing or invalid are retried
+        with a single generate_title call, so the output always lines up with
+        the input.
+        """
+        results = [None] * len(products)
+        
+        for indices in self._pack_groups(products, pack_size):
+            packed = self._packed_titles_request(products, indices)
+            validate = lambda content: bool(self._parse_packed_items(
+                content, packed["expected_ids"], "title", self._is_valid_packed_title))
+            content = self._make_request(packed["messages"], max_tokens=packed["max_tokens"], temperature=0.7,
+                                         use_cache=use_cache, response_format={"type": "json_object"},
+                                         cache_validator=validate, task_type='title_generation')
+            titles = self._parse_packed_items(content, packed["expected_ids"], "title",
+                                              self._is_valid_packed_title)
+            
+            for position, index in enumerate(indices):
+                product = products[index]
+                language = product.get("language") or "en"
+                keywords = product.get("keywords") or []
+                title = titles.get(str(position))
+                if title is None:
+                    results[index] = self.generate_title(product.get("product_title", ""),
+                                                         product.get("product_description", ""),
+                                                         language, keywords, use_cache=use_cache)
+                else:
+                    results[index] = self._title_result(product.get("product_title", ""), title.strip(),
+                                                        language, keywords)
+        
+        return results
+    
+    def _description_messages(self, product_title: str, product_description: str,
+                              language: str, keywords: List[str]) -> List[Dict]:
         language_prompts = {
             "en": "You are an SEO copywriter. Create compelling product descriptions that convert visitors and rank well in search engines.",
             "es": "Eres un redactor SEO. Crea descripciones de productos convincentes que conviertan visitantes y se posicionen bien en motores de búsqueda.",
@@ -137,7 +554,7 @@ class DeepSeekAIService:
         base_prompt = language_prompts.get(language, language_prompts["en"])
         keywords_text = f"Target keywords: {', '.join(keywords)}" if keywords else ""
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": f"{base_prompt} Guidelines: 1) Write 150-300 words 2) Include keywords naturally 3) Focus on benefits 4) Include call-to-action 5) Use bullet points for features"
@@ -147,9 +564,9 @@ class DeepSeekAIService:
                 "content": f"Product: {product_title}\nCurrent description: {product_description}\n{keywords_text}\nLanguage: {language}\n\nCreate an SEO-optimized description:"
             }
         ]
-        
-        optimized_description = self._make_request(messages, max_tokens=400, temperature=0.7)
-        
+    
+    def _description_result(self, product_description: str, optimized_description: str,
+                            language: str, keywords: List[str]) -> Dict:
         return {
             "original_description": product_description,
             "optimized_description": optimized_description,
@@ -162,10 +579,23 @@ class DeepSeekAIService:
             "timestamp": datetime.utcnow().isoformat()
         }
     
-    def generate_blog_article(self, topic: str, target_keywords: List[str] = None,
-                            length: str = "medium", language: str = "en") -> Dict:
-        """Generate SEO-optimized blog article using DeepSeek AI"""
+    def generate_description(self, product_title: str, product_description: str,
+                           language: str = "en", keywords: List[str] = None,
+                           use_cache: bool = True) -> Dict:
+        """Generate SEO-optimized description using DeepSeek AI"""
+        
+        if not language:
+            language = self.detect_language(product_title + " " + product_description)
         
+        keywords = keywords or []
+        messages = self._description_messages(product_title, product_description, language, keywords)
+        
+        optimized_description = self._make_request(messages, max_tokens=400, temperature=0.7, use_cache=use_cache,
+                                                   task_type='description_generation')
+        
+        return self._description_result(product_description, optimized_description, language, keywords)
+    
+    def _blog_spec(self, length: str) -> Dict:
         # Simplified length specs for faster generation
         length_specs = {
             "short": {"words": "300-500", "max_tokens": 600},
@@ -173,13 +603,13 @@ class DeepSeekAIService:
             "long": {"words": "800-1200", "max_tokens": 1400}
         }
         
-        spec = length_specs.get(length, length_specs["short"])  # Default to short for speed
-        target_keywords = target_keywords or []
-        
+        return length_specs.get(length, length_specs["short"])  # Default to short for speed
+    
+    def _blog_messages(self, topic: str, target_keywords: List[str], spec: Dict) -> List[Dict]:
         # Simplified prompt for faster generation
         keywords_text = f"Keywords: {', '.join(target_keywords[:3])}" if target_keywords else ""
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": "You are an SEO content writer. Write concise, engaging blog articles with clear structure."
@@ -189,25 +619,25 @@ class DeepSeekAIService:
                 "content": f"Write a {spec['words']} word blog article about: {topic}\n{keywords_text}\nInclude: title, introduction, 2-3 main points, conclusion."
             }
         ]
-        
-        try:
-            article_content = self._make_request(messages, max_tokens=spec["max_tokens"], temperature=0.7)
-            
-            return {
-                "topic": topic,
-                "content": article_content,
-                "meta_description": f"Learn about {topic} with expert insights and practical tips.",
-                "language": language,
-                "length": length,
-                "target_keywords": target_keywords,
-                "word_count": len(article_content.split()),
-                "seo_score": self._calculate_blog_seo_score(article_content, target_keywords),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        except Exception as e:
-            print(f"Blog generation error: {str(e)}")
-            # Quick fallback
-            fallback_content = f"""# {topic}
+    
+    def _blog_result(self, topic: str, article_content: str, target_keywords: List[str],
+                     length: str, language: str) -> Dict:
+        return {
+            "topic": topic,
+            "content": article_content,
+            "meta_description": f"Learn about {topic} with expert insights and practical tips.",
+            "language": language,
+            "length": length,
+            "target_keywords": target_keywords,
+            "word_count": len(article_content.split()),
+            "seo_score": self._calculate_blog_seo_score(article_content, target_keywords),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def _blog_fallback_result(self, topic: str, target_keywords: List[str],
+                              length: str, language: str) -> Dict:
+        # Quick fallback
+        fallback_content = f"""# {topic}
 
 ## Introduction
 This guide covers the essential aspects of {topic}.
@@ -223,17 +653,44 @@ Understanding {topic} requires careful consideration of various factors.
 ## Conclusion
 {topic} is an important consideration for success in today's market.
 """
-            return {
-                "topic": topic,
-                "content": fallback_content,
-                "meta_description": f"Complete guide to {topic}",
-                "language": language,
-                "length": length,
-                "target_keywords": target_keywords,
-                "word_count": len(fallback_content.split()),
-                "seo_score": 70,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+        return {
+            "topic": topic,
+            "content": fallback_content,
+            "meta_description": f"Complete guide to {topic}",
+            "language": language,
+            "length": length,
+            "target_keywords": target_keywords,
+            "word_count": len(fallback_content.split()),
+            "seo_score": 70,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def generate_blog_article(self, topic: str, target_keywords: List[str] = None,
+                            length: str = "medium", language: str = "en") -> Dict:
+        """Generate SEO-optimized blog article using DeepSeek AI"""
+        
+        spec = self._blog_spec(length)
+        target_keywords = target_keywords or []
+        messages = self._blog_messages(topic, target_keywords, spec)
+        
+        try:
+            # Regenerating an article should give a fresh draft, so skip the cache
+            article_content = self._make_request(messages, max_tokens=spec["max_tokens"], temperature=0.7,
+                                                 use_cache=False, task_type='blog_generation')
+            
+            return self._blog_result(topic, article_content, target_keywords, length, language)
+        except Exception as e:
+            print(f"Blog generation error: {str(e)}")
+            return self._blog_fallback_result(topic, target_keywords, length, language)
+    
+    def stream_blog_article(self, topic: str, target_keywords: List[str] = None,
+                            length: str = "medium") -> Iterator[str]:
+        """Stream a blog article token by token; build the final result with _blog_result"""
+        spec = self._blog_spec(length)
+        messages = self._blog_messages(topic, target_keywords or [], spec)
+        
+        return self._stream_completion(messages, max_tokens=spec["max_tokens"], temperature=0.7,
+                                       task_type='blog_generation')
     
     def _calculate_seo_score(self, content: str, keywords: List[str]) -> int:
         """Calculate SEO score based on content analysis"""
@@ -264,9 +721,7 @@ Understanding {topic} requires careful consideration of various factors.
         return min(score, 95)
 
 
-    def generate_keywords(self, topic: str, language: str = "en", count: int = 10) -> Dict:
-        """Generate relevant keywords using DeepSeek AI"""
-        
+    def _keywords_messages(self, topic: str, language: str, count: int) -> List[Dict]:
         language_prompts = {
             "en": "You are an SEO keyword research expert. Generate relevant, high-value keywords.",
             "es": "Eres un experto en investigación de palabras clave SEO. Genera palabras clave relevantes y de alto valor.",
@@ -277,7 +732,7 @@ Understanding {topic} requires careful consideration of various factors.
         
         base_prompt = language_prompts.get(language, language_prompts["en"])
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": f"{base_prompt} Provide {count} keywords as a simple comma-separated list."
@@ -287,42 +742,77 @@ Understanding {topic} requires careful consideration of various factors.
                 "content": f"Generate {count} SEO keywords for: {topic}\nLanguage: {language}\nFormat: keyword1, keyword2, keyword3..."
             }
         ]
+    
+    def _keywords_result(self, topic: str, keywords_text: str, language: str, count: int) -> Dict:
+        keywords = [kw.strip() for kw in keywords_text.split(',') if kw.strip()]
+        
+        return {
+            "topic": topic,
+            "language": language,
+            "keywords": keywords[:count],
+            "count": len(keywords[:count]),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def _keywords_fallback_result(self, topic: str, language: str, count: int) -> Dict:
+        # Fallback keywords
+        fallback_keywords = [
+            f"{topic}",
+            f"best {topic}",
+            f"{topic} guide",
+            f"professional {topic}",
+            f"{topic} tips"
+        ]
+        return {
+            "topic": topic,
+            "language": language,
+            "keywords": fallback_keywords[:count],
+            "count": len(fallback_keywords[:count]),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def generate_keywords(self, topic: str, language: str = "en", count: int = 10,
+                          use_cache: bool = True) -> Dict:
+        """Generate relevant keywords using DeepSeek AI"""
+        
+        messages = self._keywords_messages(topic, language, count)
         
         try:
-            keywords_text = self._make_request(messages, max_tokens=200, temperature=0.5)
-            keywords = [kw.strip() for kw in keywords_text.split(',') if kw.strip()]
-            
-            return {
-                "topic": topic,
-                "language": language,
-                "keywords": keywords[:count],
-                "count": len(keywords[:count]),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            keywords_text = self._make_request(messages, max_tokens=200, temperature=0.5, use_cache=use_cache,
+                                               task_type='keyword_generation')
+            return self._keywords_result(topic, keywords_text, language, count)
         except Exception as e:
             print(f"Keyword generation error: {str(e)}")
-            # Fallback keywords
-            fallback_keywords = [
-                f"{topic}",
-                f"best {topic}",
-                f"{topic} guide",
-                f"professional {topic}",
-                f"{topic} tips"
-            ]
-            return {
-                "topic": topic,
-                "language": language,
-                "keywords": fallback_keywords[:count],
-                "count": len(fallback_keywords[:count]),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            return self._keywords_fallback_result(topic, language, count)
     
-    def analyze_seo_content(self, title: str = "", description: str = "", 
-                          content: str = "", language: str = "en") -> Dict:
-        """Perform SEO analysis using DeepSeek AI"""
-        
-        combined_content = f"{title} {description} {content}".strip()
-        
+    def generate_keywords_packed(self, topics: List[Dict], count: int = 10, pack_size: int = None,
+                                 use_cache: bool = True) -> List[Dict]:
+        """Generate keywords for many topics ({"topic", "language"} dicts), several per chat request"""
+        results = [None] * len(topics)
+        
+        for indices in self._pack_groups(topics, pack_size):
+            packed = self._packed_keywords_request(topics, indices, count)
+            validate = lambda content: bool(self._parse_packed_items(
+                content, packed["expected_ids"], "keywords", self._is_valid_packed_keywords))
+            content = self._make_request(packed["messages"], max_tokens=packed["max_tokens"], temperature=0.5,
+                                         use_cache=use_cache, response_format={"type": "json_object"},
+                                         cache_validator=validate, task_type='keyword_generation')
+            keyword_lists = self._parse_packed_items(content, packed["expected_ids"], "keywords",
+                                                     self._is_valid_packed_keywords)
+            
+            for position, index in enumerate(indices):
+                topic = topics[index]["topic"]
+                language = topics[index].get("language") or "en"
+                keywords = keyword_lists.get(str(position))
+                if keywords is None:
+                    results[index] = self.generate_keywords(topic, language, count, use_cache=use_cache)
+                else:
+                    results[index] = self._keywords_result(topic, ", ".join(keywords), language, count)
+        
+        return results
+    
+    def _analysis_messages(self, title: str, description: str, content: str,
+                           language: str) -> List[Dict]:
         language_prompts = {
             "en": "You are an SEO analyst. Analyze content and provide actionable recommendations.",
             "es": "Eres un analista SEO. Analiza el contenido y proporciona recomendaciones accionables.",
@@ -333,7 +823,7 @@ Understanding {topic} requires careful consideration of various factors.
         
         base_prompt = language_prompts.get(language, language_prompts["en"])
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": f"{base_prompt} Provide a brief analysis with 3-5 specific recommendations."
@@ -343,53 +833,66 @@ Understanding {topic} requires careful consideration of various factors.
                 "content": f"Analyze this content for SEO:\nTitle: {title}\nDescription: {description}\nContent: {content[:500]}...\nLanguage: {language}"
             }
         ]
+    
+    def _analysis_result(self, title: str, description: str, content: str,
+                         analysis_text: str, language: str) -> Dict:
+        # Extract recommendations (simple parsing)
+        recommendations = []
+        if "1." in analysis_text or "•" in analysis_text:
+            lines = analysis_text.split('\n')
+            for line in lines:
+                if any(marker in line for marker in ['1.', '2.', '3.', '4.', '5.', '•', '-']):
+                    recommendations.append(line.strip())
+        
+        if not recommendations:
+            recommendations = [
+                "Optimize title length (50-60 characters)",
+                "Include target keywords naturally",
+                "Improve meta description",
+                "Add relevant internal links"
+            ]
+        
+        seo_score = self._calculate_content_seo_score(title, description, content)
+        
+        return {
+            "title": title,
+            "description": description,
+            "language": language,
+            "seo_score": seo_score,
+            "analysis": analysis_text,
+            "recommendations": recommendations[:5],
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def _analysis_fallback_result(self, title: str, description: str, language: str) -> Dict:
+        return {
+            "title": title,
+            "description": description,
+            "language": language,
+            "seo_score": 65,
+            "analysis": "Content analysis completed with basic SEO evaluation.",
+            "recommendations": [
+                "Optimize title for search engines",
+                "Enhance meta description",
+                "Include relevant keywords",
+                "Improve content structure"
+            ],
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def analyze_seo_content(self, title: str = "", description: str = "", 
+                          content: str = "", language: str = "en") -> Dict:
+        """Perform SEO analysis using DeepSeek AI"""
+        
+        messages = self._analysis_messages(title, description, content, language)
         
         try:
-            analysis_text = self._make_request(messages, max_tokens=300, temperature=0.3)
-            
-            # Extract recommendations (simple parsing)
-            recommendations = []
-            if "1." in analysis_text or "•" in analysis_text:
-                lines = analysis_text.split('\n')
-                for line in lines:
-                    if any(marker in line for marker in ['1.', '2.', '3.', '4.', '5.', '•', '-']):
-                        recommendations.append(line.strip())
-            
-            if not recommendations:
-                recommendations = [
-                    "Optimize title length (50-60 characters)",
-                    "Include target keywords naturally",
-                    "Improve meta description",
-                    "Add relevant internal links"
-                ]
-            
-            seo_score = self._calculate_content_seo_score(title, description, content)
-            
-            return {
-                "title": title,
-                "description": description,
-                "language": language,
-                "seo_score": seo_score,
-                "analysis": analysis_text,
-                "recommendations": recommendations[:5],
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            analysis_text = self._make_request(messages, max_tokens=300, temperature=0.3,
+                                               task_type='seo_audit')
+            return self._analysis_result(title, description, content, analysis_text, language)
         except Exception as e:
             print(f"SEO analysis error: {str(e)}")
-            return {
-                "title": title,
-                "description": description,
-                "language": language,
-                "seo_score": 65,
-                "analysis": "Content analysis completed with basic SEO evaluation.",
-                "recommendations": [
-                    "Optimize title for search engines",
-                    "Enhance meta description",
-                    "Include relevant keywords",
-                    "Improve content structure"
-                ],
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            return self._analysis_fallback_result(title, description, language)
     
     def _calculate_content_seo_score(self, title: str, description: str, content: str) -> int:
         """Calculate SEO score for content analysis"""
@@ -405,4 +908,3 @@ Understanding {topic} requires careful consideration of various factors.
             score += 10
         
         return min(score, 95)
-
@@ -0,0 +1,375 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.services.ai_cache import ResponseCache, make_cache_key
+from src.services.deepseek_ai import DeepSeekAIService, DeepSeekAPIError
+from src.services.resilience import (
+    CircuitBreaker, CircuitOpenError, RateLimiter, RetryPolicy, parse_retry_after
+)
+from src.services.single_flight import SingleFlight
+from src.services.fair_scheduler import FairScheduler
+from src.services.usage_meter import current_store_id, usage_meter
+
+# Upper bound on in-flight DeepSeek requests per API key, per event loop
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('DEEPSEEK_MAX_CONCURRENCY', '64'))
+
+_semaphores = weakref.WeakKeyDictionary()
+_semaphores_lock = threading.Lock()
+
+
+def get_api_key_semaphore(api_key: str, limit: int = None) -> asyncio.Semaphore:
+    """Return the semaphore shared by every async client using this API key on the running loop"""
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        per_key = _semaphores.setdefault(loop, {})
+        semaphore = per_key.get(api_key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit or DEFAULT_MAX_CONCURRENCY)
+            per_key[api_key] = semaphore
+    return semaphore
+
+
+class AsyncDeepSeekAIService(DeepSeekAIService):
+    """asyncio-native DeepSeek client
+
+    Prompts, scoring and fallbacks are inherited from DeepSeekAIService; only
+    the transport differs. Calls made with the same API key share one
+    semaphore, so fanning out hundreds of coroutines never puts more than
+    max_concurrency requests on the wire at once.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None,
+                 max_concurrency: int = None, cache: Optional[ResponseCache] = None,
+                 client: Optional[httpx.AsyncClient] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        super().__init__(api_key, base_url, cache=cache, rate_limiter=rate_limiter,
+                         circuit_breaker=circuit_breaker, retry_policy=retry_policy,
+                         single_flight=single_flight, scheduler=scheduler)
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self._client = client
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is not None:
+            return self._client
+
+        # httpx clients are bound to the loop that first uses them
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._clients[loop] = client
+        return client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def _is_transport_error(self, error: Exception) -> bool:
+        return isinstance(error, httpx.TransportError)
+
+    def _scheduled_async(self):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot_async(current_store_id())
+
+    async def _send_completion_async(self, payload: Dict) -> Tuple[str, Dict]:
+        """Send one chat completion attempt and return the generated text and its usage block"""
+        timeout = 60 if payload["max_tokens"] > 1000 else 30
+
+        async with get_api_key_semaphore(self.api_key, self.max_concurrency):
+            response = await self._get_client().post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                timeout=timeout
+            )
+
+        if response.status_code != 200:
+            raise DeepSeekAPIError(response.status_code, response.text,
+                                   parse_retry_after(response.headers.get("Retry-After")))
+
+        result = response.json()
+        return result["choices"][0]["message"]["content"].strip(), result.get("usage") or {}
+
+    async def _post_completion_async(self, payload: Dict) -> Tuple[str, Dict]:
+        """Send a chat completion under the fair scheduler and shared rate limiter, retrying transient failures"""
+        attempt = 0
+        async with self._scheduled_async():
+            while True:
+                wait = self._acquire_slot(payload)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                try:
+                    content, usage = await self._send_completion_async(payload)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                self._record_success()
+                return content, usage
+
+    async def _coalesced_completion_async(self, payload: Dict, key: str) -> Tuple[str, Dict, bool]:
+        """Async counterpart of _coalesced_completion; shares calls with threads too"""
+        if self.single_flight is None:
+            return (*await self._post_completion_async(payload), False)
+
+        led = []
+
+        def lead():
+            led.append(True)
+            return self._post_completion_async(payload)
+
+        content, usage = await self.single_flight.do_async((self.base_url, key), lead)
+        return content, usage, not led
+
+    async def _make_request_async(self, messages: List[Dict], max_tokens: int = 1000,
+                                  temperature: float = 0.7, use_cache: bool = True,
+                                  response_format: Dict = None,
+                                  cache_validator: Callable[[str], bool] = None,
+                                  task_type: str = 'ai_generation') -> str:
+        """Async counterpart of _make_request with the same cache and fallback rules"""
+        payload = self._build_payload(messages, max_tokens, temperature, response_format)
+
+        key = make_cache_key(payload)
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = key
+            cached = await self.cache.get_async(cache_key)
+            if cached is not None:
+                usage_meter.record(task_type, self.model, cache_hit=True)
+                return cached
+
+        started = time.monotonic()
+        try:
+            content, usage, shared = await self._coalesced_completion_async(payload, key)
+        except DeepSeekAPIError as e:
+            print(f"DeepSeek API Error: {str(e)}")
+            return self._fallback_response("Error occurred")
+        except httpx.TimeoutException:
+            print("DeepSeek API Timeout")
+            return self._fallback_response("Request timeout")
+        except CircuitOpenError as e:
+            print(f"DeepSeek API unavailable: {str(e)}")
+            return self._fallback_response("Service unavailable")
+        except Exception as e:
+            print(f"DeepSeek API Exception: {str(e)}")
+            return self._fallback_response("Service unavailable")
+
+        if shared:
+            usage_meter.record(task_type, self.model, cache_hit=True)
+            return content
+
+        self._record_usage(payload, usage, task_type, int((time.monotonic() - started) * 1000))
+
+        if cache_key is not None and (cache_validator is None or cache_validator(content)):
+            await self.cache.set_async(cache_key, content)
+        return content
+
+    async def generate_title(self, product_title: str, product_description: str,
+                             language: str = "en", keywords: List[str] = None,
+                             use_cache: bool = True) -> Dict:
+        """Generate SEO-optimized title using DeepSeek AI"""
+        if not language:
+            language = self.detect_language(product_title + " " + product_description)
+
+        keywords = keywords or []
+        messages = self._title_messages(product_title, product_description, language, keywords)
+
+        optimized_title = await self._make_request_async(messages, max_tokens=100, temperature=0.7,
+                                                         use_cache=use_cache, task_type='title_generation')
+
+        return self._title_result(product_title, optimized_title, language, keywords)
+
+    async def generate_titles_packed(self, products: List[Dict], pack_size: int = None,
+                                     use_cache: bool = True) -> List[Dict]:
+        """Packed title generation; packs and single-item fallbacks run concurrently"""
+        results = [None] * len(products)
+
+        async def run_pack(indices):
+            packed = self._packed_titles_request(products, indices)
+            validate = lambda content: bool(self._parse_packed_items(
+                content, packed["expected_ids"], "title", self._is_valid_packed_title))
+            content = await self._make_request_async(packed["messages"], max_tokens=packed["max_tokens"],
+                                                     temperature=0.7, use_cache=use_cache,
+                                                     response_format={"type": "json_object"},
+                                                     cache_validator=validate, task_type='title_generation')
+            titles = self._parse_packed_items(content, packed["expected_ids"], "title",
+                                              self._is_valid_packed_title)
+
+            retries = []
+            for position, index in enumerate(indices):
+                product = products[index]
+                language = product.get("language") or "en"
+                keywords = product.get("keywords") or []
+                title = titles.get(str(position))
+                if title is None:
+                    retries.append((index, self.generate_title(product.get("product_title", ""),
+                                                               product.get("product_description", ""),
+                                                               language, keywords, use_cache=use_cache)))
+                else:
+                    results[index] = self._title_result(product.get("product_title", ""), title.strip(),
+                                                        language, keywords)
+
+            for index, result in zip([index for index, _ in retries],
+                                     await asyncio.gather(*(coro for _, coro in retries))):
+                results[index] = result
+
+        await asyncio.gather(*(run_pack(indices) for indices in self._pack_groups(products, pack_size)))
+        return results
+
+    async def generate_description(self, product_title: str, product_description: str,
+                                   language: str = "en", keywords: List[str] = None,
+                                   use_cache: bool = True) -> Dict:
+        """Generate SEO-optimized description using DeepSeek AI"""
+        if not language:
+            language = self.detect_language(product_title + " " + product_description)
+
+        keywords = keywords or []
+        messages = self._description_messages(product_title, product_description, language, keywords)
+
+        optimized_description = await self._make_request_async(messages, max_tokens=400, temperature=0.7,
+                                                               use_cache=use_cache,
+                                                               task_type='description_generation')
+
+        return self._description_result(product_description, optimized_description, language, keywords)
+
+    async def generate_blog_article(self, topic: str, target_keywords: List[str] = None,
+                                    length: str = "medium", language: str = "en") -> Dict:
+        """Generate SEO-optimized blog article using DeepSeek AI"""
+        spec = self._blog_spec(length)
+        target_keywords = target_keywords or []
+        messages = self._blog_messages(topic, target_keywords, spec)
+
+        try:
+            article_content = await self._make_request_async(messages, max_tokens=spec["max_tokens"],
+                                                             temperature=0.7, use_cache=False,
+                                                             task_type='blog_generation')
+            return self._blog_result(topic, article_content, target_keywords, length, language)
+        except Exception as e:
+            print(f"Blog generation error: {str(e)}")
+            return self._blog_fallback_result(topic, target_keywords, length, language)
+
+    async def generate_keywords(self, topic: str, language: str = "en", count: int = 10,
+                                use_cache: bool = True) -> Dict:
+        """Generate relevant keywords using DeepSeek AI"""
+        messages = self._keywords_messages(topic, language, count)
+
+        try:
+            keywords_text = await self._make_request_async(messages, max_tokens=200, temperature=0.5,
+                                                           use_cache=use_cache,
+                                                           task_type='keyword_generation')
+            return self._keywords_result(topic, keywords_text, language, count)
+        except Exception as e:
+            print(f"Keyword generation error: {str(e)}")
+            return self._keywords_fallback_result(topic, language, count)
+
+    async def generate_keywords_packed(self, topics: List[Dict], count: int = 10, pack_size: int = None,
+                                       use_cache: bool = True) -> List[Dict]:
+        """Packed keyword generation; packs and single-item fallbacks run concurrently"""
+        results = [None] * len(topics)
+
+        async def run_pack(indices):
+            packed = self._packed_keywords_request(topics, indices, count)
+            validate = lambda content: bool(self._parse_packed_items(
+                content, packed["expected_ids"], "keywords", self._is_valid_packed_keywords))
+            content = await self._make_request_async(packed["messages"], max_tokens=packed["max_tokens"],
+                                                     temperature=0.5, use_cache=use_cache,
+                                                     response_format={"type": "json_object"},
+                                                     cache_validator=validate, task_type='keyword_generation')
+            keyword_lists = self._parse_packed_items(content, packed["expected_ids"], "keywords",
+                                                     self._is_valid_packed_keywords)
+
+            retries = []
+            for position, index in enumerate(indices):
+                topic = topics[index]["topic"]
+                language = topics[index].get("language") or "en"
+                keywords = keyword_lists.get(str(position))
+                if keywords is None:
+                    retries.append((index, self.generate_keywords(topic, language, count, use_cache=use_cache)))
+                else:
+                    results[index] = self._keywords_result(topic, ", ".join(keywords), language, count)
+
+            for index, result in zip([index for index, _ in retries],
+                                     await asyncio.gather(*(coro for _, coro in retries))):
+                results[index] = result
+
+        await asyncio.gather(*(run_pack(indices) for indices in self._pack_groups(topics, pack_size)))
+        return results
+
+    async def analyze_seo_content(self, title: str = "", description: str = "",
+                                  content: str = "", language: str = "en") -> Dict:
+        """Perform SEO analysis using DeepSeek AI"""
+        messages = self._analysis_messages(title, description, content, language)
+
+        try:
+            analysis_text = await self._make_request_async(messages, max_tokens=300, temperature=0.3,
+                                                           task_type='seo_audit')
+            return self._analysis_result(title, description, content, analysis_text, language)
+        except Exception as e:
+            print(f"SEO analysis error: {str(e)}")
+            return self._analysis_fallback_result(title, description, language)
+
+
+class _BackgroundLoop:
+    """A single event loop running in a daemon thread, used to drive coroutines from sync code"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='deepseek-async-loop', daemon=True)
+                thread.start()
+                self._loop = loop
+        return self._loop
+
+
+_background_loop = _BackgroundLoop()
+
+
+def run_sync(coro: Awaitable, timeout: float = None):
+    """Sync facade: run a coroutine on the shared background loop and wait for its result
+
+    Flask views and other blocking callers use this to drive
+    AsyncDeepSeekAIService without owning an event loop. Because the loop is
+    long-lived, httpx connection pools and semaphores survive between calls.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _background_loop.get())
+    return future.result(timeout)
+
+
+def gather_sync(coros: List[Awaitable], timeout: float = None) -> List:
+    """Run several coroutines concurrently from sync code; exceptions are returned in place"""
+    async def _gather():
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    return run_sync(_gather(), timeout)
@@ -0,0 +1,299 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Hashable, List, Optional
+
+from flask import has_app_context
+
+# Share of the scheduler each plan gets relative to 'free'; unknown plans count as 1
+DEFAULT_PLAN_WEIGHTS = {'free': 1, 'basic': 2, 'professional': 4, 'enterprise': 8}
+
+# Concurrent upstream calls per scheduler when FAIR_<NAME>_CONCURRENCY is not set
+DEFAULT_CAPACITY = {'deepseek': 64, 'shopify': 32}
+
+# Plan weights are looked up in the database at most once per store per TTL
+WEIGHT_CACHE_TTL = 300.0
+
+
+def _parse_plan_weights(value: Optional[str]) -> Dict[str, float]:
+    """Parse FAIR_PLAN_WEIGHTS, e.g. "free=1,professional=4,enterprise=8" """
+    weights = dict(DEFAULT_PLAN_WEIGHTS)
+    for part in (value or '').split(','):
+        plan, _, weight = part.partition('=')
+        if plan.strip() and weight.strip():
+            weights[plan.strip()] = float(weight)
+    return weights
+
+
+class _Waiter:
+    __slots__ = ('key', 'start_tag', 'seq', 'enqueued_at', 'event', 'loop', 'future')
+
+    def __init__(self, key: Hashable, start_tag: float, seq: int, loop=None, future=None):
+        self.key = key
+        self.start_tag = start_tag
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event() if future is None else None
+        self.loop = loop
+        self.future = future
+
+
+class _StoreState:
+    __slots__ = ('weight', 'last_finish', 'running', 'waiting', 'granted', 'total_wait', 'max_wait')
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.last_finish = 0.0
+        self.running = 0
+        self.waiting = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+def _grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FairScheduler:
+    """Weighted fair queuing of upstream calls across stores
+
+    At most `capacity` calls run at once and each store at most
+    `per_store_limit` of them. When a slot frees up it goes to the waiting
+    call with the smallest start tag (start-time fair queuing): every call
+    advances its store's virtual clock by cost / weight, so a store with
+    weight 4 gets four calls through for every one of a weight-1 store while
+    both have work queued, and a store with a 50k-item backlog cannot push
+    everyone else to the back of the line. Threads (slot) and asyncio tasks
+    (slot_async) share the same queue.
+    """
+
+    def __init__(self, name: str, capacity: int = 16, per_store_limit: int = 8,
+                 weight_for: Callable[[Hashable], float] = None):
+        self.name = name
+        self.capacity = capacity
+        self.per_store_limit = per_store_limit
+        self.weight_for = weight_for or (lambda key: 1.0)
+        self.running = 0
+        self._virtual_time = 0.0
+        self._stores: Dict[Hashable, _StoreState] = {}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, key: Hashable, cost: float, weight: float, loop=None) -> _Waiter:
+        state = self._stores.get(key)
+        if state is None:
+            state = self._stores[key] = _StoreState(weight)
+        state.weight = weight
+        start_tag = max(self._virtual_time, state.last_finish)
+        state.last_finish = start_tag + cost / weight
+        state.waiting += 1
+        waiter = _Waiter(key, start_tag, next(self._seq), loop, loop.create_future() if loop else None)
+        self._waiters.append(waiter)
+        self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        """Hand free slots to the eligible waiters with the smallest start tags; caller holds the lock"""
+        while self.running < self.capacity and self._waiters:
+            eligible = [waiter for waiter in self._waiters
+                        if self._stores[waiter.key].running < self.per_store_limit]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (w.start_tag, w.seq))
+            self._waiters.remove(waiter)
+
+            state = self._stores[waiter.key]
+            waited = time.monotonic() - waiter.enqueued_at
+            state.waiting -= 1
+            state.running += 1
+            state.granted += 1
+            state.total_wait += waited
+            state.max_wait = max(state.max_wait, waited)
+            self.running += 1
+            self._virtual_time = waiter.start_tag
+
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                try:
+                    waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+                except RuntimeError:
+                    # The waiter's loop is gone; give the slot straight back
+                    state.running -= 1
+                    self.running -= 1
+
+    def _weight(self, key: Hashable) -> float:
+        try:
+            return max(float(self.weight_for(key)), 0.01)
+        except Exception as e:
+            print(f"Fair scheduler weight lookup failed: {str(e)}")
+            return 1.0
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """Block until `key` is granted a slot; return the seconds spent waiting"""
+        weight = self._weight(key)
+        with self._lock:
+            waiter = self._enqueue(key, cost, weight)
+        waiter.event.wait()
+        return time.monotonic() - waiter.enqueued_at
+
+    async def acquire_async(self, key: Hashable, cost: float = 1.0) -> float:
+        """Coroutine counterpart of acquire(); waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        # weight_for may query the database on a cache miss, so resolve it on the default executor
+        weight = await loop.run_in_executor(None, self._weight, key)
+        with self._lock:
+            waiter = self._enqueue(key, cost, weight, loop)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._stores[key].waiting -= 1
+                    raise
+            # Cancelled after the slot was granted: hand it on
+            self.release(key)
+            raise
+        return time.monotonic() - waiter.enqueued_at
+
+    def release(self, key: Hashable):
+        with self._lock:
+            self._stores[key].running -= 1
+            self.running -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, key: Hashable, cost: float = 1.0):
+        self.acquire(key, cost)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    @asynccontextmanager
+    async def slot_async(self, key: Hashable, cost: float = 1.0):
+        await self.acquire_async(key, cost)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stores = {
+                str(key): {
+                    "weight": state.weight,
+                    "queue_depth": state.waiting,
+                    "running": state.running,
+                    "granted": state.granted,
+                    "avg_wait_ms": round(state.total_wait / state.granted * 1000, 1) if state.granted else 0.0,
+                    "max_wait_ms": round(state.max_wait * 1000, 1)
+                }
+                for key, state in self._stores.items()
+            }
+            return {
+                "capacity": self.capacity,
+                "per_store_limit": self.per_store_limit,
+                "running": self.running,
+                "queue_depth": len(self._waiters),
+                "stores": stores
+            }
+
+
+class PlanWeights:
+    """Store weights from Store.plan_type, cached per store id or shop domain"""
+
+    def __init__(self, plan_weights: Dict[str, float], ttl: float = WEIGHT_CACHE_TTL):
+        self.plan_weights = plan_weights
+        self.ttl = ttl
+        self._cache: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+        self._app = None
+
+    def init_app(self, app):
+        """Let lookups from threads and event loops without an app context reach the database"""
+        self._app = app
+
+    def _query_plan(self, column: str, value) -> Optional[str]:
+        from src.models.seo import Store
+
+        if column == 'shop_domain':
+            # ShopifyAPIService strips the .myshopify.com suffix that stores are usually saved with
+            condition = Store.shop_domain.in_([value, f"{value}.myshopify.com"])
+        else:
+            condition = Store.id == value
+        store = Store.query.filter(condition).first()
+        return store.plan_type if store else None
+
+    def _lookup_plan(self, column: str, value) -> Optional[str]:
+        if has_app_context():
+            return self._query_plan(column, value)
+        if self._app is None:
+            return None
+        with self._app.app_context():
+            return self._query_plan(column, value)
+
+    def _weight(self, column: str, value) -> float:
+        if value is None:
+            return 1.0
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get((column, value))
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        weight = float(self.plan_weights.get(self._lookup_plan(column, value), 1.0))
+        with self._lock:
+            self._cache[(column, value)] = (weight, now + self.ttl)
+        return weight
+
+    def for_store(self, store_id: Optional[int]) -> float:
+        return self._weight('id', store_id)
+
+    def for_shop(self, shop_domain: Optional[str]) -> float:
+        return self._weight('shop_domain', shop_domain)
+
+    def for_plan(self, plan_type: Optional[str]) -> float:
+        return float(self.plan_weights.get(plan_type, 1.0))
+
+
+plan_weights = PlanWeights(_parse_plan_weights(os.getenv('FAIR_PLAN_WEIGHTS')))
+
+_schedulers: Dict[str, FairScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> Optional[FairScheduler]:
+    """Process-wide scheduler for one upstream ('deepseek' or 'shopify'), or None when disabled
+
+    DeepSeek calls are keyed by store id, Shopify calls by shop domain.
+    """
+    if os.getenv('FAIR_SCHEDULER_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            capacity = int(os.getenv(f'FAIR_{name.upper()}_CONCURRENCY') or DEFAULT_CAPACITY.get(name, 16))
+            # By default one store may use three quarters of the slots, so others never queue behind it alone
+            per_store_limit = int(os.getenv('FAIR_STORE_MAX_CONCURRENCY') or max(1, capacity * 3 // 4))
+            scheduler = FairScheduler(
+                name,
+                capacity=capacity,
+                per_store_limit=per_store_limit,
+                weight_for=plan_weights.for_shop if name == 'shopify' else plan_weights.for_store
+            )
+            _schedulers[name] = scheduler
+    return scheduler
+
+
+def scheduler_stats() -> Dict:
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
@@ -0,0 +1,218 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be down"""
+
+
+class RateLimiter:
+    """Token-bucket limiter on requests/min and tokens/min, shared between threads
+
+    reserve() debits the buckets immediately and returns how long the caller
+    must wait before sending, so the same limiter works for blocking code
+    (time.sleep) and asyncio code (asyncio.sleep). On throttling the allowed
+    rate is halved and then recovers by 5% of the configured rate per success.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = None,
+                 min_rate_factor: float = 0.1):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_rate_factor = min_rate_factor
+        self.rate_factor = 1.0
+
+        now = time.monotonic()
+        self._request_balance = float(requests_per_minute)
+        self._token_balance = float(tokens_per_minute or 0)
+        self._updated_at = now
+        self._blocked_until = now
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._request_balance = min(
+            float(self.requests_per_minute),
+            self._request_balance + elapsed * self.requests_per_minute * self.rate_factor / 60
+        )
+        if self.tokens_per_minute:
+            self._token_balance = min(
+                float(self.tokens_per_minute),
+                self._token_balance + elapsed * self.tokens_per_minute * self.rate_factor / 60
+            )
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Take one request (and `tokens` tokens) from the buckets; return seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._request_balance -= 1
+            wait = 0.0
+            if self._request_balance < 0:
+                wait = -self._request_balance * 60 / (self.requests_per_minute * self.rate_factor)
+            if self.tokens_per_minute and tokens:
+                self._token_balance -= tokens
+                if self._token_balance < 0:
+                    wait = max(wait, -self._token_balance * 60 / (self.tokens_per_minute * self.rate_factor))
+            return max(wait, self._blocked_until - now)
+
+    def adjust_tokens(self, delta: int):
+        """Correct the token bucket once the real usage of a request is known"""
+        if not self.tokens_per_minute or not delta:
+            return
+        with self._lock:
+            self._token_balance = min(float(self.tokens_per_minute), self._token_balance - delta)
+
+    def record_throttled(self, retry_after: float = None):
+        """Slow down after a 429 and pause every caller until Retry-After has passed"""
+        with self._lock:
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor / 2)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.rate_factor = min(1.0, self.rate_factor + 0.05)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "rate_factor": round(self.rate_factor, 3)
+            }
+
+
+class RetryPolicy:
+    """Jittered exponential backoff that never retries sooner than Retry-After"""
+
+    RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt: int, retry_after: float = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None when Retry-After exceeds max_delay"""
+        # Full jitter keeps many workers that failed together from retrying together
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                # Retrying early would only be throttled again; give up instead
+                return None
+            return max(backoff, retry_after)
+        return backoff
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, then let one probe through after a cool-down"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: only a single probe request is allowed through
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_rate_limiters = {}
+_circuit_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str) -> RateLimiter:
+    """Process-wide rate limiter for one API key, configured from the environment"""
+    with _registry_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            tokens_per_minute = int(os.getenv('DEEPSEEK_TOKENS_PER_MINUTE', '0')) or None
+            limiter = RateLimiter(
+                requests_per_minute=int(os.getenv('DEEPSEEK_REQUESTS_PER_MINUTE', '3000')),
+                tokens_per_minute=tokens_per_minute
+            )
+            _rate_limiters[key] = limiter
+    return limiter
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    """Process-wide circuit breaker for one API key, configured from the environment"""
+    with _registry_lock:
+        breaker = _circuit_breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=int(os.getenv('DEEPSEEK_BREAKER_THRESHOLD', '5')),
+                recovery_timeout=float(os.getenv('DEEPSEEK_BREAKER_RESET_SECONDS', '30'))
+            )
+            _circuit_breakers[key] = breaker
+    return breaker
+
+
+def default_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_retries=int(os.getenv('DEEPSEEK_MAX_RETRIES', '3')),
+        base_delay=float(os.getenv('DEEPSEEK_BACKOFF_BASE_SECONDS', '0.5')),
+        max_delay=float(os.getenv('DEEPSEEK_BACKOFF_MAX_SECONDS', '20'))
+    )
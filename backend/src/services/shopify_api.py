@@ -1,7 +1,220 @@
 import requests
 import json
-from typing import Dict, List, Optional
-from datetime import datetime
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from sqlalchemy import update
+from src.models.dialect import upsert_statement
+from src.services.fair_scheduler import get_scheduler
+from src.services.resilience import parse_retry_after
+
+# Shopify REST分頁上限
+MAX_PAGE_LIMIT = 250
+
+# 產品同步只請求本地Product實際保存的字段，updated_at用於增量同步水位
+PRODUCT_SYNC_FIELDS = ('id', 'title', 'body_html', 'updated_at')
+
+# 增量同步水位保存在Store.settings中的鍵名
+SYNC_WATERMARK_KEY = 'product_sync_watermark'
+
+# 水位取同步開始的時間再往前重疊幾秒，容忍本地和Shopify之間的時鐘偏差
+SYNC_WATERMARK_OVERLAP_SECONDS = float(os.getenv('SHOPIFY_SYNC_OVERLAP_SECONDS', '10'))
+
+# GraphQL批量導出產品及其SEO字段（%s處可插入篩選條件）
+BULK_PRODUCTS_QUERY = """
+{
+  products%s {
+    edges {
+      node {
+        id
+        title
+        bodyHtml
+        updatedAt
+        seo {
+          title
+          description
+        }
+      }
+    }
+  }
+}
+"""
+
+BULK_OPERATION_RUN_MUTATION = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+CURRENT_BULK_OPERATION_QUERY = """
+{
+  currentBulkOperation(type: QUERY) {
+    id
+    status
+    errorCode
+    objectCount
+    url
+    partialDataUrl
+  }
+}
+"""
+
+BULK_OPERATION_FINISHED = ('COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED')
+
+
+def _parse_shopify_time(value: Optional[str]) -> Optional[datetime]:
+    """解析Shopify的ISO 8601時間（帶時區偏移），無法解析時返回None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class ShopifyCallLimiter:
+    """單個商店的漏桶限流器，同一進程內所有ShopifyAPIService實例共享
+    
+    Shopify REST API按商店維護一個漏桶：每次調用加1，按固定速率漏出，
+    桶滿即返回429。這裡在本地估算桶的水位，並用每個響應的
+    X-Shopify-Shop-Api-Call-Limit校正，請求前計算需要等待的時間，
+    讓水位始終保持在上限以下`headroom`個位置。
+    """
+    
+    def __init__(self, capacity: int = 40, leak_rate: float = 2.0, headroom: int = 2,
+                 max_concurrency: int = 4):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self.max_concurrency = max_concurrency
+        # 同一商店同時在途的請求數上限，跨所有批量推送共享
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.throttled = 0
+        self._level = 0.0
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _leak(self, now: float):
+        self._level = max(0.0, self._level - (now - self._updated_at) * self.leak_rate)
+        self._updated_at = now
+    
+    def acquire(self) -> float:
+        """預留一次調用，返回發送前需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._leak(now)
+            limit = max(1, self.capacity - self.headroom)
+            wait = max(0.0, (self._level + 1 - limit) / self.leak_rate, self._blocked_until - now)
+            # 預留的調用計入水位，讓並發調用者依次排開
+            self._level += 1
+            return wait
+    
+    def observe(self, call_limit: Optional[str]):
+        """用響應頭 X-Shopify-Shop-Api-Call-Limit（如 "32/40"）校正水位"""
+        if not call_limit or '/' not in call_limit:
+            return
+        try:
+            used, capacity = (int(part) for part in call_limit.split('/', 1))
+        except ValueError:
+            return
+        with self._lock:
+            self._leak(time.monotonic())
+            self.capacity = capacity
+            # 其他應用也在消耗同一個桶，取兩者中較高的水位
+            self._level = max(self._level, float(used))
+    
+    def record_throttled(self, retry_after: Optional[float]):
+        """收到429：視桶為已滿，並在Retry-After之前暫停所有調用"""
+        with self._lock:
+            now = time.monotonic()
+            self._leak(now)
+            self.throttled += 1
+            self._level = float(self.capacity)
+            self._blocked_until = max(self._blocked_until, now + (retry_after if retry_after is not None else 1.0))
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            self._leak(time.monotonic())
+            return {
+                'level': round(self._level, 2),
+                'capacity': self.capacity,
+                'leak_rate': self.leak_rate,
+                'throttled': self.throttled
+            }
+
+
+_shop_limiters = {}
+_shop_limiters_lock = threading.Lock()
+
+
+def get_shop_limiter(shop_domain: str) -> ShopifyCallLimiter:
+    """返回商店在本進程內共享的限流器"""
+    with _shop_limiters_lock:
+        limiter = _shop_limiters.get(shop_domain)
+        if limiter is None:
+            limiter = ShopifyCallLimiter(
+                capacity=int(os.getenv('SHOPIFY_BUCKET_SIZE', '40')),
+                leak_rate=float(os.getenv('SHOPIFY_LEAK_RATE', '2')),
+                headroom=int(os.getenv('SHOPIFY_BUCKET_HEADROOM', '2')),
+                max_concurrency=int(os.getenv('SHOPIFY_MAX_CONCURRENCY', '4'))
+            )
+            _shop_limiters[shop_domain] = limiter
+    return limiter
+
+
+class PushCheckpoint:
+    """批量推送的斷點文件：每推送成功一個產品追加一行產品ID
+    
+    推送中途崩潰後，用同一個文件重新推送會跳過已成功的產品。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+    
+    def is_done(self, product_id) -> bool:
+        return str(product_id) in self.done
+    
+    def mark_done(self, product_id):
+        with self._lock:
+            self._file.write(f"{product_id}\n")
+            self._file.flush()
+            self.done.add(str(product_id))
+    
+    def close(self):
+        self._file.close()
+    
+    def remove(self):
+        """全部推送成功後刪除斷點文件"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
 
 class ShopifyAPIService:
     """Shopify API服務類，處理與Shopify的所有API交互"""
@@ -14,30 +227,61 @@ class ShopifyAPIService:
             'X-Shopify-Access-Token': access_token,
             'Content-Type': 'application/json'
         }
+        # 同一商店的所有實例共享一個調用配額
+        self.limiter = get_shop_limiter(self.shop_domain)
+        # 分頁拉取和並發推送時復用keep-alive連接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(10, self.limiter.max_concurrency))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.max_retries = int(os.getenv('SHOPIFY_MAX_RETRIES', '5'))
+        # 跨商店的加權公平排隊，按商店套餐分配出站並發
+        self.scheduler = get_scheduler('shopify')
     
-    def _make_request(self, method: str, endpoint: str, data: Dict = None) -> Dict:
-        """發送API請求到Shopify"""
-        url = f"{self.base_url}/{endpoint}"
+    def _scheduled(self):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(self.shop_domain)
+    
+    def _send(self, method: str, url: str, data: Dict = None, params: Dict = None,
+              rate_limited: bool = True) -> requests.Response:
+        """發送請求並返回原始響應（需要讀取響應頭時使用）
+        
+        GraphQL按查詢成本計費，不佔用REST漏桶，調用時傳rate_limited=False。
+        """
+        if method.upper() not in ('GET', 'POST', 'PUT', 'DELETE'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
         
         try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=self.headers, json=data)
-            elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=self.headers)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            response.raise_for_status()
-            return response.json() if response.content else {}
+            attempt = 0
+            while True:
+                wait = self.limiter.acquire() if rate_limited else 0
+                if wait > 0:
+                    time.sleep(wait)
+                
+                # 漏桶等待之後才排隊：各商店的配額互不影響，共享的只有本進程的出站並發
+                with self._scheduled():
+                    response = self.session.request(method.upper(), url, headers=self.headers,
+                                                    json=data, params=params)
+                self.limiter.observe(response.headers.get('X-Shopify-Shop-Api-Call-Limit'))
+                
+                if response.status_code == 429 and attempt < self.max_retries:
+                    self.limiter.record_throttled(parse_retry_after(response.headers.get('Retry-After')))
+                    attempt += 1
+                    continue
+                
+                response.raise_for_status()
+                return response
             
         except requests.exceptions.RequestException as e:
             print(f"Shopify API request failed: {str(e)}")
             raise Exception(f"Shopify API error: {str(e)}")
     
+    def _make_request(self, method: str, endpoint: str, data: Dict = None) -> Dict:
+        """發送API請求到Shopify"""
+        response = self._send(method, f"{self.base_url}/{endpoint}", data)
+        return response.json() if response.content else {}
+    
     # ==================== 產品相關API ====================
     
     def get_products(self, limit: int = 50, page_info: str = None) -> Dict:
@@ -48,6 +292,31 @@ class ShopifyAPIService:
         
         return self._make_request('GET', endpoint)
     
+    def iter_product_pages(self, limit: int = MAX_PAGE_LIMIT,
+                           fields: Optional[tuple] = PRODUCT_SYNC_FIELDS,
+                           updated_at_min: str = None) -> Iterator[List[Dict]]:
+        """按Link header的游標逐頁拉取產品，每拉到一頁就yield一頁
+        
+        內存中最多只保留一頁數據，調用方可以邊拉取邊寫庫。
+        傳入updated_at_min時只返回該時間之後（含）更新過的產品。
+        """
+        params = {'limit': min(limit, MAX_PAGE_LIMIT)}
+        if fields:
+            params['fields'] = ','.join(fields)
+        if updated_at_min:
+            params['updated_at_min'] = updated_at_min
+        url = f"{self.base_url}/products.json"
+        
+        while url:
+            response = self._send('GET', url, params=params)
+            products = response.json().get('products', [])
+            if products:
+                yield products
+            
+            # 下一頁URL已包含page_info、limit和fields，直接請求即可
+            url = response.links.get('next', {}).get('url')
+            params = None
+    
     def get_product(self, product_id: str) -> Dict:
         """獲取單個產品詳情"""
         endpoint = f"products/{product_id}.json"
@@ -95,6 +364,78 @@ class ShopifyAPIService:
         }
         return self._make_request('PUT', endpoint, data)
     
+    # ==================== GraphQL批量操作 ====================
+    
+    def graphql(self, query: str, variables: Dict = None) -> Dict:
+        """執行Admin GraphQL查詢，返回data部分"""
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        
+        response = self._send('POST', f"{self.base_url}/graphql.json", payload, rate_limited=False)
+        result = response.json()
+        if result.get('errors'):
+            raise Exception(f"Shopify GraphQL error: {result['errors']}")
+        return result.get('data', {})
+    
+    def start_bulk_product_export(self, updated_at_min: str = None) -> Dict:
+        """提交bulkOperationRunQuery，讓Shopify在後台導出產品（可只導出某時間後更新的）"""
+        product_filter = f'(query: "updated_at:>=\'{updated_at_min}\'")' if updated_at_min else ''
+        data = self.graphql(BULK_OPERATION_RUN_MUTATION, {"query": BULK_PRODUCTS_QUERY % product_filter})
+        result = data.get('bulkOperationRunQuery') or {}
+        if result.get('userErrors'):
+            raise Exception(f"Bulk operation rejected: {result['userErrors']}")
+        return result.get('bulkOperation') or {}
+    
+    def wait_for_bulk_operation(self, poll_interval: float = 2.0, timeout: float = 3600) -> Dict:
+        """輪詢當前批量操作直到結束，返回最終狀態"""
+        deadline = time.monotonic() + timeout
+        while True:
+            operation = self.graphql(CURRENT_BULK_OPERATION_QUERY).get('currentBulkOperation') or {}
+            if operation.get('status') in BULK_OPERATION_FINISHED:
+                return operation
+            if time.monotonic() > deadline:
+                raise Exception(f"Bulk operation {operation.get('id')} did not finish within {timeout}s")
+            time.sleep(poll_interval)
+    
+    def iter_bulk_results(self, url: str) -> Iterator[Dict]:
+        """流式下載批量結果的JSONL文件，逐行解析，不把整個文件讀入內存"""
+        # 結果URL是預簽名的存儲地址，不能帶Shopify訪問令牌
+        with self.session.get(url, stream=True, timeout=(10, 300)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    def iter_bulk_product_pages(self, page_size: int = MAX_PAGE_LIMIT, poll_interval: float = 2.0,
+                                updated_at_min: str = None) -> Iterator[List[Dict]]:
+        """用GraphQL批量操作導出產品，按page_size分組產出，格式與iter_product_pages一致"""
+        self.start_bulk_product_export(updated_at_min)
+        operation = self.wait_for_bulk_operation(poll_interval)
+        if operation.get('status') != 'COMPLETED':
+            raise Exception(f"Bulk operation {operation.get('status')}: {operation.get('errorCode')}")
+        
+        # 沒有任何產品時Shopify不生成結果文件
+        if not operation.get('url'):
+            return
+        
+        page = []
+        for node in self.iter_bulk_results(operation['url']):
+            seo = node.get('seo') or {}
+            page.append({
+                'id': node['id'].rsplit('/', 1)[-1],
+                'title': node.get('title', ''),
+                'body_html': node.get('bodyHtml', ''),
+                'updated_at': node.get('updatedAt'),
+                'seo_title': seo.get('title'),
+                'seo_description': seo.get('description')
+            })
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    
     # ==================== 部落格相關API ====================
     
     def get_blogs(self) -> Dict:
@@ -174,105 +515,241 @@ class ShopifyAPIService:
     # ==================== 批量操作 ====================
     
     def sync_all_products(self) -> List[Dict]:
-        """同步所有產品數據"""
+        """同步所有產品數據（一次性返回全部產品，大商店請改用iter_product_pages）"""
         all_products = []
-        page_info = None
-        
-        while True:
-            response = self.get_products(limit=250, page_info=page_info)
-            products = response.get('products', [])
+        for products in self.iter_product_pages():
             all_products.extend(products)
+        return all_products
+    
+    def _push_product_seo(self, item: Dict, checkpoint: Optional[PushCheckpoint] = None) -> Dict:
+        """推送單個產品的SEO，返回單項結果"""
+        try:
+            product_id = item['product_id']
+            seo_title = item['seo_title']
+            seo_description = item['seo_description']
             
-            # 檢查是否有下一頁
-            if len(products) < 250:
-                break
+            with self.limiter.slots:
+                result = self.update_product_seo(product_id, seo_title, seo_description)
+            if checkpoint is not None:
+                checkpoint.mark_done(product_id)
+            return {
+                'product_id': product_id,
+                'success': True,
+                'result': result
+            }
             
-            # 獲取下一頁的page_info（實際實現需要從Link header解析）
-            page_info = None  # 簡化處理
-            break
-        
-        return all_products
+        except Exception as e:
+            return {
+                'product_id': item.get('product_id'),
+                'success': False,
+                'error': str(e)
+            }
     
-    def batch_update_products_seo(self, product_updates: List[Dict]) -> List[Dict]:
-        """批量更新產品SEO"""
-        results = []
+    def iter_batch_update_products_seo(self, product_updates: Iterable[Dict], concurrency: int = None,
+                                       checkpoint: Optional[PushCheckpoint] = None) -> Iterator[Dict]:
+        """並發批量更新產品SEO，每完成一個產品就yield一個結果（按完成順序）
         
-        for update in product_updates:
+        並發數不超過商店的SHOPIFY_MAX_CONCURRENCY，實際調用速率仍由漏桶限流器控制。
+        傳入checkpoint時跳過已推送成功的產品，並記錄新成功的產品。
+        """
+        concurrency = max(1, min(concurrency or self.limiter.max_concurrency, self.limiter.max_concurrency))
+        pending = set()
+        
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='shopify-push') as pool:
             try:
-                product_id = update['product_id']
-                seo_title = update['seo_title']
-                seo_description = update['seo_description']
-                
-                result = self.update_product_seo(product_id, seo_title, seo_description)
-                results.append({
-                    'product_id': product_id,
-                    'success': True,
-                    'result': result
-                })
+                for item in product_updates:
+                    if checkpoint is not None and checkpoint.is_done(item.get('product_id')):
+                        yield {'product_id': item.get('product_id'), 'success': True, 'skipped': True}
+                        continue
+                    
+                    pending.add(pool.submit(self._push_product_seo, item, checkpoint))
+                    # 只保持有限的待處理任務，避免一次性提交整個目錄
+                    if len(pending) >= concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
                 
-            except Exception as e:
-                results.append({
-                    'product_id': update.get('product_id'),
-                    'success': False,
-                    'error': str(e)
-                })
-        
-        return results
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                # 調用方提前停止迭代時，不再發送尚未開始的請求
+                for future in pending:
+                    future.cancel()
+    
+    def batch_update_products_seo(self, product_updates: List[Dict], concurrency: int = 1) -> List[Dict]:
+        """批量更新產品SEO"""
+        return list(self.iter_batch_update_products_seo(product_updates, concurrency=concurrency))
 
 
 class ShopifyProductSync:
     """Shopify產品同步管理器"""
     
-    def __init__(self, shopify_api: ShopifyAPIService, db_session):
+    def __init__(self, shopify_api: ShopifyAPIService, db_session, commit_size: int = None):
         self.shopify_api = shopify_api
         self.db_session = db_session
+        # 同步時每寫入多少行提交一次
+        self.commit_size = commit_size or int(os.getenv('SHOPIFY_SYNC_COMMIT_SIZE', '1000'))
     
-    def sync_products_from_shopify(self, store_id: int) -> Dict:
-        """從Shopify同步產品到本地數據庫"""
-        from src.models.seo import Product
+    def _load_watermark(self, store_id: int) -> Optional[str]:
+        from src.models.seo import Store
         
-        try:
-            # 獲取Shopify產品
-            shopify_products = self.shopify_api.sync_all_products()
+        store = Store.query.get(store_id)
+        settings = json.loads(store.settings) if store and store.settings else {}
+        return settings.get(SYNC_WATERMARK_KEY)
+    
+    def _save_watermark(self, store_id: int, watermark: str):
+        from src.models.seo import Store
+        
+        store = Store.query.get(store_id)
+        if not store:
+            return
+        settings = json.loads(store.settings) if store.settings else {}
+        settings[SYNC_WATERMARK_KEY] = watermark
+        store.settings = json.dumps(settings)
+        self.db_session.commit()
+    
+    def _upsert_page(self, store_id: int, shopify_products: List[Dict]) -> tuple:
+        """把一頁Shopify產品寫入本地：一次查詢預載已有行，再批量插入和批量更新
+        
+        源文本指紋沒變、也沒有SEO字段需要補全的產品完全跳過，不產生寫入。
+        返回(插入數, 更新數, 未變化數)。
+        """
+        from src.models.seo import Product, product_fingerprint
+        
+        # 同一頁內重複出現的產品以最後一次為準
+        incoming = {str(item['id']): item for item in shopify_products}
+        
+        existing = {
+            row.shopify_product_id: row
+            for row in self.db_session.query(
+                Product.id, Product.shopify_product_id, Product.seo_title, Product.seo_description,
+                Product.content_hash
+            ).filter(
+                Product.store_id == store_id,
+                Product.shopify_product_id.in_(list(incoming))
+            )
+        }
+        
+        now = datetime.utcnow()
+        inserts = []
+        updates = []
+        unchanged = 0
+        for product_id, shopify_product in incoming.items():
+            row = existing.get(product_id)
+            title = shopify_product.get('title', '')
+            description = shopify_product.get('body_html', '')
+            content_hash = product_fingerprint(title, description)
             
+            if row is None:
+                inserts.append({
+                    'store_id': store_id,
+                    'shopify_product_id': product_id,
+                    'title': title,
+                    'description': description,
+                    'seo_title': shopify_product.get('seo_title'),
+                    'seo_description': shopify_product.get('seo_description'),
+                    'content_hash': content_hash,
+                    'created_at': now,
+                    'updated_at': now
+                })
+            else:
+                fills_seo = ((shopify_product.get('seo_title') and not row.seo_title) or
+                             (shopify_product.get('seo_description') and not row.seo_description))
+                if row.content_hash == content_hash and not fills_seo:
+                    unchanged += 1
+                    continue
+                
+                updates.append({
+                    'id': row.id,
+                    'title': title,
+                    'description': description,
+                    'content_hash': content_hash,
+                    # 只補全本地還沒有的SEO字段，不覆蓋尚未推送的優化結果
+                    'seo_title': row.seo_title or shopify_product.get('seo_title'),
+                    'seo_description': row.seo_description or shopify_product.get('seo_description'),
+                    'updated_at': now
+                })
+        
+        # 列表參數讓SQLAlchemy走executemany，每頁各一條INSERT和UPDATE語句；
+        # 插入走(store_id, shopify_product_id)唯一索引上的upsert，
+        # 同一商店並發的同步或webhook先寫入了同一產品時不會因唯一約束失敗
+        if inserts:
+            self.db_session.execute(upsert_statement(
+                Product, self.db_session.get_bind().dialect.name,
+                index_elements=['store_id', 'shopify_product_id'],
+                update_columns=['title', 'description', 'content_hash', 'updated_at'],
+                fill_columns=['seo_title', 'seo_description']
+            ), inserts)
+        if updates:
+            self.db_session.execute(update(Product), updates)
+        return len(inserts), len(updates), unchanged
+    
+    def sync_products_from_shopify(self, store_id: int, engine: str = 'rest', full: bool = False,
+                                   progress: Optional[Callable[[int], None]] = None) -> Dict:
+        """從Shopify同步產品到本地數據庫
+        
+        engine='rest' 按Link header分頁拉取；engine='bulk' 使用GraphQL批量操作，
+        適合大型商店，並會帶回Shopify上已有的SEO標題和描述。
+        
+        默認增量同步：只拉取上次同步水位之後更新的產品；full=True 或還沒有水位時
+        做全量同步。新水位是本次同步開始的時間（減去幾秒重疊），而不是見過的最新
+        updated_at：分頁期間被修改的產品可能落在已讀過的頁裡，只有從開始時間起算
+        才能保證下次同步拉到它；重疊部分重新讀到的產品按指紋判斷為未變化。
+        水位在全部頁面提交後才前移，中途失敗的同步下次會從舊水位重新開始。
+        
+        progress(已處理產品數) 在每頁寫入後調用，後台任務用它匯報進度。
+        """
+        if engine not in ('rest', 'bulk'):
+            return {'success': False, 'error': f"Unsupported sync engine: {engine}"}
+        
+        try:
             synced_count = 0
             updated_count = 0
+            unchanged_count = 0
+            total_products = 0
             
-            for shopify_product in shopify_products:
-                product_id = str(shopify_product['id'])
+            watermark = None if full else self._load_watermark(store_id)
+            started_at = datetime.now(timezone.utc) - timedelta(seconds=SYNC_WATERMARK_OVERLAP_SECONDS)
+            
+            if engine == 'bulk':
+                pages = self.shopify_api.iter_bulk_product_pages(updated_at_min=watermark)
+            else:
+                pages = self.shopify_api.iter_product_pages(updated_at_min=watermark)
+            
+            # 逐頁拉取並逐頁寫入，大目錄也只佔用一頁的內存；每commit_size行提交一次
+            uncommitted = 0
+            for shopify_products in pages:
+                total_products += len(shopify_products)
+                
+                inserted, updated, unchanged = self._upsert_page(store_id, shopify_products)
+                synced_count += inserted
+                updated_count += updated
+                unchanged_count += unchanged
                 
-                # 檢查產品是否已存在
-                existing_product = Product.query.filter_by(
-                    store_id=store_id,
-                    shopify_product_id=product_id
-                ).first()
+                uncommitted += inserted + updated
+                if uncommitted >= self.commit_size:
+                    self.db_session.commit()
+                    uncommitted = 0
                 
-                if existing_product:
-                    # 更新現有產品
-                    existing_product.title = shopify_product.get('title', '')
-                    existing_product.description = shopify_product.get('body_html', '')
-                    existing_product.updated_at = datetime.utcnow()
-                    updated_count += 1
-                else:
-                    # 創建新產品
-                    new_product = Product(
-                        store_id=store_id,
-                        shopify_product_id=product_id,
-                        title=shopify_product.get('title', ''),
-                        description=shopify_product.get('body_html', ''),
-                        created_at=datetime.utcnow(),
-                        updated_at=datetime.utcnow()
-                    )
-                    self.db_session.add(new_product)
-                    synced_count += 1
+                if progress:
+                    progress(total_products)
             
             self.db_session.commit()
             
+            new_watermark = started_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+            self._save_watermark(store_id, new_watermark)
+            
             return {
                 'success': True,
+                'mode': 'incremental' if watermark else 'full',
                 'synced_count': synced_count,
+                'inserted_count': synced_count,
                 'updated_count': updated_count,
-                'total_products': len(shopify_products)
+                'unchanged_count': unchanged_count,
+                'total_products': total_products,
+                'watermark': new_watermark
             }
             
         except Exception as e:
@@ -318,6 +795,54 @@ class ShopifyProductSync:
                 'error': str(e)
             }
 
+    
+    def push_seo_bulk(self, store_id: int, product_ids: List[int] = None, concurrency: int = None,
+                      checkpoint: Optional[PushCheckpoint] = None) -> Iterator[Dict]:
+        """並發推送商店內已有SEO數據的產品，逐個產出推送結果"""
+        from src.models.seo import Product
+        
+        query = self.db_session.query(
+            Product.id, Product.shopify_product_id, Product.seo_title, Product.seo_description
+        ).filter(
+            Product.store_id == store_id,
+            Product.seo_title.isnot(None),
+            Product.seo_description.isnot(None)
+        )
+        if product_ids:
+            query = query.filter(Product.id.in_(product_ids))
+        rows = query.order_by(Product.id).all()
+        local_ids = {row.shopify_product_id: row.id for row in rows}
+        
+        updates = ({
+            'product_id': row.shopify_product_id,
+            'seo_title': row.seo_title,
+            'seo_description': row.seo_description
+        } for row in rows)
+        
+        pushed = []
+        
+        def flush():
+            # 批量更新本地的最後優化時間，而不是每個產品提交一次
+            if not pushed:
+                return
+            self.db_session.query(Product).filter(Product.id.in_(pushed)).update(
+                {Product.last_optimized: datetime.utcnow()}, synchronize_session=False
+            )
+            self.db_session.commit()
+            pushed.clear()
+        
+        try:
+            for result in self.shopify_api.iter_batch_update_products_seo(updates, concurrency, checkpoint):
+                result['local_product_id'] = local_ids.get(result['product_id'])
+                # 斷點跳過的產品也補寫本地時間：上次推送可能在本地記錄前中斷
+                if result['success']:
+                    pushed.append(result['local_product_id'])
+                    if len(pushed) >= 100:
+                        flush()
+                yield result
+        finally:
+            flush()
+
 
 # 使用示例和測試函數
 def test_shopify_integration():
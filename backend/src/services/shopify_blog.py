@@ -1,14 +1,25 @@
-from typing import Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+from typing import Callable, Dict, Iterator, List, Optional
 from datetime import datetime
+from sqlalchemy import select, update
+from src.models.dialect import upsert_statement
 from src.services.shopify_api import ShopifyAPIService
 from src.models.seo import Store
 from src.models.user import db
+from src.json_provider import json_column
 import json
 import re
 
 class BlogArticle(db.Model):
     """部落格文章模型"""
     __tablename__ = 'blog_articles'
+    __table_args__ = (
+        db.Index('ix_blog_articles_store_created', 'store_id', 'created_at'),
+        db.Index('ix_blog_articles_store_status_created', 'store_id', 'status', 'created_at'),
+        # 未發布的草稿shopify_article_id為NULL，NULL之間不衝突
+        db.Index('uq_blog_articles_store_shopify_article', 'store_id', 'shopify_article_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
@@ -27,7 +38,7 @@ class BlogArticle(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    def to_dict(self, raw_json: bool = False):
         return {
             'id': self.id,
             'store_id': self.store_id,
@@ -36,7 +47,7 @@ class BlogArticle(db.Model):
             'title': self.title,
             'content': self.content,
             'summary': self.summary,
-            'tags': json.loads(self.tags) if self.tags else [],
+            'tags': json_column(self.tags, '[]', raw_json),
             'language': self.language,
             'seo_score': self.seo_score,
             'word_count': self.word_count,
@@ -132,8 +143,10 @@ class ShopifyBlogSync:
             )
             
             # 更新本地記錄
-            shopify_article = result.get('article', {})
-            article.shopify_article_id = str(shopify_article.get('id'))
+            shopify_article_id = self._shopify_article_id(result)
+            if shopify_article_id is None:
+                return {'success': False, 'error': 'Shopify response did not include an article id'}
+            article.shopify_article_id = shopify_article_id
             article.status = 'synced'
             article.published_at = datetime.utcnow()
             article.synced_at = datetime.utcnow()
@@ -209,45 +222,46 @@ class ShopifyBlogSync:
             articles_response = self.shopify_api.get_blog_articles(blog_id)
             shopify_articles = articles_response.get('articles', [])
             
-            synced_count = 0
-            updated_count = 0
-            
-            for shopify_article in shopify_articles:
-                article_id = str(shopify_article['id'])
-                
-                # 檢查文章是否已存在
-                existing_article = BlogArticle.query.filter_by(
-                    store_id=store_id,
-                    shopify_article_id=article_id
-                ).first()
-                
-                if existing_article:
-                    # 更新現有文章
-                    existing_article.title = shopify_article.get('title', '')
-                    existing_article.content = shopify_article.get('body_html', '')
-                    existing_article.summary = shopify_article.get('summary', '')
-                    existing_article.updated_at = datetime.utcnow()
-                    updated_count += 1
-                else:
-                    # 創建新文章
-                    content_text = re.sub(r'<[^>]+>', '', shopify_article.get('body_html', ''))
-                    word_count = len(content_text.split())
-                    
-                    new_article = BlogArticle(
-                        store_id=store_id,
-                        shopify_blog_id=blog_id,
-                        shopify_article_id=article_id,
-                        title=shopify_article.get('title', ''),
-                        content=shopify_article.get('body_html', ''),
-                        summary=shopify_article.get('summary', ''),
-                        tags=json.dumps(shopify_article.get('tags', '').split(',') if shopify_article.get('tags') else []),
-                        word_count=word_count,
-                        status='synced',
-                        published_at=datetime.utcnow(),
-                        synced_at=datetime.utcnow()
-                    )
-                    self.db_session.add(new_article)
-                    synced_count += 1
+            # 同一次返回裡重複出現的文章以最後一次為準
+            incoming = {str(item['id']): item for item in shopify_articles}
+            existing = set(self.db_session.execute(
+                select(BlogArticle.shopify_article_id).where(
+                    BlogArticle.store_id == store_id,
+                    BlogArticle.shopify_article_id.in_(list(incoming))
+                )
+            ).scalars()) if incoming else set()
+            
+            now = datetime.utcnow()
+            rows = []
+            for article_id, shopify_article in incoming.items():
+                content = shopify_article.get('body_html', '')
+                content_text = re.sub(r'<[^>]+>', '', content or '')
+                rows.append({
+                    'store_id': store_id,
+                    'shopify_blog_id': blog_id,
+                    'shopify_article_id': article_id,
+                    'title': shopify_article.get('title', ''),
+                    'content': content,
+                    'summary': shopify_article.get('summary', ''),
+                    'tags': json.dumps(shopify_article.get('tags', '').split(',') if shopify_article.get('tags') else []),
+                    'word_count': len(content_text.split()),
+                    'status': 'synced',
+                    'published_at': now,
+                    'synced_at': now,
+                    'created_at': now,
+                    'updated_at': now
+                })
+            
+            # 一條executemany upsert：新文章插入，已有文章只更新標題、內容和摘要
+            if rows:
+                self.db_session.execute(upsert_statement(
+                    BlogArticle, self.db_session.get_bind().dialect.name,
+                    index_elements=['store_id', 'shopify_article_id'],
+                    update_columns=['title', 'content', 'summary', 'updated_at']
+                ), rows)
+            
+            synced_count = len(rows) - len(existing)
+            updated_count = len(existing)
             
             self.db_session.commit()
             
@@ -324,30 +338,178 @@ class ShopifyBlogSync:
                 'error': str(e)
             }
     
-    def batch_publish_articles(self, article_ids: List[int]) -> Dict:
-        """批量發布文章到Shopify"""
-        results = []
-        success_count = 0
+    def _create_shopify_article(self, article: Dict) -> Dict:
+        """在Shopify創建一篇文章，返回單項結果（在工作線程中執行，不訪問數據庫）"""
+        try:
+            with self.shopify_api.limiter.slots:
+                result = self.shopify_api.create_blog_article(
+                    blog_id=article['blog_id'],
+                    title=article['title'],
+                    content=article['content'],
+                    summary=article['summary'],
+                    tags=article['tags']
+                )
+            shopify_article_id = self._shopify_article_id(result)
+            if shopify_article_id is None:
+                return {'article_id': article['id'], 'success': False,
+                        'error': 'Shopify response did not include an article id'}
+            return {
+                'article_id': article['id'],
+                'success': True,
+                'shopify_article_id': shopify_article_id,
+                'error': None
+            }
+        except Exception as e:
+            return {'article_id': article['id'], 'success': False, 'error': str(e)}
+    
+    @staticmethod
+    def _shopify_article_id(result: Dict) -> Optional[str]:
+        """創建文章響應裡的文章ID；沒有ID時返回None，不能存成字符串'None'"""
+        article_id = (result or {}).get('article', {}).get('id')
+        return str(article_id) if article_id is not None else None
+    
+    def iter_batch_publish_articles(self, article_ids: List[int], concurrency: int = None) -> Iterator[Dict]:
+        """並發發布文章到Shopify，每完成一篇就yield一個結果（按完成順序，index為請求中的位置）
+        
+        一次查詢載入全部文章，Shopify創建請求在商店的並發和漏桶配額內並行發送，
+        成功文章的shopify_article_id和狀態在最後一個事務裡批量寫回；
+        調用方提前停止迭代時，已發布的文章同樣會寫回。
+        """
+        limiter = self.shopify_api.limiter
+        concurrency = max(1, min(concurrency or limiter.max_concurrency, limiter.max_concurrency))
+        positions = {}
+        for index, article_id in enumerate(article_ids):
+            positions.setdefault(article_id, index)
         
-        for article_id in article_ids:
-            result = self.publish_article_to_shopify(article_id)
-            results.append({
-                'article_id': article_id,
-                'success': result['success'],
-                'error': result.get('error') if not result['success'] else None
-            })
-            
-            if result['success']:
-                success_count += 1
+        articles = {
+            article.id: article
+            for article in BlogArticle.query.filter(BlogArticle.id.in_(list(positions))).all()
+        }
+        
+        jobs = []
+        for article_id, index in positions.items():
+            article = articles.get(article_id)
+            # 這兩種失敗重試也不會成功，retryable為False
+            if article is None:
+                yield {'article_id': article_id, 'index': index, 'success': False, 'retryable': False,
+                       'error': 'Article not found'}
+            elif article.shopify_article_id:
+                yield {'article_id': article_id, 'index': index, 'success': False, 'retryable': False,
+                       'error': 'Article already published to Shopify'}
+            else:
+                # 工作線程只拿到普通字典，ORM對象留在當前線程的session裡
+                jobs.append({
+                    'id': article.id,
+                    'blog_id': article.shopify_blog_id,
+                    'title': article.title,
+                    'content': article.content,
+                    'summary': article.summary,
+                    'tags': json.loads(article.tags) if article.tags else []
+                })
         
+        published = []
+        pending = set()
+        submitted = []
+        reported = set()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='shopify-publish') as pool:
+                try:
+                    for job in jobs:
+                        future = pool.submit(self._create_shopify_article, job)
+                        submitted.append(future)
+                        pending.add(future)
+                        # 只保持有限的待處理任務，避免一次性提交全部文章
+                        if len(pending) >= concurrency * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                reported.add(future)
+                                yield self._publish_result(future.result(), positions, published)
+                    
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            reported.add(future)
+                            yield self._publish_result(future.result(), positions, published)
+                finally:
+                    # 調用方提前停止迭代時，不再發送尚未開始的請求
+                    for future in pending:
+                        future.cancel()
+        finally:
+            # 線程池退出時已等待執行中的請求完成；提前停止時這些文章同樣已在Shopify上創建，
+            # 必須一起寫回，否則重試會重複創建
+            for future in submitted:
+                if future not in reported and not future.cancelled():
+                    self._publish_result(future.result(), positions, published)
+            self._save_published(published)
+    
+    def _publish_result(self, result: Dict, positions: Dict, published: List) -> Dict:
+        result['index'] = positions[result['article_id']]
+        if result['success']:
+            published.append((result['article_id'], result['shopify_article_id']))
+        return result
+    
+    def _save_published(self, published: List):
+        """在一個事務裡寫回已發布文章的Shopify ID和狀態"""
+        if not published:
+            return
+        now = datetime.utcnow()
+        try:
+            self.db_session.execute(update(BlogArticle), [{
+                'id': article_id,
+                'shopify_article_id': shopify_article_id,
+                'status': 'synced',
+                'published_at': now,
+                'synced_at': now,
+                'updated_at': now
+            } for article_id, shopify_article_id in published])
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+    
+    def batch_publish_articles(self, article_ids: List[int],
+                               progress: Optional[Callable[[int, int], None]] = None,
+                               concurrency: int = None) -> Dict:
+        """批量發布文章到Shopify，結果按請求順序返回
+        
+        progress(已處理數, 總數) 在每篇文章完成後調用，後台任務用它匯報進度。
+        failed_items只列出在Shopify創建失敗、可以重試的文章；找不到或已發布的文章
+        只在results裡報告錯誤，不會被重試任務重新提交。
+        """
+        results = [None] * len(article_ids)
+        retryable = set()
+        completed = 0
+        
+        with closing(self.iter_batch_publish_articles(article_ids, concurrency)) as publish_results:
+            for result in publish_results:
+                results[result.pop('index')] = {
+                    'article_id': result['article_id'],
+                    'success': result['success'],
+                    'error': result.get('error')
+                }
+                if not result['success'] and result.get('retryable', True):
+                    retryable.add(result['article_id'])
+                completed += 1
+                if progress:
+                    progress(completed, len(article_ids))
+        
+        # 請求裡重複的文章ID沿用第一次出現的結果
+        first = {}
+        for index, article_id in enumerate(article_ids):
+            first.setdefault(article_id, index)
+            if results[index] is None:
+                results[index] = results[first[article_id]]
+        
+        success_count = sum(1 for item in results if item['success'])
         return {
             'success': True,
             'results': results,
             'success_count': success_count,
-            'total_count': len(article_ids)
+            'total_count': len(article_ids),
+            'failed_items': [item['article_id'] for item in results
+                             if not item['success'] and item['article_id'] in retryable]
         }
 
-
 class BlogContentOptimizer:
     """部落格內容優化器"""
     
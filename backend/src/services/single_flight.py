@@ -0,0 +1,143 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """One in-flight upstream call and everyone waiting on it"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # (loop, future) pairs for asyncio callers waiting on this call
+        self.waiters = []
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one upstream request
+
+    The first caller for a key runs the call; callers arriving while it is in
+    flight wait for its outcome and get the same result (or exception). It
+    works for threads (do) and asyncio tasks (do_async), and the two can mix:
+    a coroutine may wait on a call led by a worker thread and vice versa.
+    Nothing is remembered once a call finishes, which is what the response
+    cache is for.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable, loop: asyncio.AbstractEventLoop = None):
+        """Return (call, is_leader, future); future is set for asyncio followers"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                return call, True, None
+            self.coalesced += 1
+            future = None
+            if loop is not None:
+                future = loop.create_future()
+                call.waiters.append((loop, future))
+            return call, False, future
+
+    def _finish(self, key: Hashable, call: _Call, result: Any, error: Optional[BaseException]):
+        call.result = result
+        call.error = error
+        with self._lock:
+            self._calls.pop(key, None)
+            waiters, call.waiters = call.waiters, []
+        call.done.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # The waiter's loop has been closed; nobody is left to notify
+                pass
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn() unless an identical call is in flight, in which case wait for its result"""
+        call, is_leader, _ = self._join(key)
+        if not is_leader:
+            call.done.wait()
+            if isinstance(call.error, asyncio.CancelledError):
+                # The leader was cancelled, not failed: make the call ourselves
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, None, e)
+            raise
+        self._finish(key, call, result, None)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Coroutine counterpart of do(); fn is called to create the awaitable only when leading"""
+        call, is_leader, future = self._join(key, asyncio.get_running_loop())
+        if not is_leader:
+            try:
+                return await future
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # This caller was cancelled itself
+                    raise
+                return await fn()
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, call, None, e)
+            raise
+        self._finish(key, call, result, None)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_flight = len(self._calls)
+            leaders, coalesced = self.leaders, self.coalesced
+        total = leaders + coalesced
+        return {
+            "upstream_calls": leaders,
+            "coalesced": coalesced,
+            "in_flight": in_flight,
+            "coalesce_rate": round(coalesced / total, 4) if total else 0.0
+        }
+
+
+_default_single_flight = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Return the process-wide single-flight group, or None when coalescing is disabled"""
+    global _default_single_flight
+
+    if os.getenv('DEEPSEEK_COALESCE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _default_single_flight_lock:
+        if _default_single_flight is None:
+            _default_single_flight = SingleFlight()
+    return _default_single_flight
@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, select, update
+
+from src.models.seo import SeoTask
+from src.models.user import db
+from src.services.fair_scheduler import plan_weights
+from src.services.usage_meter import usage_scope
+
+# Task states used by background jobs; synchronous endpoints keep writing 'completed'/'failed' directly
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class TaskCancelled(BaseException):
+    """Raised inside a job when its task has been cancelled
+
+    Like asyncio.CancelledError it derives from BaseException, so the
+    `except Exception` blocks in the service layer don't swallow it.
+    """
+
+
+class TaskContext:
+    """What a job handler gets: its input plus progress reporting and cancellation checks"""
+
+    def __init__(self, task_id: int, store_id: Optional[int], input_data: Dict, language: str,
+                 progress_interval: float = 1.0):
+        self.task_id = task_id
+        self.store_id = store_id
+        self.input = input_data
+        self.language = language
+        self.progress_interval = progress_interval
+        self.done = 0
+        self.total = None
+        self._last_report = 0.0
+
+    def progress(self, done: int, total: Optional[int] = None, force: bool = False):
+        """Record progress and stop the job if it has been cancelled
+
+        Writes go through the handler's own session and commit it, so call
+        this between units of work. Reports are throttled to one per
+        `progress_interval` seconds unless `force` is set.
+        """
+        self.done = done
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+
+        db.session.execute(
+            update(SeoTask).where(SeoTask.id == self.task_id)
+            .values(progress_done=self.done, progress_total=self.total, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if self.cancelled():
+            raise TaskCancelled()
+
+    def cancelled(self) -> bool:
+        status = db.session.execute(select(SeoTask.status).where(SeoTask.id == self.task_id)).scalar()
+        return status == CANCELLING
+
+
+class _Handler:
+    __slots__ = ('fn', 'retry_key')
+
+    def __init__(self, fn: Callable[[TaskContext], Dict], retry_key: Optional[str]):
+        self.fn = fn
+        self.retry_key = retry_key
+
+
+class TaskQueue:
+    """SQLite/PostgreSQL-backed job queue on top of the seo_tasks table
+
+    submit() inserts a 'queued' SeoTask and returns at once. Worker threads
+    claim queued tasks with a conditional UPDATE (status='queued' -> 'running'),
+    which is atomic in both databases, so several processes can share the
+    queue without a broker. A handler returns the task's output_data; an
+    output with success=False or an exception marks the task failed.
+    Handlers list the items that failed under `failed_items`, and retry()
+    re-submits just those when the handler was registered with a `retry_key`.
+
+    A claimed task is leased through its updated_at column: a maintenance
+    thread refreshes it every `heartbeat_interval` seconds for each task this
+    process is running, and on the same timer puts back tasks whose lease is
+    older than `stale_after`, i.e. whose worker died. The final write is
+    fenced on the claim's attempt number, so a worker that lost its lease
+    cannot overwrite the result of the worker that took the task over.
+    """
+
+    def __init__(self, workers: int = 2, poll_interval: float = 1.0, stale_after: float = 900.0,
+                 heartbeat_interval: Optional[float] = None):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = timedelta(seconds=stale_after)
+        # Several heartbeats fit in one lease, so a slow commit never lets a live task expire
+        self.heartbeat_interval = heartbeat_interval or min(60.0, stale_after / 3)
+        self.started = 0
+        self.finished = {COMPLETED: 0, FAILED: 0, CANCELLED: 0}
+        self._handlers: Dict[str, _Handler] = {}
+        self._wakeup = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._running: Dict[int, int] = {}
+        self._app = None
+        self._threads: List[threading.Thread] = []
+
+    def register(self, task_type: str, retry_key: Optional[str] = None):
+        """Decorator registering the handler for a task type
+
+        `retry_key` names the input field holding the list of items to work
+        on; retry() replaces it with the task's failed_items.
+        """
+        def decorator(fn):
+            self._handlers[task_type] = _Handler(fn, retry_key)
+            return fn
+        return decorator
+
+    def start(self, app):
+        """Start the worker threads for a Flask app; safe to call more than once"""
+        if self._threads:
+            return
+        self._app = app
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'task-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._maintain, name='task-maintenance', daemon=True).start()
+
+    def submit(self, task_type: str, input_data: Dict, store_id: Optional[int] = None,
+               language: str = 'en') -> SeoTask:
+        if task_type not in self._handlers:
+            raise ValueError(f"No handler registered for task type: {task_type}")
+        task = SeoTask(
+            store_id=store_id,
+            task_type=task_type,
+            status=QUEUED,
+            language=language,
+            input_data=json.dumps(input_data),
+            progress_done=0
+        )
+        db.session.add(task)
+        db.session.commit()
+        with self._wakeup:
+            self._wakeup.notify()
+        return task
+
+    def cancel(self, task_id: int) -> Optional[str]:
+        """Cancel a task; queued tasks stop at once, running ones at their next progress report"""
+        now = datetime.utcnow()
+        db.session.execute(
+            update(SeoTask).where(SeoTask.id == task_id, SeoTask.status == QUEUED)
+            .values(status=CANCELLED, completed_at=now, updated_at=now)
+        )
+        db.session.execute(
+            update(SeoTask).where(SeoTask.id == task_id, SeoTask.status == RUNNING)
+            .values(status=CANCELLING, updated_at=now)
+        )
+        db.session.commit()
+        return db.session.execute(select(SeoTask.status).where(SeoTask.id == task_id)).scalar()
+
+    def retry(self, task: SeoTask) -> Optional[SeoTask]:
+        """Submit a new task for the failed items of `task` (or all of it); None if nothing to retry"""
+        handler = self._handlers.get(task.task_type)
+        if handler is None or task.status not in FINISHED_STATES:
+            return None
+
+        input_data = json.loads(task.input_data) if task.input_data else {}
+        output = json.loads(task.output_data) if task.output_data else {}
+        failed_items = output.get('failed_items')
+        if handler.retry_key and failed_items:
+            input_data[handler.retry_key] = failed_items
+        elif task.status == COMPLETED:
+            return None
+        input_data['retry_of'] = task.id
+        return self.submit(task.task_type, input_data, task.store_id, task.language)
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    ran = self._run_next()
+            except Exception as e:
+                print(f"Task worker error: {str(e)}")
+                ran = False
+            if not ran:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+
+    def _maintain(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self._heartbeat()
+                    self._requeue_stale()
+            except Exception as e:
+                print(f"Task maintenance error: {str(e)}")
+            time.sleep(self.heartbeat_interval)
+
+    def _next_task_id(self) -> Optional[int]:
+        """Oldest queued task of the store with the fewest running tasks per unit of plan weight
+
+        A store that queued thousands of tasks only gets its next one once
+        other stores with queued work have caught up with it.
+        """
+        oldest = db.session.execute(
+            select(SeoTask.store_id, func.min(SeoTask.id))
+            .where(SeoTask.status == QUEUED, SeoTask.task_type.in_(list(self._handlers)))
+            .group_by(SeoTask.store_id)
+        ).all()
+        if not oldest:
+            return None
+        if len(oldest) == 1:
+            return oldest[0][1]
+
+        running = dict(db.session.execute(
+            select(SeoTask.store_id, func.count())
+            .where(SeoTask.status.in_([RUNNING, CANCELLING]))
+            .group_by(SeoTask.store_id)
+        ).all())
+        return min(
+            oldest,
+            key=lambda row: (running.get(row[0], 0) / plan_weights.for_store(row[0]), row[1])
+        )[1]
+
+    def _claim(self) -> Optional[SeoTask]:
+        # Another worker (or process) may claim the same row first; then try the next one
+        while True:
+            task_id = self._next_task_id()
+            if task_id is None:
+                db.session.rollback()
+                return None
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                update(SeoTask).where(SeoTask.id == task_id, SeoTask.status == QUEUED)
+                .values(status=RUNNING, started_at=now, updated_at=now,
+                        attempts=func.coalesce(SeoTask.attempts, 0) + 1)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(SeoTask, task_id)
+
+    def _run_next(self) -> bool:
+        task = self._claim()
+        if task is None:
+            return False
+        with self._stats_lock:
+            self.started += 1
+            self._running[task.id] = task.attempts
+        try:
+            self._execute(task, task.attempts)
+        finally:
+            with self._stats_lock:
+                self._running.pop(task.id, None)
+        return True
+
+    def _execute(self, task: SeoTask, attempts: int):
+        """Run a claimed task's handler and record its outcome under the claim's attempt number"""
+        context = TaskContext(task.id, task.store_id,
+                              json.loads(task.input_data) if task.input_data else {}, task.language)
+        handler = self._handlers[task.task_type]
+        try:
+            # AI calls made by the job are metered and scheduled against the task's store
+            with usage_scope(task.store_id):
+                output = handler.fn(context) or {}
+            status = FAILED if output.get('success') is False else COMPLETED
+        except TaskCancelled:
+            output, status = {'success': False, 'error': 'Task cancelled'}, CANCELLED
+        except Exception as e:
+            output, status = {'success': False, 'error': str(e)}, FAILED
+        finally:
+            db.session.rollback()
+
+        if status != CANCELLED and context.cancelled():
+            # Cancelled after the last progress report: keep the result but honour the request
+            status = CANCELLED
+        now = datetime.utcnow()
+        written = db.session.execute(
+            update(SeoTask).where(SeoTask.id == task.id, SeoTask.attempts == attempts)
+            .values(status=status, output_data=json.dumps(output), completed_at=now, updated_at=now,
+                    progress_done=context.done, progress_total=context.total)
+        ).rowcount
+        db.session.commit()
+        if not written:
+            print(f"Task {task.id} lost its lease and was claimed again; discarding this run's result")
+            return
+        with self._stats_lock:
+            self.finished[status] += 1
+
+    def _heartbeat(self):
+        """Renew the lease of every task this process is running"""
+        with self._stats_lock:
+            running = dict(self._running)
+        if not running:
+            return
+        db.session.execute(
+            update(SeoTask).where(SeoTask.id.in_(list(running)), SeoTask.status.in_([RUNNING, CANCELLING]))
+            .values(updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def _requeue_stale(self):
+        """Put back tasks whose lease expired because their worker died without finishing them"""
+        cutoff = datetime.utcnow() - self.stale_after
+        db.session.execute(
+            update(SeoTask).where(SeoTask.status == RUNNING, SeoTask.updated_at < cutoff)
+            .values(status=QUEUED)
+        )
+        db.session.execute(
+            update(SeoTask).where(SeoTask.status == CANCELLING, SeoTask.updated_at < cutoff)
+            .values(status=CANCELLED, completed_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "workers": len(self._threads),
+                "started": self.started,
+                **self.finished
+            }
+
+
+task_queue = TaskQueue(
+    workers=int(os.getenv('TASK_WORKERS', '2')),
+    poll_interval=float(os.getenv('TASK_POLL_INTERVAL_SECONDS', '1')),
+    stale_after=float(os.getenv('TASK_STALE_SECONDS', '900')),
+    heartbeat_interval=float(os.getenv('TASK_HEARTBEAT_SECONDS') or 0) or None
+)
@@ -0,0 +1,182 @@
+import atexit
+import contextvars
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from flask import g, request
+from sqlalchemy import insert
+
+from src.models.dialect import dialect_insert
+from src.models.seo import AIUsageDaily, AIUsageRecord
+from src.models.user import db
+
+# Store the current AI call is billed to; set by routes and workers via usage_scope()
+_current_store_id = contextvars.ContextVar('usage_store_id', default=None)
+
+
+@contextmanager
+def usage_scope(store_id: Optional[int]):
+    """Attribute every AI call made inside the block to `store_id`"""
+    token = _current_store_id.set(store_id)
+    try:
+        yield
+    finally:
+        _current_store_id.reset(token)
+
+
+def current_store_id() -> Optional[int]:
+    return _current_store_id.get()
+
+
+def scope_requests(blueprint):
+    """Attribute AI calls made while serving a blueprint's requests to the request's store_id"""
+
+    @blueprint.before_request
+    def _enter_usage_scope():
+        data = request.get_json(silent=True) if request.is_json else None
+        store_id = data.get('store_id') if isinstance(data, dict) else None
+        if store_id is None:
+            store_id = request.args.get('store_id', type=int)
+        g.usage_scope_token = _current_store_id.set(store_id)
+
+    @blueprint.teardown_request
+    def _exit_usage_scope(exc):
+        token = g.pop('usage_scope_token', None)
+        if token is None:
+            return
+        try:
+            _current_store_id.reset(token)
+        except ValueError:
+            # Streamed responses can finish in a different context than they started
+            _current_store_id.set(None)
+
+
+class UsageMeter:
+    """Buffered, batched writer for the AI usage ledger
+
+    record() only appends to an in-memory queue, so metering never adds a
+    database commit to the request path. A background thread drains the
+    queue every `flush_interval` seconds (or sooner once `batch_size` rows are
+    waiting), inserts the raw rows with one executemany and folds them into
+    the ai_usage_daily rollup that dashboards read.
+    """
+
+    def __init__(self, flush_interval: float = 2.0, batch_size: int = 500, max_queue: int = 100000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+
+    def start(self, app):
+        """Start the background writer for a Flask app; safe to call more than once"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='usage-meter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def record(self, task_type: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               latency_ms: int = 0, cache_hit: bool = False, store_id: Optional[int] = None):
+        if self._app is None:
+            return
+        row = {
+            "store_id": store_id if store_id is not None else current_store_id(),
+            "task_type": task_type,
+            "model": model,
+            "prompt_tokens": int(prompt_tokens or 0),
+            "completion_tokens": int(completion_tokens or 0),
+            "latency_ms": int(latency_ms or 0),
+            "cache_hit": bool(cache_hit),
+            "created_at": datetime.utcnow()
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Losing a metering row is better than blocking a generation
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Usage meter flush failed: {str(e)}")
+
+    def _drain(self) -> List[Dict]:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self):
+        """Write everything queued so far in one transaction"""
+        if self._app is None:
+            return
+        with self._flush_lock:
+            rows = self._drain()
+            if not rows:
+                return
+            with self._app.app_context():
+                self._write(rows)
+            self.written += len(rows)
+
+    def _write(self, rows: List[Dict]):
+        rollups = {}
+        for row in rows:
+            key = (row["store_id"] or 0, row["created_at"].date(), row["task_type"])
+            rollup = rollups.setdefault(key, {
+                "store_id": key[0], "day": key[1], "task_type": key[2],
+                "request_count": 0, "cache_hits": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "total_latency_ms": 0
+            })
+            rollup["request_count"] += 1
+            rollup["cache_hits"] += int(row["cache_hit"])
+            rollup["prompt_tokens"] += row["prompt_tokens"]
+            rollup["completion_tokens"] += row["completion_tokens"]
+            rollup["total_latency_ms"] += row["latency_ms"]
+
+        engine = db.engine
+        stmt = dialect_insert(AIUsageDaily, engine.dialect.name)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['store_id', 'day', 'task_type'],
+            set_={
+                column: getattr(AIUsageDaily, column) + getattr(stmt.excluded, column)
+                for column in ('request_count', 'cache_hits', 'prompt_tokens',
+                               'completion_tokens', 'total_latency_ms')
+            }
+        )
+
+        with engine.begin() as conn:
+            conn.execute(insert(AIUsageRecord), rows)
+            for rollup in rollups.values():
+                conn.execute(stmt, rollup)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+
+usage_meter = UsageMeter(
+    flush_interval=float(os.getenv('USAGE_FLUSH_INTERVAL_SECONDS', '2')),
+    batch_size=int(os.getenv('USAGE_FLUSH_BATCH_SIZE', '500'))
+)
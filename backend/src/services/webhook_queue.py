@@ -0,0 +1,249 @@
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select, update
+
+from src.models.dialect import dialect_insert
+from src.models.seo import Product, Store, WebhookEvent, product_fingerprint
+from src.models.user import db
+from src.services.shopify_api import _parse_shopify_time
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_SHOPIFY_SUFFIX = '.myshopify.com'
+
+
+def _bare_shop_domain(shop_domain: str) -> str:
+    """去掉.myshopify.com後綴；webhook頭總是帶後綴，/connect保存的商店域名可能不帶"""
+    return shop_domain[:-len(_SHOPIFY_SUFFIX)] if shop_domain.endswith(_SHOPIFY_SUFFIX) else shop_domain
+
+
+class WebhookQueue:
+    """Shopify產品webhook的持久化隊列和後台批量應用器
+
+    enqueue()只把webhook寫入webhook_events表就返回，按X-Shopify-Webhook-Id
+    去重（Shopify重投遞的同一事件不會入隊兩次）。後台線程每`batch_interval`秒
+    取出一批待處理事件，同一商店同一產品只保留updated_at最新的那條，
+    用一次查詢預載產品、一條executemany UPDATE寫入，再在同一事務裡標記事件狀態。
+    應用失敗時事件保持pending，下個窗口重試；重複應用是冪等的。
+    """
+
+    def __init__(self, batch_interval: float = 2.0, batch_size: int = 1000, retention_hours: float = 48):
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.retention = timedelta(hours=retention_hours)
+        self.enqueued = 0
+        self.duplicates = 0
+        self.applied = 0
+        self.superseded = 0
+        self._wakeup = threading.Event()
+        self._apply_lock = threading.Lock()
+        self._last_purge = 0.0
+        self._app = None
+        self._thread = None
+
+    def start(self, app):
+        """為Flask應用啟動後台應用線程，重複調用無副作用"""
+        if self._thread is not None:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='webhook-queue', daemon=True)
+        self._thread.start()
+        atexit.register(self.drain)
+
+    def enqueue(self, topic: str, payload: str, webhook_id: Optional[str] = None,
+                shop_domain: Optional[str] = None) -> bool:
+        """持久化一條webhook並提交；重複的webhook_id返回False"""
+        try:
+            shopify_product_id = str(json.loads(payload)['id'])
+        except (ValueError, TypeError, KeyError):
+            shopify_product_id = None
+
+        stmt = dialect_insert(WebhookEvent, db.engine.dialect.name).on_conflict_do_nothing(
+            index_elements=['webhook_id']
+        ).values(
+            webhook_id=webhook_id or None,
+            topic=topic,
+            shop_domain=shop_domain,
+            shopify_product_id=shopify_product_id,
+            payload=payload,
+            status='pending',
+            received_at=datetime.utcnow()
+        )
+        result = db.session.execute(stmt)
+        db.session.commit()
+
+        if result.rowcount == 0:
+            self.duplicates += 1
+            return False
+        self.enqueued += 1
+        if self.enqueued % self.batch_size == 0:
+            self._wakeup.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.batch_interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Webhook queue apply failed: {str(e)}")
+
+    def drain(self):
+        """應用所有待處理事件，每批一個事務"""
+        if self._app is None:
+            return
+        with self._apply_lock, self._app.app_context():
+            while self._apply_batch() >= self.batch_size:
+                pass
+            if time.monotonic() - self._last_purge > 3600:
+                self._purge()
+                self._last_purge = time.monotonic()
+
+    def _apply_batch(self) -> int:
+        """應用一批事件，返回取出的事件數"""
+        session = db.session
+        try:
+            events = session.execute(
+                select(WebhookEvent.id, WebhookEvent.shop_domain, WebhookEvent.shopify_product_id,
+                       WebhookEvent.payload)
+                .where(WebhookEvent.status == 'pending')
+                .order_by(WebhookEvent.id)
+                .limit(self.batch_size)
+            ).all()
+            if not events:
+                return 0
+
+            # 同一商店同一產品只保留最新的一條：按產品的updated_at，相同時按入隊順序
+            latest = {}
+            failed = []
+            superseded = []
+            for event in events:
+                try:
+                    data = json.loads(event.payload)
+                except ValueError:
+                    failed.append(event.id)
+                    continue
+                if not isinstance(data, dict) or event.shopify_product_id is None:
+                    failed.append(event.id)
+                    continue
+
+                order = (_parse_shopify_time(data.get('updated_at')) or _EPOCH, event.id)
+                key = (event.shop_domain, event.shopify_product_id)
+                current = latest.get(key)
+                if current is None or order >= current[0]:
+                    if current is not None:
+                        superseded.append(current[1])
+                    latest[key] = (order, event.id, data)
+                else:
+                    superseded.append(event.id)
+
+            applied, skipped = self._apply_products(session, latest)
+
+            now = datetime.utcnow()
+            for status, ids in (('applied', applied), ('skipped', skipped),
+                                ('superseded', superseded), ('failed', failed)):
+                if ids:
+                    session.execute(
+                        update(WebhookEvent)
+                        .where(WebhookEvent.id.in_(ids))
+                        .values(status=status, processed_at=now)
+                    )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.remove()
+
+        self.applied += len(applied)
+        self.superseded += len(superseded)
+        return len(events)
+
+    def _apply_products(self, session, latest: Dict) -> tuple:
+        """把每個產品的最新payload寫入本地產品，返回(已應用事件id, 跳過事件id)"""
+        # 商店按不帶後綴的域名匹配，帶或不帶.myshopify.com保存的商店都能找到
+        bare_domains = {_bare_shop_domain(shop_domain) for shop_domain, _ in latest if shop_domain}
+        candidates = [domain for bare in bare_domains for domain in (bare, bare + _SHOPIFY_SUFFIX)]
+        store_ids = {
+            _bare_shop_domain(shop_domain): store_id
+            for shop_domain, store_id in session.execute(
+                select(Store.shop_domain, Store.id).where(Store.shop_domain.in_(candidates))
+            )
+        } if candidates else {}
+
+        query = (
+            select(Product.id, Product.store_id, Product.shopify_product_id,
+                   Product.title, Product.description, Product.content_hash)
+            .where(Product.shopify_product_id.in_([product_id for _, product_id in latest]))
+        )
+        if all(shop_domain for shop_domain, _ in latest):
+            # 都帶有商店域名時按(store_id, shopify_product_id)走唯一索引
+            query = query.where(Product.store_id.in_(list(store_ids.values())))
+        products = {}
+        for row in session.execute(query):
+            products.setdefault(row.shopify_product_id, []).append(row)
+
+        now = datetime.utcnow()
+        updates = []
+        applied = []
+        skipped = []
+        for (shop_domain, product_id), (_, event_id, data) in latest.items():
+            rows = products.get(product_id, [])
+            if shop_domain:
+                # 不認識的商店不應用，避免按產品ID寫到別的商店的產品上
+                store_id = store_ids.get(_bare_shop_domain(shop_domain))
+                rows = [row for row in rows if row.store_id == store_id]
+            if not rows:
+                skipped.append(event_id)
+                continue
+
+            for row in rows:
+                title = data.get('title', row.title)
+                description = data.get('body_html', row.description)
+                content_hash = product_fingerprint(title, description)
+                # 標題和描述都沒變（例如只改了庫存）時不寫庫
+                if content_hash == row.content_hash:
+                    continue
+                updates.append({
+                    'id': row.id,
+                    'title': title,
+                    'description': description,
+                    'content_hash': content_hash,
+                    'updated_at': now
+                })
+            applied.append(event_id)
+
+        if updates:
+            session.execute(update(Product), updates)
+        return applied, skipped
+
+    def _purge(self):
+        """刪除超過保留期的已處理事件；保留期內的webhook_id仍用於去重"""
+        cutoff = datetime.utcnow() - self.retention
+        db.session.execute(
+            delete(WebhookEvent)
+            .where(WebhookEvent.status != 'pending', WebhookEvent.processed_at < cutoff)
+        )
+        db.session.commit()
+
+    def stats(self) -> Dict:
+        return {
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "applied": self.applied,
+            "superseded": self.superseded
+        }
+
+
+webhook_queue = WebhookQueue(
+    batch_interval=float(os.getenv('WEBHOOK_BATCH_INTERVAL_SECONDS', '2')),
+    batch_size=int(os.getenv('WEBHOOK_BATCH_SIZE', '1000')),
+    retention_hours=float(os.getenv('WEBHOOK_RETENTION_HOURS', '48'))
+)
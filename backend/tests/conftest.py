@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.user import db  # noqa: E402
+import src.models.seo  # noqa: E402,F401
+import src.services.shopify_blog  # noqa: E402,F401
+
+
+@pytest.fixture
+def app():
+    """In-memory SQLite app with the API blueprints; no background workers are started"""
+    from src.routes.seo import seo_bp
+    from src.routes.shopify import shopify_bp
+    from src.routes.blog import blog_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False
+    )
+    db.init_app(app)
+    app.register_blueprint(seo_bp, url_prefix='/api/seo')
+    app.register_blueprint(shopify_bp, url_prefix='/api/shopify')
+    app.register_blueprint(blog_bp, url_prefix='/api/blog')
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
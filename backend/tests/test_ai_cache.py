@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from src.services.ai_cache import LRUCacheTier, ResponseCache, SQLiteCacheTier
+
+
+def test_cache_hits_do_not_write(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'cache.db'))
+    tier.set('a', 'alpha')
+    conn = tier._connection()
+    writes = conn.total_changes
+
+    for _ in range(10):
+        assert tier.get('a') == 'alpha'
+
+    assert conn.total_changes == writes
+
+
+def test_batched_access_times_keep_eviction_least_recently_used(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'cache.db'), max_entries=2, evict_every=1000)
+    tier.set('old', '1')
+    tier.set('new', '2')
+    # The hit is written with the next insert, so 'old' is now the most recently used
+    assert tier.get('old') == '1'
+    tier.set('newest', '3')
+
+    tier.evict()
+
+    assert tier.get('old') == '1'
+    assert tier.get('newest') == '3'
+    assert tier.get('new') is None
+
+
+def test_access_times_are_flushed_once_the_batch_is_full(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'cache.db'), touch_batch=3)
+    for key in 'abc':
+        tier.set(key, key)
+    conn = tier._connection()
+    writes = conn.total_changes
+
+    tier.get('a')
+    tier.get('b')
+    assert conn.total_changes == writes
+    tier.get('c')
+
+    assert conn.total_changes == writes + 3
+    assert not tier._touched
+
+
+def test_async_lookups_run_the_persistent_tier_off_the_event_loop(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'cache.db'))
+    cache = ResponseCache(memory=LRUCacheTier(), persistent=tier)
+    threads = []
+    get = tier.get
+
+    def recording_get(key):
+        threads.append(threading.get_ident())
+        return get(key)
+
+    tier.get = recording_get
+
+    async def main():
+        await cache.set_async('k', 'value')
+        cache.memory.clear()
+        return threading.get_ident(), await cache.get_async('k'), await cache.get_async('missing')
+
+    loop_thread, value, missing = asyncio.run(main())
+
+    assert value == 'value' and missing is None
+    assert threads and loop_thread not in threads
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    # The persistent hit was promoted into the memory tier
+    assert cache.memory.get('k') == 'value'
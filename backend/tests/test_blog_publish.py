@@ -0,0 +1,102 @@
+import threading
+import time
+
+from src.models.seo import Store
+from src.models.user import db
+from src.services.shopify_api import ShopifyAPIService
+from src.services.shopify_blog import BlogArticle, ShopifyBlogSync
+
+
+def _service(app, monkeypatch, responses):
+    def create_blog_article(self, blog_id, title, content, summary, tags):
+        return responses[title]
+
+    monkeypatch.setattr(ShopifyAPIService, 'create_blog_article', create_blog_article)
+    return ShopifyBlogSync(ShopifyAPIService('demo-store.myshopify.com', 'token'), db.session)
+
+
+def _article(store_id, title):
+    article = BlogArticle(store_id=store_id, shopify_blog_id='77', title=title, content='<p>Body</p>')
+    db.session.add(article)
+    db.session.commit()
+    return article.id
+
+
+def test_batch_publish_treats_missing_article_id_as_failure(app, monkeypatch):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    published_id = _article(store.id, 'Published')
+    missing_id = _article(store.id, 'Missing id')
+    service = _service(app, monkeypatch, {
+        'Published': {'article': {'id': 9001}},
+        'Missing id': {'article': {}},
+    })
+
+    result = service.batch_publish_articles([published_id, missing_id])
+
+    assert result['success_count'] == 1
+    assert result['failed_items'] == [missing_id]
+    db.session.expire_all()
+    assert db.session.get(BlogArticle, published_id).shopify_article_id == '9001'
+    missing = db.session.get(BlogArticle, missing_id)
+    assert missing.shopify_article_id is None
+    assert missing.status == 'draft'
+
+
+def test_publish_article_without_article_id_is_not_saved(app, monkeypatch):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    article_id = _article(store.id, 'Missing id')
+    service = _service(app, monkeypatch, {'Missing id': {}})
+
+    result = service.publish_article_to_shopify(article_id)
+
+    assert not result['success']
+    assert db.session.get(BlogArticle, article_id).shopify_article_id is None
+
+
+def test_stopping_early_saves_every_article_created_on_shopify(app, monkeypatch):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    article_ids = [_article(store.id, f'Article {index}') for index in range(10)]
+    created = []
+    lock = threading.Lock()
+
+    def create_blog_article(self, blog_id, title, content, summary, tags):
+        time.sleep(0.05)
+        with lock:
+            created.append(title)
+            return {'article': {'id': 5000 + len(created)}}
+
+    monkeypatch.setattr(ShopifyAPIService, 'create_blog_article', create_blog_article)
+    service = ShopifyBlogSync(ShopifyAPIService('demo-store.myshopify.com', 'token'), db.session)
+
+    results = service.iter_batch_publish_articles(article_ids, concurrency=4)
+    next(results)
+    results.close()
+
+    db.session.expire_all()
+    saved = BlogArticle.query.filter(BlogArticle.shopify_article_id.isnot(None)).all()
+    assert len(created) > 1
+    assert sorted(article.title for article in saved) == sorted(created)
+    assert all(article.status == 'synced' for article in saved)
+
+
+def test_failed_items_only_lists_retryable_creates(app, monkeypatch):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    failing_id = _article(store.id, 'Failing')
+    published_id = _article(store.id, 'Already published')
+    article = db.session.get(BlogArticle, published_id)
+    article.shopify_article_id = '42'
+    db.session.commit()
+    service = _service(app, monkeypatch, {'Failing': {'article': {}}})
+
+    result = service.batch_publish_articles([failing_id, published_id, 999999])
+
+    assert [item['success'] for item in result['results']] == [False, False, False]
+    assert result['failed_items'] == [failing_id]
@@ -0,0 +1,70 @@
+import pytest
+import requests
+
+from src.services.deepseek_ai import DeepSeekAIService
+from src.services.resilience import CircuitBreaker
+
+
+class _StreamResponse:
+    status_code = 200
+    headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        yield 'data: {"choices": [{"delta": {"content": "Hello"}}]}'
+        raise requests.exceptions.ReadTimeout('read timed out')
+
+
+class _Session:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    def post(self, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+def _service(session):
+    return DeepSeekAIService(api_key='stream-test', session=session,
+                             circuit_breaker=CircuitBreaker(failure_threshold=2), single_flight=None)
+
+
+def _stream(service):
+    return service._stream_completion([{'role': 'user', 'content': 'Write'}], max_tokens=50)
+
+
+def test_stream_connect_timeout_counts_as_breaker_failure():
+    service = _service(_Session(error=requests.exceptions.ConnectTimeout('connect timed out')))
+
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        list(_stream(service))
+
+    assert service.circuit_breaker.failures == 1
+
+
+def test_stream_read_timeout_mid_stream_counts_as_breaker_failure():
+    service = _service(_Session(response=_StreamResponse()))
+    chunks = _stream(service)
+
+    assert next(chunks) == 'Hello'
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        next(chunks)
+
+    assert service.circuit_breaker.failures == 1
+
+
+def test_repeated_stream_failures_open_the_breaker():
+    service = _service(_Session(error=requests.exceptions.ConnectionError('refused')))
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(_stream(service))
+
+    assert service.circuit_breaker.stats()['state'] == CircuitBreaker.OPEN
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+from src.services.fair_scheduler import FairScheduler
+
+
+def test_async_weight_lookup_runs_off_the_event_loop():
+    lookups = []
+
+    def weight_for(key):
+        lookups.append(threading.get_ident())
+        return 4.0
+
+    scheduler = FairScheduler('test', capacity=2, per_store_limit=2, weight_for=weight_for)
+
+    async def call():
+        async with scheduler.slot_async('store-1'):
+            return threading.get_ident()
+
+    loop_thread = asyncio.run(call())
+
+    assert lookups and loop_thread not in lookups
+    assert scheduler.stats()['stores']['store-1']['weight'] == 4.0
+    assert scheduler.running == 0
+
+
+def test_async_waiters_are_granted_in_weighted_order():
+    scheduler = FairScheduler('test', capacity=1, per_store_limit=1,
+                              weight_for=lambda key: {'big': 1.0, 'small': 4.0}[key])
+    order = []
+
+    async def call(key):
+        async with scheduler.slot_async(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    async def main():
+        scheduler.acquire('big')
+        tasks = [asyncio.create_task(call(key)) for key in ['big', 'big', 'small', 'small']]
+        while len(scheduler._waiters) < len(tasks):
+            await asyncio.sleep(0.001)
+        scheduler.release('big')
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    # Weight 4 finishes its virtual time four times faster, so both small calls go first
+    assert order == ['small', 'small', 'big', 'big']
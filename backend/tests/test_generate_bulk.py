@@ -0,0 +1,78 @@
+import pytest
+
+import src.routes.seo as seo_routes
+from src.models.seo import Product, Store, product_fingerprint
+from src.models.user import db
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    async def generate_title(product_title, **kwargs):
+        return {"optimized_title": f"SEO {product_title}", "seo_score": 80}
+
+    async def generate_description(product_title, **kwargs):
+        return {"optimized_description": f"About {product_title}", "seo_score": 70}
+
+    monkeypatch.setattr(seo_routes.async_ai_service, 'generate_title', generate_title)
+    monkeypatch.setattr(seo_routes.async_ai_service, 'generate_description', generate_description)
+
+
+@pytest.fixture
+def product_id(app):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    product = Product(store_id=store.id, shopify_product_id='1', title='Headphones', description='Wireless',
+                      content_hash=product_fingerprint('Headphones', 'Wireless'))
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+def test_bulk_generation_stores_fields_with_the_hash(client, fake_ai, product_id):
+    response = client.post('/api/seo/generate-bulk', json={"product_ids": [product_id], "use_cache": False})
+    assert response.get_json()['succeeded'] == 1
+
+    product = db.session.get(Product, product_id)
+    assert product.seo_title == 'SEO Headphones'
+    assert product.seo_description == 'About Headphones'
+    assert product.optimized_hash == product.content_hash
+    assert not product.source_changed
+
+    skipped = client.post('/api/seo/generate-bulk', json={"product_ids": [product_id], "skip_unchanged": True})
+    assert skipped.get_json()['skipped'] == 1
+
+
+def test_partial_generation_does_not_mark_product_optimized(client, fake_ai, product_id):
+    response = client.post('/api/seo/generate-bulk',
+                           json={"product_ids": [product_id], "operations": ["title"], "use_cache": False})
+    assert response.get_json()['succeeded'] == 1
+
+    product = db.session.get(Product, product_id)
+    assert product.seo_title == 'SEO Headphones'
+    assert product.seo_description is None
+    assert product.optimized_hash is None
+
+
+@pytest.mark.parametrize('field, value', [
+    ('parallelism', 'abc'),
+    ('batch_size', [4]),
+    ('pack_size', 'ten'),
+    ('parallelism', True),
+])
+def test_bulk_generation_rejects_non_integer_options(client, fake_ai, product_id, field, value):
+    response = client.post('/api/seo/generate-bulk',
+                           json={"product_ids": [product_id], "packed": True, field: value})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == f"{field} must be an integer"
+
+
+def test_bulk_generation_null_options_use_defaults(client, fake_ai, product_id):
+    response = client.post('/api/seo/generate-bulk', json={
+        "product_ids": [product_id], "use_cache": False, "parallelism": None, "batch_size": None,
+        "operations": ["description"]
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['succeeded'] == 1
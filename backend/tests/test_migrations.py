@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine, inspect, text
+
+from src.models.migrations import HOT_PATH_INDEXES, MIGRATIONS, run_migrations
+from src.models.user import db
+
+
+def _legacy_engine():
+    """A database with every table but none of the named indexes, as created before the migrations"""
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for (name,) in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")).all():
+            conn.execute(text(f"DROP INDEX {name}"))
+    return engine
+
+
+def _index_names(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+
+def test_migrations_dedupe_and_create_frozen_indexes():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO stores (id, shop_domain, access_token) VALUES (1, 'demo', 't')"))
+        conn.execute(text("INSERT INTO products (store_id, shopify_product_id, title) "
+                          "VALUES (1, 'p1', 'old'), (1, 'p1', 'new'), (1, 'p2', 'other')"))
+        conn.execute(text("INSERT INTO blog_articles (store_id, shopify_blog_id, shopify_article_id, title, content) "
+                          "VALUES (1, 'b', 'a1', 'old', 'x'), (1, 'b', 'a1', 'new', 'x'), "
+                          "(1, 'b', NULL, 'draft', 'x'), (1, 'b', NULL, 'draft 2', 'x')"))
+
+    assert run_migrations(engine) == [name for _, name, _ in MIGRATIONS]
+    assert run_migrations(engine) == []
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT title FROM products WHERE shopify_product_id = 'p1'")).scalars().all() == ['new']
+        assert sorted(conn.execute(text("SELECT title FROM blog_articles")).scalars()) == ['draft', 'draft 2', 'new']
+    assert 'uq_products_store_shopify_product' in _index_names(engine, 'products')
+    assert 'ix_products_store_created' in _index_names(engine, 'products')
+    assert 'uq_blog_articles_store_shopify_article' in _index_names(engine, 'blog_articles')
+
+
+def test_hot_path_migration_does_not_pick_up_later_model_indexes():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        migrate = {name: migrate for _, name, migrate in MIGRATIONS}['hot_path_indexes']
+        migrate(conn)
+
+    assert 'uq_blog_articles_store_shopify_article' not in _index_names(engine, 'blog_articles')
+    assert 'ix_products_store_created' not in _index_names(engine, 'products')
+    created = {name for name, *_ in HOT_PATH_INDEXES}
+    assert created <= set().union(*(_index_names(engine, table) for table in
+                                    ('products', 'seo_tasks', 'blog_articles', 'keywords')))
+
+
+def test_migrated_indexes_match_the_models():
+    """A migrated legacy database ends up with the same indexes create_all gives a new one"""
+    migrated = _legacy_engine()
+    run_migrations(migrated)
+    fresh = create_engine('sqlite://')
+    db.metadata.create_all(fresh)
+
+    for table in ('products', 'seo_tasks', 'blog_articles', 'keywords'):
+        assert _index_names(migrated, table) == _index_names(fresh, table)
+
@@ -0,0 +1,57 @@
+import pytest
+
+from src.models.seo import Product, Store, product_fingerprint
+from src.models.user import db
+from src.services.shopify_api import ShopifyAPIService
+
+
+@pytest.fixture
+def product_id(app):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    product = Product(store_id=store.id, shopify_product_id='1001', title='Headphones', description='Wireless',
+                      content_hash=product_fingerprint('Headphones', 'Wireless'))
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+def test_optimize_product_saves_seo_and_marks_it_optimized(client, monkeypatch, product_id):
+    pushed = []
+
+    def update_product_seo(self, shopify_product_id, seo_title, seo_description):
+        pushed.append((shopify_product_id, seo_title, seo_description))
+        return {'product': {'id': shopify_product_id}}
+
+    monkeypatch.setattr(ShopifyAPIService, 'update_product_seo', update_product_seo)
+
+    response = client.post(f'/api/shopify/products/{product_id}/optimize',
+                           json={'seo_title': 'Best Headphones', 'seo_description': 'Great sound'})
+
+    assert response.status_code == 200
+    assert pushed == [('1001', 'Best Headphones', 'Great sound')]
+    product = db.session.get(Product, product_id)
+    assert product.seo_title == 'Best Headphones'
+    assert product.optimized_hash == product.content_hash
+    assert not product.source_changed
+
+
+def test_optimize_product_rolls_back_when_push_fails(client, monkeypatch, product_id):
+    def update_product_seo(self, *args):
+        raise RuntimeError('Shopify unavailable')
+
+    monkeypatch.setattr(ShopifyAPIService, 'update_product_seo', update_product_seo)
+
+    response = client.post(f'/api/shopify/products/{product_id}/optimize',
+                           json={'seo_title': 'Best Headphones', 'seo_description': 'Great sound'})
+
+    assert response.status_code == 500
+    product = db.session.get(Product, product_id)
+    assert product.seo_title is None
+    assert product.optimized_hash is None
+
+
+def test_optimize_unknown_product_returns_404(client):
+    response = client.post('/api/shopify/products/999/optimize', json={'seo_title': 'a', 'seo_description': 'b'})
+    assert response.status_code == 404
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from src.models.seo import Product, Store
+from src.models.user import db
+from src.services.shopify_api import SYNC_WATERMARK_KEY, ShopifyProductSync
+
+
+class _ShopifyAPI:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def iter_product_pages(self, updated_at_min=None):
+        self.requested.append(updated_at_min)
+        return iter(self.pages)
+
+
+def _product(product_id, updated_at):
+    return {'id': product_id, 'title': f'Product {product_id}', 'body_html': '', 'updated_at': updated_at}
+
+
+def _watermark(store_id):
+    db.session.expire_all()
+    return json.loads(db.session.get(Store, store_id).settings)[SYNC_WATERMARK_KEY]
+
+
+def test_watermark_is_sync_start_not_latest_updated_at(app):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    # Product 1 was read on the first page and edited before the last page came back
+    api = _ShopifyAPI([[_product(1, '2024-01-01T00:00:00Z')], [_product(2, '2024-01-01T00:05:00Z')]])
+    before = datetime.now(timezone.utc)
+
+    result = ShopifyProductSync(api, db.session).sync_products_from_shopify(store.id)
+
+    assert result['success']
+    assert Product.query.count() == 2
+    watermark = datetime.fromisoformat(_watermark(store.id).replace('Z', '+00:00'))
+    assert before - timedelta(seconds=30) < watermark <= before
+    assert result['watermark'] == _watermark(store.id)
+
+
+def test_incremental_sync_starts_from_saved_watermark(app):
+    store = Store(shop_domain='demo-store.myshopify.com', access_token='token',
+                  settings=json.dumps({SYNC_WATERMARK_KEY: '2024-01-01T00:00:00Z'}))
+    db.session.add(store)
+    db.session.commit()
+    api = _ShopifyAPI([])
+
+    result = ShopifyProductSync(api, db.session).sync_products_from_shopify(store.id)
+
+    assert result['mode'] == 'incremental'
+    assert api.requested == ['2024-01-01T00:00:00Z']
+    assert _watermark(store.id) > '2024-01-01T00:00:00Z'
@@ -0,0 +1,53 @@
+"""The hot-path queries must be answered from an index, not a table scan"""
+import pytest
+from sqlalchemy import func, select, text
+
+from src.models.seo import Product, SeoTask
+from src.models.user import db
+from src.services.shopify_blog import BlogArticle
+from src.services.task_queue import QUEUED, RUNNING, CANCELLING
+
+
+def _plan(statement) -> list:
+    sql = str(statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def _assert_uses_index(statement, index_name):
+    plan = _plan(statement)
+    assert any(f"INDEX {index_name}" in step for step in plan), plan
+    # A SCAN step without USING ... INDEX reads the whole table
+    assert not any(step.startswith('SCAN') and 'INDEX' not in step for step in plan), plan
+
+
+@pytest.mark.parametrize('statement, index_name', [
+    # Product listing: page mode count/page and keyset mode
+    (select(func.count()).select_from(Product).where(Product.store_id == 1), 'ix_products_store_created'),
+    (select(Product).where(Product.store_id == 1, Product.created_at <= '2024-01-01')
+     .order_by(Product.created_at.desc(), Product.id.desc()).limit(20), 'ix_products_store_created'),
+    # Sync and webhook lookups by Shopify id
+    (select(Product.id).where(Product.store_id == 1, Product.shopify_product_id.in_(['1', '2'])),
+     'uq_products_store_shopify_product'),
+    # Task listing, with and without a type filter
+    (select(SeoTask).order_by(SeoTask.created_at.desc()).limit(10), 'ix_seo_tasks_created'),
+    (select(SeoTask).where(SeoTask.task_type == 'product_sync').order_by(SeoTask.created_at.desc()).limit(10),
+     'ix_seo_tasks_type_created'),
+    # Task queue claim: oldest queued task per store, and running tasks per store
+    (select(SeoTask.store_id, func.min(SeoTask.id)).where(SeoTask.status == QUEUED)
+     .group_by(SeoTask.store_id), 'ix_seo_tasks_status_store'),
+    (select(SeoTask.store_id, func.count()).where(SeoTask.status.in_([RUNNING, CANCELLING]))
+     .group_by(SeoTask.store_id), 'ix_seo_tasks_status_store'),
+    # Article listing, with and without a status filter
+    (select(BlogArticle).where(BlogArticle.store_id == 1).order_by(BlogArticle.created_at.desc()).limit(20),
+     'ix_blog_articles_store_created'),
+    (select(BlogArticle).where(BlogArticle.store_id == 1, BlogArticle.status == 'draft')
+     .order_by(BlogArticle.created_at.desc()).limit(20), 'ix_blog_articles_store_status_created'),
+])
+def test_hot_path_query_uses_index(app, statement, index_name):
+    _assert_uses_index(statement, index_name)
+
+
+def test_listing_order_needs_no_sort(app):
+    statement = (select(Product).where(Product.store_id == 1)
+                 .order_by(Product.created_at.desc(), Product.id.desc()).limit(20))
+    assert not any('TEMP B-TREE' in step for step in _plan(statement))
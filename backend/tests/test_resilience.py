@@ -0,0 +1,19 @@
+from src.services.resilience import RetryPolicy
+
+
+def test_retry_after_is_honoured_in_full():
+    policy = RetryPolicy(base_delay=0.5, max_delay=20)
+
+    assert policy.delay(0, retry_after=12) >= 12
+
+
+def test_retry_after_beyond_budget_gives_up():
+    policy = RetryPolicy(base_delay=0.5, max_delay=20)
+
+    assert policy.delay(0, retry_after=60) is None
+
+
+def test_backoff_is_capped_by_max_delay():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2)
+
+    assert all(0 <= policy.delay(attempt) <= 2 for attempt in range(10))
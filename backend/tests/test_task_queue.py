@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from src.models.seo import SeoTask
+from src.models.user import db
+from src.services.task_queue import COMPLETED, QUEUED, RUNNING, TaskQueue
+
+
+def _running_task(updated_at, attempts=1):
+    task = SeoTask(task_type='bulk', status=RUNNING, input_data='{}', attempts=attempts)
+    db.session.add(task)
+    db.session.commit()
+    db.session.execute(update(SeoTask).where(SeoTask.id == task.id).values(updated_at=updated_at))
+    db.session.commit()
+    return task.id
+
+
+def _status(task_id):
+    db.session.expire_all()
+    return db.session.get(SeoTask, task_id).status
+
+
+def test_heartbeat_keeps_live_tasks_from_being_requeued(app):
+    queue = TaskQueue(stale_after=900)
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    live_id = _running_task(long_ago)
+    orphan_id = _running_task(long_ago)
+    # live_id is being run by this process, e.g. stuck in one long AI call without progress reports
+    queue._running[live_id] = 1
+
+    queue._heartbeat()
+    queue._requeue_stale()
+
+    assert _status(live_id) == RUNNING
+    assert _status(orphan_id) == QUEUED
+
+
+def test_recent_lease_is_not_requeued(app):
+    queue = TaskQueue(stale_after=900)
+    task_id = _running_task(datetime.utcnow() - timedelta(minutes=5))
+
+    queue._requeue_stale()
+
+    assert _status(task_id) == RUNNING
+
+
+def test_result_is_discarded_after_losing_the_lease(app):
+    queue = TaskQueue()
+
+    @queue.register('bulk')
+    def handler(context):
+        # Meanwhile the lease expired and another worker claimed the task again
+        db.session.execute(update(SeoTask).where(SeoTask.id == context.task_id).values(attempts=2))
+        db.session.commit()
+        return {'success': True, 'stale': True}
+
+    task = queue.submit('bulk', {})
+
+    assert queue._run_next()
+    db.session.expire_all()
+    task = db.session.get(SeoTask, task.id)
+    assert task.status == RUNNING
+    assert task.output_data is None
+    assert queue.finished[COMPLETED] == 0
+    assert not queue._running
+
+
+def test_task_runs_to_completion(app):
+    queue = TaskQueue()
+    queue.register('bulk')(lambda context: {'success': True})
+    task = queue.submit('bulk', {})
+
+    assert queue._run_next()
+
+    assert _status(task.id) == COMPLETED
+    assert queue.finished[COMPLETED] == 1
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from src.models.seo import Product, Store, WebhookEvent
+from src.models.user import db
+from src.services.webhook_queue import WebhookQueue
+
+
+@pytest.fixture
+def queue(app):
+    queue = WebhookQueue(batch_interval=60, batch_size=100)
+    # drain() only needs the app; the background thread is not started
+    queue._app = app
+    return queue
+
+
+def _add_store(shop_domain):
+    store = Store(shop_domain=shop_domain, access_token='token')
+    db.session.add(store)
+    db.session.commit()
+    product = Product(store_id=store.id, shopify_product_id='1001', title='Old title', description='Old')
+    db.session.add(product)
+    db.session.commit()
+    return store.id, product.id
+
+
+def _payload(title):
+    return json.dumps({'id': 1001, 'title': title, 'body_html': 'New',
+                       'updated_at': '2024-05-01T10:00:00-04:00'})
+
+
+@pytest.mark.parametrize('saved_domain', ['demo-store', 'demo-store.myshopify.com'])
+def test_webhook_applies_to_store_saved_with_or_without_suffix(app, queue, saved_domain):
+    _, product_id = _add_store(saved_domain)
+
+    assert queue.enqueue('products/update', _payload('New title'), 'wh-1', 'demo-store.myshopify.com')
+    queue.drain()
+
+    assert db.session.get(Product, product_id).title == 'New title'
+    assert WebhookEvent.query.filter_by(webhook_id='wh-1').one().status == 'applied'
+
+
+def test_webhook_for_unknown_shop_is_skipped(app, queue):
+    _, product_id = _add_store('demo-store')
+
+    queue.enqueue('products/update', _payload('Other shop'), 'wh-2', 'other-store.myshopify.com')
+    queue.drain()
+
+    assert db.session.get(Product, product_id).title == 'Old title'
+    assert WebhookEvent.query.filter_by(webhook_id='wh-2').one().status == 'skipped'
+
+
+def test_duplicate_webhook_is_not_enqueued_twice(app, queue):
+    _add_store('demo-store')
+
+    assert queue.enqueue('products/update', _payload('A'), 'wh-3', 'demo-store.myshopify.com')
+    assert not queue.enqueue('products/update', _payload('A'), 'wh-3', 'demo-store.myshopify.com')
+    assert WebhookEvent.query.count() == 1